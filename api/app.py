@@ -1,12 +1,17 @@
 """Точка входа для запуска API."""
-import sqltap
+from functools import lru_cache
+
 from fastapi import Depends, FastAPI
 from fastapi_jwt_auth import AuthJWT
 from starlette.requests import Request
 
-from api.handlers import (address, auth, cards, order, shop, user,
-                          session_process)
+from api.handlers import (address, auth, cards, monitoring, order, shop,
+                          user, session_process)
+from api.compression import CompressionMiddleware
+from api.responses import FastJSONResponse, negotiate_format
+from common import instrumentation
 from common.services import TokensDenyList
+from common.settings import settings
 
 tags_metadata = [{'name': 'orders',
                   'description': 'Запросы для работы с заказами'},
@@ -16,49 +21,90 @@ tags_metadata = [{'name': 'orders',
                   'description': 'Запросы для работы с картами'},
                  {'name': 'profile',
                   'description': 'Запросы для работы с профилем'},
-                 {'name': 'auth', 'description': 'Запросы для авторизации'}]
+                 {'name': 'auth', 'description': 'Запросы для авторизации'},
+                 {'name': 'monitoring',
+                  'description': 'Запросы для мониторинга сервиса'}]
+
+app = FastAPI(openapi_tags=tags_metadata, debug=True,
+              default_response_class=FastJSONResponse)
 
-app = FastAPI(openapi_tags=tags_metadata, debug=True)
+# внутренние маршруты отдают MessagePack по заголовку Accept
+negotiated = [Depends(negotiate_format)]  # noqa: B008
 
 app.include_router(order.router, prefix='/api/v1/orders',
                    tags=['orders'])
 app.include_router(order.internal_router,
-                   prefix='/internal/v1/orders', tags=['orders'])
+                   prefix='/internal/v1/orders', tags=['orders'],
+                   dependencies=negotiated)
 
 app.include_router(address.router, prefix='/api/v1/addresses',
                    tags=['addresses'])
 app.include_router(address.internal_router,
-                   prefix='/internal/v1/addresses', tags=['addresses'])
+                   prefix='/internal/v1/addresses', tags=['addresses'],
+                   dependencies=negotiated)
 
 app.include_router(cards.router, prefix='/api/v1/cards',
                    tags=['cards'])
 app.include_router(cards.internal_router,
-                   prefix='/internal/v1/cards', tags=['cards'])
+                   prefix='/internal/v1/cards', tags=['cards'],
+                   dependencies=negotiated)
 
 app.include_router(shop.internal_router,
                    prefix='/internal/v1/shops', tags=['shops'],
-                   dependencies=[Depends(shop.is_admin)])  # noqa: B008
+                   dependencies=[*negotiated,
+                                 Depends(shop.is_admin)])  # noqa: B008
 
 app.include_router(user.internal_router,
-                   prefix='/internal/v1/profile', tags=['profile'])
+                   prefix='/internal/v1/profile', tags=['profile'],
+                   dependencies=negotiated)
 
 app.include_router(auth.router, prefix='/api/v1/auth', tags=['auth'])
 
 app.include_router(session_process.internal_router,
-                   prefix='/internal/v1/sessions', tags=['sessions'])
-
-
-# включать когда нужно проверить запросы, пока руками
-# @app.middleware('http')
-async def add_sql_tap(request: Request, call_next):
-    """Функция для профилирования запросов к бд."""
-    profiler = sqltap.start()
+                   prefix='/internal/v1/sessions', tags=['sessions'],
+                   dependencies=negotiated)
+
+app.include_router(monitoring.internal_router,
+                   prefix='/internal/v1/monitoring', tags=['monitoring'],
+                   dependencies=[*negotiated,
+                                 Depends(shop.is_admin)])  # noqa: B008
+
+
+@lru_cache(maxsize=None)
+def get_route_path(endpoint) -> str:
+    """Шаблон пути маршрута по его обработчику."""
+    for route in app.routes:
+        if getattr(route, 'endpoint', None) is endpoint:
+            return route.path
+    return 'unmatched'
+
+
+@app.middleware('http')
+async def add_sql_stats(request: Request, call_next):
+    """
+    Сбор статистики запросов к бд.
+
+    Количество запросов и время в БД копятся по маршрутам, время
+    дополнительно отдается в заголовке Server-Timing.
+    """
+    if not settings.sql_stats_enabled:
+        return await call_next(request)
+    stats = instrumentation.start_request()
     response = await call_next(request)
-    sqltap.report(profiler.collect(),
-                  f'reports/{request.url.path.replace("/", "-")}.html')
+    route = get_route_path(request.scope.get('endpoint'))
+    instrumentation.finish_request(f'{request.method} {route}', stats)
+    response.headers['Server-Timing'] = (f'db;dur={stats.db_time * 1000:.1f};'
+                                         f'desc="{stats.queries} queries"')
     return response
 
 
+# добавлен последним, поэтому сжимает уже готовые ответы
+app.add_middleware(CompressionMiddleware,
+                   minimum_size=settings.compression_minimum_size,
+                   gzip_level=settings.compression_gzip_level,
+                   zstd_level=settings.compression_zstd_level)
+
+
 @AuthJWT.token_in_denylist_loader
 def check_if_token_in_denylist(decrypted_token):
     """Функция для проверки отозван ли токен."""
@@ -0,0 +1,151 @@
+"""
+Сжатие ответов по заголовку Accept-Encoding.
+
+zstd используется, если клиент его принимает, иначе gzip. Ответы меньше
+порога, уже сжатые ответы и ответы маршрутов с no_compression отдаются
+как есть. Потоковые ответы сжимаются по частям, каждая часть сразу
+сбрасывается клиенту.
+"""
+import zlib
+from typing import Callable, Optional
+
+import zstandard
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.responses import parse_accept
+
+# в порядке предпочтения
+ENCODINGS = ('zstd', 'gzip')
+
+
+def no_compression(endpoint: Callable) -> Callable:
+    """Отключение сжатия ответов маршрута."""
+    endpoint.compress = False
+    return endpoint
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Сжатие, которое принимает клиент, или None."""
+    accepted = parse_accept(accept_encoding)
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    """Сжатие ответов gzip или zstd."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024,
+                 gzip_level: int = 6, zstd_level: int = 3):
+        """
+        Настройка сжатия.
+
+        :param minimum_size: ответы меньше этого размера в байтах не
+         сжимаются, потоковые ответы сжимаются всегда
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {'gzip': gzip_level, 'zstd': zstd_level}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        """Обработка запроса."""
+        if scope['type'] == 'http':
+            headers = Headers(scope=scope)
+            encoding = choose_encoding(headers.get('accept-encoding', ''))
+            if encoding is not None:
+                responder = CompressionResponder(
+                    self.app, encoding, self.levels[encoding],
+                    self.minimum_size)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class CompressionResponder:
+    """Сжатие одного ответа."""
+
+    def __init__(self, app: ASGIApp, encoding: str, level: int,
+                 minimum_size: int):
+        """Ответ еще не начат, сжатие выбирается по первой части тела."""
+        self.app = app
+        self.encoding = encoding
+        self.level = level
+        self.minimum_size = minimum_size
+        self.scope = None
+        self.send = None
+        self.start = None
+        self.compressor = None
+        self.flush_mode = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        """Вызов приложения с подменой отправки ответа."""
+        self.scope = scope
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    def make_compressor(self):
+        """Потоковый компрессор и режим сброса промежуточных частей."""
+        if self.encoding == 'zstd':
+            compressor = zstandard.ZstdCompressor(level=self.level)
+            return compressor.compressobj(), zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        # 16 + MAX_WBITS - формат gzip с заголовком и контрольной суммой
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED,
+                                      16 + zlib.MAX_WBITS)
+        return compressor, zlib.Z_SYNC_FLUSH
+
+    def should_compress(self, headers: MutableHeaders, message: Message):
+        """Нужно ли сжимать ответ с такими заголовками и первой частью."""
+        endpoint = self.scope.get('endpoint')
+        if not getattr(endpoint, 'compress', True):
+            return False
+        if 'content-encoding' in headers:
+            return False
+        return (message.get('more_body', False)
+                or len(message.get('body', b'')) >= self.minimum_size)
+
+    async def send_compressed(self, message: Message):
+        """Отправка ответа со сжатием тела."""
+        if message['type'] == 'http.response.start':
+            # заголовки отправляются вместе с первой частью тела
+            self.start = message
+            return
+        if message['type'] != 'http.response.body':
+            await self.send(message)
+            return
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            headers = MutableHeaders(raw=start['headers'])
+            if not self.should_compress(headers, message):
+                await self.send(start)
+                await self.send(message)
+                return
+            compressor, self.flush_mode = self.make_compressor()
+            self.compressor = compressor
+            headers['Content-Encoding'] = self.encoding
+            headers.add_vary_header('Accept-Encoding')
+            etag = headers.get('etag')
+            if etag and not etag.startswith('W/'):
+                # сжатое тело отличается по байтам от исходного
+                headers['ETag'] = f'W/{etag}'
+            if more_body:
+                del headers['Content-Length']
+            else:
+                body = compressor.compress(body) + compressor.flush()
+                headers['Content-Length'] = str(len(body))
+                await self.send(start)
+                await self.send({**message, 'body': body})
+                return
+            await self.send(start)
+        elif self.compressor is None:
+            await self.send(message)
+            return
+        body = self.compressor.compress(body)
+        if more_body:
+            body += self.compressor.flush(self.flush_mode)
+        else:
+            body += self.compressor.flush()
+        await self.send({**message, 'body': body})
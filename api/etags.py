@@ -0,0 +1,57 @@
+"""
+Условные GET запросы по ETag.
+
+ETag считается из идентификаторов и версий строк ответа, см.
+models.VersionMixin, поэтому для проверки If-None-Match тело ответа не
+нужно. Если версия у клиента актуальна, отдается 304 без тела, а сам ответ
+не строится.
+
+В ETag входит и формат ответа, выбранный negotiate_format: JSON и
+MessagePack одного ресурса - разные представления.
+"""
+import hashlib
+from typing import Callable
+
+from fastapi import Request, status
+from starlette.responses import Response
+
+from api.responses import response_format
+
+# клиент хранит ответ, но перед использованием проверяет его по ETag
+CACHE_CONTROL = 'private, no-cache'
+
+
+def make_etag(*parts) -> str:
+    """Сильный ETag из формата ответа, вида ресурса и версий строк."""
+    digest = hashlib.blake2b(repr((response_format.get(), *parts)).encode(),
+                             digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+
+def is_fresh(request: Request, etag: str) -> bool:
+    """Совпадает ли ETag с одним из If-None-Match запроса."""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    tags = {tag.strip() for tag in header.split(',')}
+    # для If-None-Match слабые ETag сравниваются как сильные
+    return '*' in tags or etag in {tag[2:] if tag.startswith('W/') else tag
+                                   for tag in tags}
+
+
+def conditional(request: Request, etag: str,
+                render: Callable[[], Response]) -> Response:
+    """
+    Ответ на условный GET.
+
+    :param render: построение полного ответа, вызывается только если у
+     клиента нет актуальной версии
+    :return: 304 без тела или ответ render() с заголовком ETag
+    """
+    headers = {'ETag': etag, 'Cache-Control': CACHE_CONTROL}
+    if is_fresh(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                        headers=headers)
+    response = render()
+    response.headers.update(headers)
+    return response
@@ -3,41 +3,71 @@ from __future__ import annotations
 
 from typing import List
 
-from fastapi import APIRouter, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Request, status
+from sqlalchemy import select
 
+from api.etags import conditional, make_etag
 from api.handlers.common import get_user
+from api.responses import FastJSONResponse
 from common import schemas
-from common.database import DataBase, get_db
+from common.database import DataBase, columns, get_db
+from common.exceptions import AddressException
 from common.models import Address, User
+from common.serializers import serialize_address
+from common.text import get_text as _
 
 router = APIRouter()
 internal_router = APIRouter()
 
 
-def check_default_address(address, user: User):
-    """Изменение адреса по умолчанию."""
+def check_default_address(address, user: User, db: DataBase):
+    """
+    Изменение адреса по умолчанию.
+
+    Меняется указатель у пользователя и флаг у прежнего адреса по первичному
+    ключу, без загрузки всех адресов.
+    """
     if address.is_default:
-        # todo сделать bulk_update
-        for addr in user.addresses:
-            addr.is_default = False
-        address.is_default = True
+        user.set_default_address(address, db)
+    elif address.id is not None and user.default_address_id == address.id:
+        user.default_address = None
+
+
+def check_default_address_row(row, user: User, db: DataBase):
+    """
+    Изменение адреса по умолчанию по строке из UPDATE ... RETURNING.
+
+    Объекта адреса в сессии нет, поэтому меняется сам указатель. Если флаг
+    не менялся, указатель уже согласован и запросов не будет.
+    """
+    if row.is_default and user.default_address_id != row.id:
+        if user.default_address_id is not None:
+            db.bulk_update(Address, {'is_default': False},
+                           Address.id == user.default_address_id)
+        user.default_address_id = row.id
+    elif not row.is_default and user.default_address_id == row.id:
+        user.default_address_id = None
 
 
 @router.get('/', tags=['addresses'], summary='Получение списка адресов',
             response_model=List[schemas.Address])
-def get_addresses(user=Depends(get_user)):  # noqa: B008
+def get_addresses(request: Request, user=Depends(get_user),  # noqa: B008
+                  db: DataBase = Depends(get_db)):  # noqa: B008
     """
     Получение списка адресов с пользователем.
 
     Первым вернется дефолтный адрес пользователя, который необходимо
-     использовать для заказа.
+     использовать для заказа. ETag считается по версиям адресов из того же
+     запроса.
     """
-    addresses = []
-    for address in user.addresses:
-        addresses.append(schemas.Address.from_orm(address).dict())
-    addresses = sorted(addresses, key=lambda el: not el['is_default'])
-    return JSONResponse(addresses, status_code=status.HTTP_200_OK)
+    addresses = [address._asdict() for address in db.select_rows(
+        select(*columns(Address, schemas.Address.__fields__), Address.version)
+        .where(Address.user_id == user.id, Address.deleted_at.is_(None))
+        .order_by(Address.is_default.desc().nullslast(), Address.id))]
+    etag = make_etag('addresses', [(address['id'], address.pop('version'))
+                                   for address in addresses])
+    return conditional(request, etag, lambda: FastJSONResponse(
+        addresses, status_code=status.HTTP_200_OK))
 
 
 @router.post('/', tags=['addresses'], summary='Создание адреса',
@@ -51,11 +81,11 @@ def create_address(address_data: schemas.AddressCreate,
     :return:
     """
     address = Address(**address_data.dict(), user=user)
-    check_default_address(address, user)
+    check_default_address(address, user, db)
     db.add(address)
     db.save()
-    address = schemas.Address.from_orm(address)
-    return JSONResponse(address.dict(), status_code=status.HTTP_200_OK)
+    return FastJSONResponse(serialize_address(address),
+                            status_code=status.HTTP_200_OK)
 
 
 @internal_router.put('/{address_id}', tags=['addresses'],
@@ -67,19 +97,24 @@ def update_address(address_id, data: schemas.AddressUpdate,
     """
     Обновление адреса доставки.
 
+    Один запрос UPDATE ... RETURNING проверяет владельца и возвращает
+    данные для ответа, без предварительной загрузки адреса.
+
     :param db:
     :param data:
     :param user:
     :param address_id: идентификатор адреса для обновления
     :return:
     """
-    address = user.get_address(address_id)
-    address.update(data)
-    check_default_address(address, user)
+    address = db.update_returning(
+        Address, data.dict(exclude_none=True), schemas.Address.__fields__,
+        Address.id == address_id, Address.user_id == user.id,
+        Address.deleted_at.is_(None))
+    if address is None:
+        raise AddressException(_('address_not_found'), 404)
+    check_default_address_row(address, user, db)
     db.save()
-    db.refresh(address)
-    return JSONResponse(schemas.Address.from_orm(address).dict(),
-                        status_code=status.HTTP_200_OK)
+    return FastJSONResponse(address._asdict(), status_code=status.HTTP_200_OK)
 
 
 @internal_router.delete('/{address_id}', tags=['addresses'],
@@ -98,5 +133,7 @@ def delete_address(address_id, user: User = Depends(get_user),  # noqa: B008
     :return:
     """
     address = user.get_address(address_id)
-    db.delete(Address, address)
-    return JSONResponse({}, status_code=status.HTTP_200_OK)
+    if user.default_address_id == address.id:
+        user.default_address = None
+    db.soft_delete(Address, address)
+    return FastJSONResponse({}, status_code=status.HTTP_200_OK)
@@ -2,9 +2,10 @@
 import secrets
 
 from fastapi import APIRouter, Depends, status, Header, Request
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import Response
 from fastapi_jwt_auth import AuthJWT
 
+from api.responses import FastJSONResponse
 from common.database import get_db
 from common.models import User, ActiveTokens
 from common.schemas import LoginForm, SendSmsForm
@@ -38,7 +39,7 @@ def login(data: LoginForm, request: Request,
     res = {'access_token': access_token, 'agent': agent, 'platform': platform}
     if settings.debug:
         res['user_id'] = user.id.hex
-    response = JSONResponse(res, status_code=status.HTTP_200_OK)
+    response = FastJSONResponse(res, status_code=status.HTTP_200_OK)
     jwt_service.set_access_cookies(access_token, response,
                                    settings.auth_access_token_lifetime)
     jwt_service.set_refresh_cookies(refresh_token, response,
@@ -52,24 +53,25 @@ def refresh(request: Request, jwt_service: AuthJWT = Depends(),  # noqa: B008
     """
     Обновляет jwt токен пользователя.
 
-    Создает новую пару access и refresh токенов.
+    Создает новую пару access и refresh токенов, сессия обновляется на
+    месте.
     :return:
     """
     jwt_service.jwt_refresh_token_required()
 
-    phone = jwt_service.get_jwt_subject()
-    user, created = db.get_or_create(User, phone=phone)
+    user, created = db.get_or_create(User, id=jwt_service.get_jwt_subject())
 
-    TokensDenyList().add_token(jwt_service.get_raw_jwt()['jti'])
+    refresh_id = jwt_service.get_raw_jwt()['jti']
+    TokensDenyList().add_token(refresh_id)
 
     access_token = jwt_service.create_access_token(subject=user.id.hex)
     refresh_token = jwt_service.create_refresh_token(subject=user.id.hex)
 
     create_active_session(access_token, refresh_token, user, user_agent,
-                          request, jwt_service, db)
+                          request, jwt_service, db, refresh_id=refresh_id)
 
-    response = JSONResponse({'access_token': access_token},
-                            status_code=status.HTTP_200_OK)
+    response = FastJSONResponse({'access_token': access_token},
+                                status_code=status.HTTP_200_OK)
     jwt_service.set_access_cookies(access_token, response)
     jwt_service.set_refresh_cookies(refresh_token, response)
     return response
@@ -84,7 +86,7 @@ def logout(jwt_service: AuthJWT = Depends()):  # noqa: B008
     """
     jwt_service.jwt_required()
 
-    res = JSONResponse({}, status_code=status.HTTP_200_OK)
+    res = FastJSONResponse({}, status_code=status.HTTP_200_OK)
     __remove_cookie(jwt_service, res, jwt_service._access_cookie_key,
                     jwt_service._access_cookie_path)
 
@@ -108,7 +110,7 @@ def send_sms(data: SendSmsForm):
         code = 100000 + secrets.randbelow(899999)
 
     phone_service.set_phone_code(str(code))
-    return JSONResponse({}, status_code=status.HTTP_200_OK)
+    return FastJSONResponse({}, status_code=status.HTTP_200_OK)
 
 
 def __remove_cookie(jwt_service: AuthJWT, response: Response, cookie_key: str,
@@ -134,10 +136,15 @@ def __remove_cookie(jwt_service: AuthJWT, response: Response, cookie_key: str,
 def create_active_session(access_token: str, refresh_token: str, user: User,
                           user_agent: str, request: Request,
                           jwt_service: AuthJWT,
-                          db=Depends(get_db)):  # noqa: B008
+                          db=Depends(get_db),  # noqa: B008
+                          refresh_id: str = None):
     """
     Вспомогательная функция для создания объектов активной сессии.
 
+    При обновлении токенов строка сессии с прежним refresh токеном
+    обновляется одним запросом вместо вставки новой, поэтому таблица
+    растет только от входов, а истекшие строки удаляет common.retention.
+
     :param access_token: access токен
     :param refresh_token: refresh токен
     :param user: пользователь сессии
@@ -145,19 +152,28 @@ def create_active_session(access_token: str, refresh_token: str, user: User,
     :param request: объект запроса
     :param jwt_service: сервис от библиотеки JWT
     :param db: связь с БД
+    :param refresh_id: jti прежнего refresh токена при обновлении
     :return: возвращает объект бд активной сессии
     """
     agent, platform, location = user_agent_parser(user_agent, request)
     jti_access = jwt_service.get_raw_jwt(access_token)['jti']
     access_expired_date = jwt_service.get_raw_jwt(access_token)['exp']
     jti_refresh = jwt_service.get_raw_jwt(refresh_token)['jti']
-    refresh_expired_date = jwt_service.get_raw_jwt(access_token)['exp']
+    refresh_expired_date = jwt_service.get_raw_jwt(refresh_token)['exp']
     token_data = {'access_id': jti_access,
                   'access_expired_date': access_expired_date,
                   'refresh_id': jti_refresh,
                   'refresh_expired_date': refresh_expired_date,
                   'user_agent': user_agent, 'user_id': user.id.hex,
                   'region': location, 'agent': agent, 'platform': platform}
+    if refresh_id is not None:
+        active_token = db.update_returning(
+            ActiveTokens, token_data, ['id'],
+            ActiveTokens.refresh_id == refresh_id,
+            ActiveTokens.user_id == user.id)
+        if active_token is not None:
+            db.save()
+            return active_token
     active_token = ActiveTokens(**token_data)
     db.add(active_token)
     db.save()
@@ -3,34 +3,63 @@ from __future__ import annotations
 
 from typing import List
 
-from fastapi import APIRouter, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Request, status
+from sqlalchemy import select
 
+from api.etags import conditional, make_etag
 from api.handlers.common import get_user
+from api.responses import FastJSONResponse
 from common import schemas
-from common.database import DataBase, get_db
+from common.database import DataBase, columns, get_db
+from common.exceptions import CardException
 from common.models import Card, User
+from common.serializers import serialize_card
+from common.text import get_text as _
 
 router = APIRouter()
 internal_router = APIRouter()
 
 
+def check_default_card(card, user: User, db: DataBase):
+    """Изменение карты по умолчанию аналогично адресам."""
+    if card.is_default:
+        user.set_default_card(card, db)
+    elif card.id is not None and user.default_card_id == card.id:
+        user.default_card = None
+
+
+def check_default_card_row(row, user: User, db: DataBase):
+    """Изменение карты по умолчанию по строке, аналогично адресам."""
+    if row.is_default and user.default_card_id != row.id:
+        if user.default_card_id is not None:
+            db.bulk_update(Card, {'is_default': False},
+                           Card.id == user.default_card_id)
+        user.default_card_id = row.id
+    elif not row.is_default and user.default_card_id == row.id:
+        user.default_card_id = None
+
+
 @router.get('/', tags=['cards'], summary='Получение списка карт',
             response_model=List[schemas.Card])
-def get_cards(user: User = Depends(get_user)):  # noqa: B008
+def get_cards(request: Request, user: User = Depends(get_user),  # noqa: B008
+              db: DataBase = Depends(get_db)):  # noqa: B008
     """
     Получение списка карт пользователя.
 
-    Первой возвращается карта по умолчанию у пользователя.
+    Первой возвращается карта по умолчанию у пользователя. ETag считается
+    по версиям карт из того же запроса.
     :param user: связь с пользователем
+    :param db: связь с БД
     :return:
     """
-    cards = []
-    for card in user.cards:
-        card.append(schemas.Card.from_orm(card).dict())
-    cards = sorted(cards, key=lambda el: not el['is_default'])
-
-    return JSONResponse(cards, status_code=status.HTTP_200_OK)
+    cards = [card._asdict() for card in db.select_rows(
+        select(*columns(Card, schemas.Card.__fields__), Card.version)
+        .where(Card.user_id == user.id, Card.deleted_at.is_(None))
+        .order_by(Card.is_default.desc().nullslast(), Card.id))]
+    etag = make_etag('cards', [(card['id'], card.pop('version'))
+                               for card in cards])
+    return conditional(request, etag, lambda: FastJSONResponse(
+        cards, status_code=status.HTTP_200_OK))
 
 
 @router.post('/', tags=['cards'], summary='Создание карты',
@@ -47,10 +76,11 @@ def create_card(card_data: schemas.CardCreate,
     :return:
     """
     card = Card(**card_data.dict(), user=user)
+    check_default_card(card, user, db)
     db.add(card)
     db.save()
-    card = schemas.Card.from_orm(card)
-    return JSONResponse(card.dict(), status_code=status.HTTP_200_OK)
+    return FastJSONResponse(serialize_card(card),
+                            status_code=status.HTTP_200_OK)
 
 
 @internal_router.put('/{card_id}', tags=['cards'], summary='Обновление карты',
@@ -61,18 +91,22 @@ def update_card(card_id, data: schemas.CardCreate,
     """
     Обновление карты пользователя.
 
+    Владелец проверяется в том же запросе UPDATE ... RETURNING.
     :param db: связь с БД
     :param data: данные модели
     :param user: связь с пользователем
     :param card_id: идентификатор карты для обновления
     :return:
     """
-    card = user.get_card(card_id)
-    card.update(data)
+    card = db.update_returning(
+        Card, data.dict(exclude_none=True), schemas.Card.__fields__,
+        Card.id == card_id, Card.user_id == user.id,
+        Card.deleted_at.is_(None))
+    if card is None:
+        raise CardException(_('card_not_found'), 404)
+    check_default_card_row(card, user, db)
     db.save()
-    db.refresh(card)
-    return JSONResponse(schemas.Card.from_orm(card).dict(),
-                        status_code=status.HTTP_200_OK)
+    return FastJSONResponse(card._asdict(), status_code=status.HTTP_200_OK)
 
 
 @internal_router.delete('/{card_id}', tags=['cards'],
@@ -90,5 +124,7 @@ def delete_card(card_id: int, user: User = Depends(get_user),  # noqa: B008
     :return:
     """
     card = user.get_card(card_id)
-    db.delete(Card, card)
-    return JSONResponse({}, status_code=status.HTTP_200_OK)
+    if user.default_card_id == card.id:
+        user.default_card = None
+    db.soft_delete(Card, card)
+    return FastJSONResponse({}, status_code=status.HTTP_200_OK)
@@ -2,14 +2,32 @@
 from fastapi import Depends
 from fastapi_jwt_auth import AuthJWT
 
-from common.database import get_db
-from common.models import User
+from common.database import get_async_db, get_db
+from common.models import USER_BY_ID, User
 
 
 def get_user(jwt_service: AuthJWT = Depends(),  # noqa: B008
              db=Depends(get_db)):  # noqa: B008
-    """Метод получения текущего пользователя."""
+    """
+    Метод получения текущего пользователя.
+
+    Пользователь ищется заранее построенным запросом, создание и повторная
+    проверка в мастере нужны только если его еще нет.
+    """
+    jwt_service.jwt_required()
+    user_id = jwt_service.get_jwt_subject()
+    user = db.get_one(USER_BY_ID, user_id=user_id)
+    if user is None:
+        user, created = db.get_or_create(User, id=user_id)
+    return user
+
+
+async def get_user_async(jwt_service: AuthJWT = Depends(),  # noqa: B008
+                         db=Depends(get_async_db)):  # noqa: B008
+    """Метод получения текущего пользователя для async обработчиков."""
     jwt_service.jwt_required()
     user_id = jwt_service.get_jwt_subject()
-    user, created = db.get_or_create(User, id=user_id)
+    user = await db.get_one(USER_BY_ID, user_id=user_id)
+    if user is None:
+        user, created = await db.get_or_create(User, id=user_id)
     return user
@@ -2,9 +2,9 @@
 from fastapi import Request, status
 from fastapi.exceptions import RequestValidationError
 from fastapi_jwt_auth.exceptions import AuthJWTException
-from starlette.responses import JSONResponse
 
 from api.app import app
+from api.responses import FastJSONResponse
 from common.exceptions import ModelException
 from common.services import PhoneException
 from common.text import get_text as _
@@ -16,23 +16,23 @@ def auth_jwt_exception_handler(request: Request, exc: AuthJWTException):
     error = {'error': _('auth_required')}
     if app.debug:
         error['detail'] = exc.message
-    return JSONResponse(error, status_code=status.HTTP_401_UNAUTHORIZED)
+    return FastJSONResponse(error, status_code=status.HTTP_401_UNAUTHORIZED)
 
 
 @app.exception_handler(PhoneException)
 def phone_exception_handler(request: Request, exc: PhoneException):
     """Обработчик ошибок авторизации."""
-    return JSONResponse({'error': str(exc)},
-                        status_code=status.HTTP_400_BAD_REQUEST)
+    return FastJSONResponse({'error': str(exc)},
+                            status_code=status.HTTP_400_BAD_REQUEST)
 
 
 @app.exception_handler(ModelException)
 def exception_handler(request: Request, exc: ModelException):
     """Обработчик ошибок работы с адресами, картами, магазинами доставки."""
-    return JSONResponse({'error': exc.message}, status_code=exc.status)
+    return FastJSONResponse({'error': exc.message}, status_code=exc.status)
 
 
 @app.exception_handler(RequestValidationError)
 def validation_handler(request: Request, exc: RequestValidationError):
     """Обработчик ошибок валидации входных данных в запросах."""
-    return JSONResponse({'detail': exc.errors()}, status_code=400)
+    return FastJSONResponse({'detail': exc.errors()}, status_code=400)
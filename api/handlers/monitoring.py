@@ -0,0 +1,48 @@
+"""Обработчики запросов для мониторинга сервиса."""
+from fastapi import APIRouter, status
+
+from api.responses import FastJSONResponse
+from common import retention
+from common.database import get_pool_stats, replicas
+from common.instrumentation import get_route_stats
+
+internal_router = APIRouter()
+
+
+@internal_router.get('/db/pool', tags=['monitoring'],
+                     summary='Статистика пула соединений с БД')
+def get_db_pool():
+    """
+    Получение статистики пула соединений.
+
+    Показывает сколько соединений занято запросами, свободно в пуле и
+    открыто сверх размера пула, для реплик еще и последнее отставание.
+    """
+    stats = get_pool_stats()
+    stats['replicas'] = replicas.stats()
+    return FastJSONResponse(stats, status_code=status.HTTP_200_OK)
+
+
+@internal_router.get('/sql', tags=['monitoring'],
+                     summary='Статистика запросов к БД по маршрутам')
+def get_sql_stats():
+    """
+    Получение статистики запросов к БД.
+
+    Для каждого маршрута количество запросов к БД, время в БД, самый
+    медленный запрос и число запросов API с признаками N+1.
+    """
+    return FastJSONResponse(get_route_stats(), status_code=status.HTTP_200_OK)
+
+
+@internal_router.get('/retention/sessions', tags=['monitoring'],
+                     summary='Статистика очистки истекших сессий')
+def get_sessions_retention():
+    """
+    Получение статистики очистки сессий.
+
+    Сколько строк удалено последним запуском и всего, время запуска,
+    текущий размер таблицы active_tokens и оценка количества строк.
+    """
+    return FastJSONResponse(retention.get_stats(),
+                            status_code=status.HTTP_200_OK)
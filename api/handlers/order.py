@@ -1,17 +1,33 @@
 """Обработчики запросов для заказов."""
-import json
-from datetime import datetime
+import csv
+import heapq
+import io
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import defaultdict
+from datetime import date, datetime
+from itertools import islice
 from math import ceil
+from operator import attrgetter
 from typing import List
 
-from fastapi import APIRouter, Depends, status
-from fastapi.responses import JSONResponse
+import orjson
+from fastapi import APIRouter, Depends, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import cast, func, null, select, tuple_, union_all
+from sqlalchemy.dialects.postgresql import JSONB
 
+from api.etags import conditional, make_etag
 from api.handlers.common import get_user
+from api.responses import FastJSONResponse
 from common import schemas
-from common.database import DataBase, get_db
+from common.database import DataBase, columns, get_db, shards
 from common.exceptions import ModelException, NotFoundException
-from common.models import Order, User, OrderStatuses
+from common.models import (ORDER_VERSION, SHOP_VERSION, ArchivedOrder,
+                           Item, Order, OrderStatuses, Shop, User)
+from common.numbering import order_numbers
+from common.serializers import serialize_order, to_date
+from common.settings import settings
+from common.text import get_text as _
 from worker import tasks
 
 router = APIRouter()
@@ -31,48 +47,75 @@ def create_order(order_data: schemas.OrderCreate,  # noqa: B008
     Создание заказа.
 
     Создание заказа в статусе "Новый". Спустя 5 минут перейдет в статус
-    "Создан" и пойдет в работу.
+    "Создан" и пойдет в работу. Номер заказа в магазине выдается сервисом
+    из зарезервированного блока, поэтому создание это один INSERT.
     :param db:
     :param user:
     :param order_data: данные для создания заказа
     :return:
     """
-    order_data_dict = order_data.dict()
-    order_data_dict['user_id'] = user.id.hex
-    order, created = db.get_or_create(Order, number=order_data_dict['number'])
-    order_data_dict['id'] = order.id
-    tasks.create_order.delay(order_data_dict)
-    response = {'order_id': order.id}
     try:
         user.get_default_address()
         user.get_default_card()
     except NotFoundException as e:
-        response['error'] = str(e)
-        return JSONResponse(response, status_code=status.HTTP_400_BAD_REQUEST)
-    return JSONResponse(response, status_code=status.HTTP_201_CREATED)
+        return FastJSONResponse({'error': str(e)},
+                                status_code=status.HTTP_400_BAD_REQUEST)
+    # последовательность номеров создается только для существующего магазина
+    shop = db.get_by_id(Shop, id=order_data.shop_id)
+    if shop is None:
+        return FastJSONResponse({'error': _('shop_not_found')},
+                                status_code=status.HTTP_400_BAD_REQUEST)
+    order = Order(number=order_numbers.allocate(shop.id),
+                  shop_id=shop.id, user_id=user.id)
+    db.use_shard(shards.get(shop.id, shard=shop.shard))
+    db.add(order)
+    db.save()
+    order_data_dict = order_data.dict()
+    order_data_dict['user_id'] = user.id.hex
+    order_data_dict['id'] = order.id
+    tasks.create_order.delay(order_data_dict)
+    return FastJSONResponse({'order_id': order.id, 'number': order.number},
+                            status_code=status.HTTP_201_CREATED)
 
 
 @router.get('/{order_id}', tags=['orders'],
             summary='Получение детальной информации о заказе',
             response_model=schemas.Order)
-def get_order(order_id: int, user=Depends(get_user)):  # noqa: B008
+def get_order(order_id: int, request: Request,
+              user=Depends(get_user),  # noqa: B008
+              db: DataBase = Depends(get_db)):  # noqa: B008
     """
     Получение детальной информации о заказе.
 
+    Сначала читаются только версии заказа и его магазина, если у клиента
+    они актуальны, заказ с товарами и магазином не загружается.
     :param user:
     :param order_id: идентификатор заказа в нашей системе
     :return:
     """
-    order = user.get_order(order_id)
-    return JSONResponse(json.loads(schemas.Order.from_orm(order).json()),
-                        status_code=status.HTTP_200_OK)
+    db.use_shard_of(Order, order_id, also=[ArchivedOrder])
+    order = db.get_row(ORDER_VERSION, user_id=user.id, order_id=order_id)
+    if order is None:
+        raise ModelException(_('order_not_found'), 404)
+    # магазин входит в ответ, поэтому его правка тоже меняет ETag
+    shop_version = db.get_one(SHOP_VERSION, shop_id=order.shop_id)
+
+    def render():
+        order = user.get_order(order_id, db, profile='detail')
+        return FastJSONResponse(serialize_order(order),
+                                status_code=status.HTTP_200_OK)
+
+    return conditional(request, make_etag('order', order_id, order.version,
+                                          order.shop_id, shop_version),
+                       render)
 
 
 @router.put('/{order_id}', tags=['orders'],
             summary='Обновление информации о заказе',
             response_model=List[schemas.Order])
 def update_order(order_id: int, data: schemas.OrderUpdate,
-                 user: User = Depends(get_user)):  # noqa: B008
+                 user: User = Depends(get_user),  # noqa: B008
+                 db: DataBase = Depends(get_db)):  # noqa: B008
     """
     Обновление заказа.
 
@@ -83,40 +126,289 @@ def update_order(order_id: int, data: schemas.OrderUpdate,
     :param data: данные модели
     :return:
     """
-    order = Order.get(order_id)
+    db.use_shard_of(Order, order_id)
+    order = Order.get(order_id, db)
     if not order.status == OrderStatuses.NEW:
         raise ModelException('Изменения невозможны', 400)
     user.get_address(data.dict()['address_id'])
     user.get_card(data.dict()['card_id'])
     tasks.update_order.delay(order_id, data.dict())
-    return JSONResponse({}, status_code=status.HTTP_200_OK)
+    return FastJSONResponse({}, status_code=status.HTTP_200_OK)
+
+
+def encode_cursor(order) -> str:
+    """Курсор на позицию после заказа в списке."""
+    position = f'{order.date.isoformat()}|{order.id}'
+    return urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Разбор курсора в пару (дата, идентификатор) заказа."""
+    try:
+        order_date, order_id = urlsafe_b64decode(cursor).decode().split('|')
+        return datetime.fromisoformat(order_date), int(order_id)
+    except ValueError:
+        raise ModelException(_('invalid_cursor'), 400)
+
+
+def count_orders(where, db: DataBase, *extra) -> int:
+    """Количество заказов по условиям во всех шардах вместе с архивом."""
+    return db.scatter_count(select(func.count())
+                            .select_from(order_rows(where, *extra)))
+
+
+# поля заказа без вложенных магазина и товаров для быстрого чтения
+ORDER_FIELDS = [name for name in schemas.Order.__fields__
+                if name not in ('shop', 'items')]
+ITEM_COLUMNS = list(schemas.Item.__fields__)
+ITEM_FIELDS = [*ITEM_COLUMNS, 'order_id']
+encode_order_date = schemas.Order.__config__.json_encoders[date]
+
+
+def encode_date(value):
+    """Дата заказа как в schemas.Order: без времени дня, None как есть."""
+    return None if value is None else encode_order_date(to_date(value))
+
+
+def parse_period(date_from: str = None, date_to: str = None) -> tuple:
+    """Границы периода из дат дд.мм.гггг, включая оба дня целиком."""
+    if date_from:
+        date_from = datetime.strptime(date_from, '%d.%m.%Y')
+        date_from = date_from.replace(hour=0, minute=0, second=0)
+    if date_to:
+        date_to = datetime.strptime(date_to, '%d.%m.%Y')
+        date_to = date_to.replace(hour=23, minute=59, second=59)
+    return date_from, date_to
+
+
+def user_orders(user: User, date_from: datetime = None,
+                date_to: datetime = None):
+    """Условия списка заказов пользователя для Order или ArchivedOrder."""
+    def where(model) -> list:
+        conditions = [model.user_id == user.id]
+        if date_from:
+            conditions.append(model.date >= date_from)
+        if date_to:
+            conditions.append(model.date <= date_to)
+        return conditions
+    return where
+
+
+def is_processed(model):
+    """Условие что заказ обработан воркером и у него есть дата."""
+    return model.date.isnot(None)
+
+
+def order_rows(where, *extra):
+    """
+    Заказы из orders и архива одним подзапросом UNION ALL.
+
+    Условия where(model) и extra(model) применяются к каждой части,
+    PostgreSQL проталкивает в части и внешние условия с сортировкой, поэтому
+    обе читаются по своим индексам. Товары архивных заказов в archived_items.
+    """
+    return union_all(*(
+        select(*columns(model, ORDER_FIELDS), items.label('archived_items'))
+        .where(*where(model), *(condition(model) for condition in extra))
+        for model, items in ((Order, cast(null(), JSONB)),
+                             (ArchivedOrder, ArchivedOrder.items)))
+    ).subquery('user_orders')
+
+
+def items_query(orders: list):
+    """Запрос товаров неархивных заказов из orders, None если их нет."""
+    live = [order.id for order in orders if order.archived_items is None]
+    if not live:
+        return None
+    return (select(*columns(Item, ITEM_FIELDS))
+            .where(Item.order_id.in_(live)).order_by(Item.id))
+
+
+def group_items(orders: list, rows) -> dict:
+    """Товары по заказам из строк items и из архивных заказов."""
+    items = defaultdict(list)
+    for row in rows:
+        item = row._asdict()
+        items[item.pop('order_id')].append(item)
+    for order in orders:
+        for item in order.archived_items or ():
+            items[order.id].append({name: item[name]
+                                    for name in schemas.Item.__fields__})
+    return items
+
+
+def get_orders_data(orders: list, db: DataBase) -> list:
+    """
+    Заказы из строк быстрого чтения в формате schemas.Order.
+
+    Магазины и товары всей страницы выбираются двумя запросами, товары
+    из всех шардов, так как идентификаторы заказов в них не пересекаются.
+    Товары архивных заказов уже есть в строке.
+    """
+    if not orders:
+        return []
+    shops = {shop.id: shop._asdict() for shop in db.select_rows(
+        select(*columns(Shop, schemas.Shop.__fields__))
+        .where(Shop.id.in_({order.shop_id for order in orders})))}
+    query = items_query(orders)
+    items = group_items(orders, () if query is None else db.scatter_rows(
+        query, key=attrgetter('id')))
+    return [dict(zip(ORDER_FIELDS, order),
+                 date=encode_date(order.date),
+                 shop=shops.get(order.shop_id), items=items[order.id])
+            for order in orders]
 
 
 @internal_router.get('/', tags=['orders'], summary='Получение списка заказов',
                      response_model=List[schemas.Order])
 def get_orders(page: int = 1, per_page: int = 10,
                date_from: str = None, date_to: str = None,
-               user=Depends(get_user)):  # noqa: B008
+               cursor: str = None, with_count: bool = False,
+               user=Depends(get_user),  # noqa: B008
+               db: DataBase = Depends(get_db)):  # noqa: B008
     """
     Получить список заказов пользователя.
 
+    Постраничный режим (page, per_page) считает общее количество заказов.
+    Если передан cursor (пустой для первой страницы), заказы отдаются от
+    новых к старым по индексу без OFFSET, в ответе next_cursor для следующей
+    страницы, общее количество только при with_count. Заказы пользователя
+    собираются со всех шардов вместе с архивом.
+
     :return:
     """
-    orders = user.orders
-    if date_from:
-        date_from = datetime.strptime(date_from, '%d.%m.%Y')
-        date_from = date_from.replace(hour=0, minute=0, second=0)
-        orders = orders.filter(Order.date >= date_from)
-    if date_to:
-        date_to = datetime.strptime(date_to, '%d.%m.%Y')
-        date_to = date_to.replace(hour=23, minute=59, second=59)
-        orders = orders.filter(Order.date <= date_to)
-    all_count = orders.count()
+    date_from, date_to = parse_period(date_from, date_to)
+    where = user_orders(user, date_from, date_to)
+    if cursor is not None:
+        return get_orders_by_cursor(where, bool(date_from or date_to),
+                                    cursor, per_page, with_count, user, db)
+    all_count = count_orders(where, db)
     pages = ceil(all_count / per_page)
-    orders = orders.offset((page - 1) * per_page).limit(per_page)
-    response = {'has_orders': user.orders.count() > 0, 'count': all_count,
-                'page': page, 'pages': pages, 'orders': []}
-    for order in orders:
-        order_data = schemas.Order.from_orm(order)
-        response['orders'].append(json.loads(order_data.json()))
-    return JSONResponse(response, status_code=status.HTTP_200_OK)
+    orders = order_rows(where)
+    orders = db.scatter_page(
+        select(orders).order_by(orders.c.id), key=attrgetter('id'),
+        offset=(page - 1) * per_page, limit=per_page)
+    has_orders = all_count > 0
+    if not has_orders and (date_from or date_to):
+        has_orders = count_orders(user_orders(user), db) > 0
+    response = {'has_orders': has_orders, 'count': all_count,
+                'page': page, 'pages': pages,
+                'orders': get_orders_data(orders, db)}
+    return FastJSONResponse(response, status_code=status.HTTP_200_OK)
+
+
+def get_orders_by_cursor(where, filtered: bool, cursor: str, per_page: int,
+                         with_count: bool, user: User, db: DataBase):
+    """
+    Страница списка заказов по курсору.
+
+    Заказы без даты еще не обработаны воркером и в список не попадают.
+    Выбирается на один заказ больше, чтобы понять есть ли следующая страница.
+    """
+    response = {}
+    if with_count:
+        response['count'] = count_orders(where, db, is_processed)
+    orders = order_rows(where, is_processed)
+    conditions = []
+    if cursor:
+        conditions.append(tuple_(orders.c.date, orders.c.id)
+                          < decode_cursor(cursor))
+    orders = db.scatter_rows(
+        select(orders).where(*conditions)
+        .order_by(orders.c.date.desc(), orders.c.id.desc())
+        .limit(per_page + 1),
+        key=attrgetter('date', 'id'), reverse=True)[:per_page + 1]
+    next_cursor = None
+    if len(orders) > per_page:
+        orders = orders[:per_page]
+        next_cursor = encode_cursor(orders[-1])
+    if not cursor:
+        response['has_orders'] = bool(orders) or (
+            filtered and count_orders(user_orders(user), db) > 0)
+    response.update(next_cursor=next_cursor, per_page=per_page,
+                    orders=get_orders_data(orders, db))
+    return FastJSONResponse(response, status_code=status.HTTP_200_OK)
+
+
+def stream_shard_orders(shard: int, where):
+    """
+    Заказы шарда от старых к новым вместе с товарами.
+
+    Заказы читаются серверным курсором пачками по order_export_chunk_size,
+    товары каждой пачки одним запросом в том же соединении, поэтому в
+    памяти не больше одной пачки шарда.
+    """
+    orders = order_rows(where, is_processed)
+    with shards.engines[shard].connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(
+            select(orders).order_by(orders.c.date, orders.c.id))
+        for chunk in result.partitions(settings.order_export_chunk_size):
+            query = items_query(chunk)
+            items = group_items(chunk, () if query is None
+                                else connection.execute(query))
+            for order in chunk:
+                yield order, items[order.id]
+
+
+def encode_ndjson(order, items: list) -> bytes:
+    """Заказ одной строкой JSON в формате списка заказов, без магазина."""
+    return orjson.dumps(dict(zip(ORDER_FIELDS, order),
+                             date=encode_date(order.date),
+                             items=items)) + b'\n'
+
+
+def encode_csv(order, items: list) -> bytes:
+    """Строки CSV заказа, по одной на товар, поля заказа повторяются."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    fields = [*order[:len(ORDER_FIELDS)]]
+    fields[ORDER_FIELDS.index('date')] = encode_date(order.date)
+    for item in items or [{}]:
+        writer.writerow(fields + [item.get(name) for name in ITEM_COLUMNS])
+    return buffer.getvalue().encode()
+
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', encode_ndjson, b''),
+    'csv': ('text/csv', encode_csv, ','.join(
+        [*ORDER_FIELDS, *(f'item_{name}' for name in ITEM_COLUMNS)]
+    ).encode() + b'\r\n'),
+}
+
+
+def export_chunks(orders, encode, header: bytes):
+    """Тело выгрузки, пачками по order_export_chunk_size заказов."""
+    yield header
+    while True:
+        chunk = list(islice(orders, settings.order_export_chunk_size))
+        if not chunk:
+            return
+        yield b''.join(encode(order, items) for order, items in chunk)
+
+
+@internal_router.get('/export', tags=['orders'],
+                     summary='Выгрузка заказов в NDJSON или CSV')
+def export_orders(export_format: str = Query('ndjson', alias='format',
+                                             regex='^(ndjson|csv)$'),
+                  date_from: str = None, date_to: str = None,
+                  user=Depends(get_user)):  # noqa: B008
+    """
+    Потоковая выгрузка заказов пользователя с товарами.
+
+    Фильтры по датам те же, что в списке заказов. Заказы всех шардов и
+    архива сливаются по дате по мере чтения, ответ отправляется частями,
+    поэтому память не зависит от количества заказов. В NDJSON заказ с
+    товарами занимает строку, в CSV каждый товар строку с полями заказа.
+
+    :param export_format: ndjson или csv
+    :return:
+    """
+    media_type, encode, header = EXPORT_FORMATS[export_format]
+    where = user_orders(user, *parse_period(date_from, date_to))
+    orders = heapq.merge(*(stream_shard_orders(shard, where)
+                           for shard in range(len(shards))),
+                         key=lambda pair: (pair[0].date, pair[0].id))
+    return StreamingResponse(
+        export_chunks(orders, encode, header), media_type=media_type,
+        headers={'Content-Disposition':
+                 f'attachment; filename="orders.{export_format}"'})
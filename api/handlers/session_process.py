@@ -3,14 +3,14 @@ import datetime
 
 from fastapi import APIRouter, Depends
 from starlette import status
-from starlette.responses import JSONResponse
 
 from api.handlers.common import get_user
+from api.responses import FastJSONResponse
 from common.exceptions import ModelException
 from common.schemas import DeactivateSessionBody
 from common.services import TokensDenyList
 from common.database import DataBase, get_db
-from common.models import ActiveTokens, User
+from common.models import SESSION_BY_REFRESH_ID, ActiveTokens, User
 from common.text import get_text as _
 
 internal_router = APIRouter()
@@ -31,7 +31,7 @@ def get_active_sessions(db: DataBase = Depends(get_db)):  # noqa: B008
                 'refresh_id': session.refresh_id,
                 'user_agent': session.user_agent, 'region': session.region,
                 'online': session.access_expired_date > timestamp})
-    return JSONResponse(active_sessions, status_code=status.HTTP_200_OK)
+    return FastJSONResponse(active_sessions, status_code=status.HTTP_200_OK)
 
 
 @internal_router.post('/deactivate', tags=['sessions'],
@@ -40,13 +40,11 @@ def deactivate_session(data: DeactivateSessionBody,  # noqa: B008
                        user: User = Depends(get_user),  # noqa: B008
                        db: DataBase = Depends(get_db)):  # noqa: B008
     """Прекращение сессии."""
-    active_session = (db.filter(ActiveTokens,
-                                ActiveTokens.refresh_id == data.refresh_id,
-                                ActiveTokens.user_id == user.id.hex)
-                      .one_or_none())
+    active_session = db.get_one(SESSION_BY_REFRESH_ID,
+                                refresh_id=data.refresh_id, user_id=user.id)
     if not active_session:
         raise ModelException(_('session_not_found'), 404)
 
     TokensDenyList().add_token(active_session.access_id)
     TokensDenyList().add_token(active_session.refresh_id)
-    return JSONResponse({}, status_code=status.HTTP_200_OK)
+    return FastJSONResponse({}, status_code=status.HTTP_200_OK)
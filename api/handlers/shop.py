@@ -1,16 +1,19 @@
 """Обработчики запросов для магазинов."""
 from __future__ import annotations
 
+from datetime import datetime
 from typing import List
 import secrets
 from fastapi import APIRouter, Depends, status
-from fastapi.responses import JSONResponse
+from sqlalchemy import select
 
 from api.handlers.common import get_user
-from common import schemas
-from common.database import DataBase, get_db
+from api.responses import FastJSONResponse
+from common import rollups, schemas
+from common.database import DataBase, columns, get_db, shards
 from common.exceptions import NotFoundException
 from common.models import Shop, User
+from common.serializers import serialize_shop
 from common.text import get_text as _
 
 internal_router = APIRouter()
@@ -37,11 +40,12 @@ def get_shops(db: DataBase = Depends(get_db)):  # noqa: B008
     :param db: связь с БД
     :return:
     """
-    shops = []
-    for shop in db.get_all_objects(Shop):
-        shops.append(schemas.Shop.from_orm(shop).dict())
-    shops = sorted(shops, key=lambda el: not el['is_active'])
-    return JSONResponse(shops, status_code=status.HTTP_200_OK)
+    shops = db.select_rows(
+        select(*columns(Shop, schemas.Shop.__fields__))
+        .where(Shop.deleted_at.is_(None))
+        .order_by(Shop.is_active.desc().nullslast(), Shop.id))
+    return FastJSONResponse([shop._asdict() for shop in shops],
+                            status_code=status.HTTP_200_OK)
 
 
 @internal_router.get('/{shop_id}', tags=['shops'],
@@ -55,8 +59,34 @@ def get_shop(shop_id, db: DataBase = Depends(get_db)):  # noqa: B008
     :param db: связь с БД
     :return:
     """
-    return JSONResponse(schemas.Shop.from_orm(Shop.get(shop_id)).dict(),
-                        status_code=status.HTTP_200_OK)
+    return FastJSONResponse(serialize_shop(Shop.get(shop_id, db)),
+                            status_code=status.HTTP_200_OK)
+
+
+@internal_router.get('/{shop_id}/stats', tags=['shops'],
+                     summary='Итоги заказов магазина по дням',
+                     response_model=List[schemas.ShopDailyStats])
+def get_shop_stats(shop_id: int, date_from: str = None, date_to: str = None,
+                   db: DataBase = Depends(get_db)):  # noqa: B008
+    """
+    Итоги заказов магазина по дням и статусам.
+
+    Читаются из shop_daily_stats, поэтому стоимость зависит от числа дней
+    в периоде, а не от числа заказов. Даты в формате дд.мм.гггг.
+
+    :param shop_id: идентификатор магазина
+    :param db: связь с БД
+    :return:
+    """
+    Shop.get(shop_id, db)
+    if date_from:
+        date_from = datetime.strptime(date_from, '%d.%m.%Y').date()
+    if date_to:
+        date_to = datetime.strptime(date_to, '%d.%m.%Y').date()
+    db.use_shard(shards.get(shop_id))
+    rows = db.select_rows(rollups.shop_stats(shop_id, date_from, date_to))
+    return FastJSONResponse([row._asdict() for row in rows],
+                            status_code=status.HTTP_200_OK)
 
 
 @internal_router.post('/', tags=['shops'], summary='Создание магазина',
@@ -71,12 +101,13 @@ def create_shop(shop_data: schemas.ShopCreate,  # noqa: B008
     :param db: связь с БД
     :return:
     """
-    extra_info = {'api_key': secrets.token_hex(), 'user_id': user.id.hex}
+    extra_info = {'api_key': secrets.token_hex(), 'user_id': user.id.hex,
+                  'shard': shards.choose()}
     shop_data_dict = shop_data.dict()
     shop_data_dict.update(extra_info)
     shop, created = db.get_or_create(Shop, **shop_data_dict)
-    shop = schemas.Shop.from_orm(shop)
-    return JSONResponse(shop.dict(), status_code=status.HTTP_200_OK)
+    return FastJSONResponse(serialize_shop(shop),
+                            status_code=status.HTTP_200_OK)
 
 
 @internal_router.put('/{shop_id}', tags=['shops'],
@@ -87,17 +118,20 @@ def update_shop(shop_id, data: schemas.ShopUpdate,  # noqa: B008
     """
     Обновление магазина.
 
+    Один запрос UPDATE ... RETURNING без загрузки магазина.
+
     :param db: связь с БД
     :param data: данные модели
     :param shop_id: идентификатор магазина для обновления
     :return:
     """
-    shop = Shop.get(shop_id)
-    shop.update(data)
+    shop = db.update_returning(
+        Shop, data.dict(exclude_none=True), schemas.Shop.__fields__,
+        Shop.id == shop_id, Shop.deleted_at.is_(None))
+    if shop is None:
+        raise NotFoundException(_('object_not_found'))
     db.save()
-    db.refresh(shop)
-    return JSONResponse(schemas.Shop.from_orm(shop).dict(),
-                        status_code=status.HTTP_200_OK)
+    return FastJSONResponse(shop._asdict(), status_code=status.HTTP_200_OK)
 
 
 @internal_router.delete('/{shop_id}', tags=['shops'],
@@ -110,6 +144,6 @@ def delete_shop(shop_id, db: DataBase = Depends(get_db)):  # noqa: B008
     :param shop_id: идентификатор магазина
     :return:
     """
-    shop = Shop.get(shop_id)
-    db.delete(Shop, shop)
-    return JSONResponse({}, status_code=status.HTTP_200_OK)
+    shop = Shop.get(shop_id, db)
+    db.soft_delete(Shop, shop)
+    return FastJSONResponse({}, status_code=status.HTTP_200_OK)
@@ -1,27 +1,31 @@
 """Обработчики запросов для профиля."""
-import json
-
-from fastapi import APIRouter, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Request, status
 
+from api.etags import conditional, make_etag
 from api.handlers.common import get_user
+from api.responses import FastJSONResponse
 from common import schemas
 from common.database import DataBase, get_db
 from common.models import User
+from common.serializers import serialize_user
 
 internal_router = APIRouter()
 
 
 @internal_router.get('/', tags=['profile'], summary='Получение профиля',
                      response_model=schemas.User)
-def get_profile(user=Depends(get_user)):  # noqa: B008
+def get_profile(request: Request, user=Depends(get_user)):  # noqa: B008
     """
     Получить профиль пользователя.
 
+    Пользователь уже загружен для авторизации, поэтому ETag по его версии
+    не стоит запросов к БД.
     :return:
     """
-    return JSONResponse(json.loads(schemas.User.from_orm(user).json()),
-                        status_code=status.HTTP_200_OK)
+    return conditional(
+        request, make_etag('profile', user.id, user.version),
+        lambda: FastJSONResponse(serialize_user(user),
+                                 status_code=status.HTTP_200_OK))
 
 
 @internal_router.put('/', tags=['profile'], summary='Обновление профиля',
@@ -32,11 +36,12 @@ def update_profile(data: schemas.UpdateUser,
     """
     Обновление профиля пользователя.
 
-    Изменить номер на текущий момент нельзя.
+    Изменить номер на текущий момент нельзя. Ответ строится из RETURNING
+    запроса UPDATE, без повторного чтения профиля.
     :return:
     """
-    user.update(data)
+    profile = db.update_returning(User, data.dict(exclude_none=True),
+                                  schemas.User.__fields__, User.id == user.id)
     db.save()
-    db.refresh(user)
-    return JSONResponse(json.loads(schemas.User.from_orm(user).json()),
-                        status_code=status.HTTP_200_OK)
+    return FastJSONResponse(serialize_user(profile),
+                            status_code=status.HTTP_200_OK)
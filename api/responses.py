@@ -0,0 +1,85 @@
+"""Классы ответов API."""
+from contextvars import ContextVar
+from typing import Any, Dict
+
+import msgpack
+import orjson
+from fastapi import Request
+from pydantic import BaseModel
+from pydantic.json import pydantic_encoder
+from starlette.responses import JSONResponse
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+
+# формат ответов, выбранный negotiate_format по заголовку Accept, None
+# для маршрутов без выбора формата
+response_format: ContextVar = ContextVar('response_format', default=None)
+
+
+def parse_accept(header: str) -> Dict[str, float]:
+    """Значения заголовка Accept или Accept-Encoding с их весом q."""
+    accepted = {}
+    for part in header.split(','):
+        value, *params = part.split(';')
+        weight = 1.0
+        for param in params:
+            name, _, number = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    weight = float(number)
+                except ValueError:
+                    weight = 0.0
+        if value.strip():
+            accepted[value.strip().lower()] = weight
+    return accepted
+
+
+async def negotiate_format(request: Request):
+    """
+    Выбор формата ответов по заголовку Accept.
+
+    MessagePack отдается, если клиент предпочитает его JSON, иначе JSON.
+    Зависимость асинхронная: значение ставится в контексте запроса и
+    попадает в копии контекста, в которых выполняются обработчики.
+    """
+    accepted = parse_accept(request.headers.get('accept', ''))
+    wanted = max(accepted.get(media_type, 0)
+                 for media_type in (MSGPACK, 'application/x-msgpack'))
+    if wanted > 0 and wanted >= accepted.get(JSON, 0):
+        response_format.set(MSGPACK)
+    else:
+        response_format.set(JSON)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Ответ JSON, закодированный orjson за один проход.
+
+    Схемы pydantic передаются в ответ как есть, без .json() и json.loads.
+    Вложенные схемы orjson обходит сам, даты и время передаются в
+    json_encoders верхней схемы, как в BaseModel.json(), UUID и Enum
+    кодируются так же, как в pydantic. Если negotiate_format выбрал
+    MessagePack, те же данные кодируются msgpack.
+    """
+
+    def render(self, content: Any) -> bytes:
+        """Кодирование содержимого ответа."""
+        encoder = getattr(content, '__json_encoder__', pydantic_encoder)
+
+        def default(obj):
+            if isinstance(obj, BaseModel):
+                return dict(obj)
+            return encoder(obj)
+
+        if response_format.get() == MSGPACK:
+            self.media_type = MSGPACK
+            return msgpack.packb(content, default=default, datetime=False)
+        return orjson.dumps(content, default=default,
+                            option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+    def init_headers(self, headers: dict = None):
+        """Заголовки ответа, с Vary для ответов с выбором формата."""
+        super().init_headers(headers)
+        if response_format.get() is not None:
+            self.headers.add_vary_header('Accept')
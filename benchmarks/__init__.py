@@ -0,0 +1 @@
+"""Замеры производительности работы с БД, запускаются вручную."""
@@ -0,0 +1,90 @@
+"""
+Время кодирования ответов с заказами.
+
+Сравнивает прежнюю схему JSONResponse(json.loads(model.json())) с
+FastJSONResponse(model) для детального заказа и страницы списка заказов
+в формате get_orders, а также from_orm и serialize_order для объектов
+ORM. Данные синтетические, БД не нужна:
+
+    python -m benchmarks.json_responses --orders 1000 --items 5
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+
+from starlette.responses import JSONResponse
+
+from api.handlers.order import encode_date
+from api.responses import FastJSONResponse
+from common import schemas
+from common.models import Item, Order, Shop
+from common.serializers import serialize_order
+
+
+def make_order(idx: int, items: int) -> schemas.Order:
+    """Заказ с магазином и товарами."""
+    shop = {'id': idx % 10, 'name': f'Магазин {idx % 10}',
+            'site_url': 'https://cool.site.com/', 'api_endpoint': '/api',
+            'is_active': True}
+    return schemas.Order(
+        id=idx, number=idx, order_sum=1000, total_price=1100,
+        delivery_price=100, discount=0, shop_id=shop['id'], shop=shop,
+        date=datetime.now(),
+        items=[{'id': idx * items + number, 'article': f'A-{number}',
+                'name': f'Товар {number}', 'price': 200, 'shop_id': shop['id'],
+                'quantity': 1, 'total_price': 200, 'discount': 0}
+               for number in range(items)])
+
+
+def make_orm_order(order: schemas.Order) -> Order:
+    """Объект ORM вне сессии с теми же данными."""
+    return Order(**order.dict(exclude={'shop', 'items'}),
+                 shop=Shop(**order.shop.dict()),
+                 items=[Item(**item.dict()) for item in order.items])
+
+
+def make_page(orders: list) -> dict:
+    """Страница списка заказов, как ее собирает get_orders_data."""
+    return {'has_orders': True, 'count': len(orders), 'page': 1, 'pages': 1,
+            'orders': [dict(order.dict(), date=encode_date(order.date))
+                       for order in orders]}
+
+
+def measure(render, repeat: int) -> float:
+    """Среднее время одного вызова render в микросекундах."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        render()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    """Запуск замеров."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--items', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    orders = [make_order(idx, args.items) for idx in range(args.orders)]
+    page = make_page(orders)
+    orm_orders = [make_orm_order(order) for order in orders]
+    cases = {
+        'order, json.loads(.json())': lambda: [
+            JSONResponse(json.loads(order.json())) for order in orders],
+        'order, FastJSONResponse': lambda: [
+            FastJSONResponse(order) for order in orders],
+        'page, JSONResponse': lambda: JSONResponse(page),
+        'page, FastJSONResponse': lambda: FastJSONResponse(page),
+        'orm order, from_orm': lambda: [
+            FastJSONResponse(schemas.Order.from_orm(order))
+            for order in orm_orders],
+        'orm order, serialize_order': lambda: [
+            FastJSONResponse(serialize_order(order)) for order in orm_orders],
+    }
+    for name, render in cases.items():
+        print(f'{name}: {measure(render, args.repeat):.0f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Процессорное время на построение и компиляцию запросов горячих путей.
+
+Сравнивает поиск пользователя по идентификатору через Query, как раньше в
+get_user, и через заранее построенный USER_BY_ID, с кешем скомпилированных
+запросов движка и без него. Время процесса не включает работу сервера БД,
+поэтому разница показывает, сколько CPU экономится на каждом запросе API:
+
+    python -m benchmarks.statement_cache --lookups 5000
+"""
+import argparse
+import time
+from functools import partial
+
+from common.database import DataBase, SessionLocal, engine
+from common.models import USER_BY_ID, User
+
+PHONE = '+70000000000'
+
+
+def lookup_query(db: DataBase, user_id):
+    """Поиск через Query: запрос строится и обходится на каждый вызов."""
+    return db.get_by_id(User, id=user_id)
+
+
+def lookup_prebuilt(db: DataBase, user_id):
+    """Поиск заранее построенным запросом."""
+    return db.get_one(USER_BY_ID, user_id=user_id)
+
+
+LOOKUPS = {'query': lookup_query, 'prebuilt': lookup_prebuilt}
+
+
+def run(lookup, user_id, lookups: int, cached: bool) -> dict:
+    """lookups поисков в одной сессии, время на один поиск в микросекундах."""
+    bind = engine if cached else engine.execution_options(compiled_cache=None)
+    db = DataBase(partial(SessionLocal, bind=bind))
+    try:
+        lookup(db, user_id)
+        wall, cpu = time.perf_counter(), time.process_time()
+        for _ in range(lookups):
+            db.db.expunge_all()
+            lookup(db, user_id)
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+    finally:
+        db.close()
+    return {'cpu_us': cpu / lookups * 1e6, 'wall_us': wall / lookups * 1e6}
+
+
+def main():
+    """Запуск замеров для всех вариантов поиска."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lookups', type=int, default=5000)
+    args = parser.parse_args()
+    db = DataBase()
+    user, created = db.get_or_create(User, phone=PHONE)
+    try:
+        for cached in (False, True):
+            for name, lookup in LOOKUPS.items():
+                result = run(lookup, user.id, args.lookups, cached)
+                cache = 'cache' if cached else 'no cache'
+                print(f'{name} ({cache}): {result["cpu_us"]:.0f} us CPU, '
+                      f'{result["wall_us"]:.0f} us total per lookup')
+    finally:
+        if created:
+            db.delete(User, user)
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Сравнение uuid4 и uuid7 в качестве первичного ключа.
+
+Вставляет одинаковое количество строк во временные таблицы с ключом uuid
+и выводит скорость вставки и размер индекса первичного ключа:
+
+    python -m benchmarks.uuid_keys --rows 200000
+"""
+import argparse
+import time
+from uuid import uuid4
+
+from sqlalchemy import text
+
+from common.database import engine
+from common.identifiers import uuid7
+
+GENERATORS = {'uuid4': uuid4, 'uuid7': uuid7}
+
+
+def run(name: str, generator, rows: int, batch: int) -> dict:
+    """Вставка rows строк пачками по batch, результат замера."""
+    table = f'bench_{name}'
+    with engine.begin() as connection:
+        connection.execute(text(
+            f'CREATE TEMP TABLE {table} (id uuid PRIMARY KEY, '
+            f'created timestamp DEFAULT now())'))
+        insert = text(f'INSERT INTO {table} (id) VALUES (:id)')
+        start = time.perf_counter()
+        for offset in range(0, rows, batch):
+            connection.execute(insert, [{'id': generator()} for _ in
+                                        range(min(batch, rows - offset))])
+        duration = time.perf_counter() - start
+        index_size = connection.execute(text(
+            f"SELECT pg_relation_size('{table}_pkey')")).scalar()
+        connection.execute(text(f'DROP TABLE {table}'))
+    return {'rows_per_second': rows / duration,
+            'index_mb': index_size / 1024 / 1024}
+
+
+def main():
+    """Запуск замеров для всех генераторов."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--batch', type=int, default=1000)
+    args = parser.parse_args()
+    for name, generator in GENERATORS.items():
+        result = run(name, generator, args.rows, args.batch)
+        print(f'{name}: {result["rows_per_second"]:.0f} rows/s, '
+              f'pkey index {result["index_mb"]:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
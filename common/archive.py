@@ -0,0 +1,125 @@
+"""
+Архив завершенных и отмененных заказов.
+
+Заказы в статусах COMPLETED и CANCELED старше ORDER_ARCHIVE_AFTER_DAYS
+пачками переносятся из orders и items в orders_archive того же шарда.
+Колонки заказа остаются колонками, по ним работают список заказов и
+индекс по дате, товары сохраняются одним значением jsonb, которое
+PostgreSQL сжимает в TOAST. Перенос пачки это один запрос, строки
+удаляются и вставляются в одной транзакции. Чтение заказа и списка
+заказов проверяет архив, поэтому API находит и архивные заказы.
+
+Перенос во всех шардах и возврат заказов из архива:
+
+    python -m common.archive archive
+    python -m common.archive restore ORDER_ID [ORDER_ID ...]
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, text
+
+from common.database import shards
+from common.models import Order, OrderStatuses
+from common.settings import settings
+
+ARCHIVED_STATUSES = (OrderStatuses.COMPLETED, OrderStatuses.CANCELED)
+ORDER_COLUMNS = ', '.join(Order.__table__.c.keys())
+
+# товары удаляются тем же запросом, внешний ключ проверяется в конце запроса
+ARCHIVE_SQL = text(f"""
+    WITH moved_items AS (
+        DELETE FROM items WHERE order_id = ANY(:ids) RETURNING *
+    ), moved AS (
+        DELETE FROM orders WHERE id = ANY(:ids) RETURNING {ORDER_COLUMNS}
+    )
+    INSERT INTO orders_archive ({ORDER_COLUMNS}, items)
+    SELECT moved.*, COALESCE((
+        SELECT jsonb_agg(to_jsonb(moved_items) ORDER BY moved_items.id)
+        FROM moved_items WHERE moved_items.order_id = moved.id), '[]')
+    FROM moved
+""")
+RESTORE_SQL = text(f"""
+    WITH restored AS (
+        DELETE FROM orders_archive WHERE id = ANY(:ids)
+        RETURNING {ORDER_COLUMNS}, items
+    ), restored_orders AS (
+        INSERT INTO orders ({ORDER_COLUMNS})
+        SELECT {ORDER_COLUMNS} FROM restored
+    ), restored_items AS (
+        INSERT INTO items
+        SELECT item.* FROM restored,
+            jsonb_populate_recordset(NULL::items, restored.items) AS item
+    )
+    SELECT count(*) FROM restored
+""")
+
+
+def archive_batch(connection, before: datetime, batch_size: int) -> int:
+    """
+    Перенос в архив одной пачки заказов старше before.
+
+    Заказы, заблокированные другими транзакциями, пропускаются до
+    следующего запуска.
+
+    :return: количество перенесенных заказов
+    """
+    orders = Order.__table__
+    ids = connection.execute(
+        select(orders.c.id)
+        .where(orders.c.status.in_(ARCHIVED_STATUSES),
+               orders.c.date < before)
+        .order_by(orders.c.id).limit(batch_size)
+        .with_for_update(skip_locked=True)).scalars().all()
+    if ids:
+        connection.execute(ARCHIVE_SQL, {'ids': ids})
+    return len(ids)
+
+
+def archive_orders(bind, before: datetime = None,
+                   batch_size: int = settings.order_archive_batch_size) -> int:
+    """
+    Перенос в архив всех подходящих заказов базы bind.
+
+    Каждая пачка в своей транзакции, блокировки держатся недолго.
+    """
+    before = before or datetime.now() - timedelta(
+        days=settings.order_archive_after_days)
+    total = 0
+    while True:
+        with bind.begin() as connection:
+            moved = archive_batch(connection, before, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
+
+
+def restore_orders(ids: list) -> int:
+    """
+    Возврат заказов из архива в orders и items во всех шардах.
+
+    :return: количество возвращенных заказов
+    """
+    restored = 0
+    for bind in shards.engines:
+        with bind.begin() as connection:
+            restored += connection.execute(RESTORE_SQL, {'ids': ids}).scalar()
+    return restored
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    archive = commands.add_parser('archive')
+    archive.add_argument('--days', type=int,
+                         default=settings.order_archive_after_days)
+    restore = commands.add_parser('restore')
+    restore.add_argument('ids', type=int, nargs='+')
+    args = parser.parse_args()
+    if args.command == 'archive':
+        before = datetime.now() - timedelta(days=args.days)
+        for shard, bind in enumerate(shards.engines):
+            print(f'shard {shard}: {archive_orders(bind, before)} archived')
+    else:
+        print(f'{restore_orders(args.ids)} restored')
@@ -1,61 +1,355 @@
 """Работа с базой данных."""
-from sqlalchemy import create_engine
+import csv
+import enum
+import heapq
+import io
+import itertools
+import json
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from fastapi import Request
+from sqlalchemy import (JSON, Integer, and_, cast, create_engine, delete,
+                        func, inspect, select, text, update, values)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.sql import ClauseElement
+from sqlalchemy.sql import column as sql_column
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.util import find_tables
 
 from common.settings import settings
 
 SQLALCHEMY_DATABASE_URL = (f'postgresql://{settings.postgres_user}:'
                            f'{settings.postgres_password}@'
                            f'{settings.postgres_host}/{settings.postgres_db}')
+ASYNC_SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace(
+    'postgresql://', 'postgresql+asyncpg://', 1)
+
+POOL_OPTIONS = {'pool_size': settings.db_pool_size,
+                'max_overflow': settings.db_max_overflow,
+                'pool_timeout': settings.db_pool_timeout,
+                'pool_recycle': settings.db_pool_recycle,
+                'pool_pre_ping': settings.db_pool_pre_ping,
+                'query_cache_size': settings.db_statement_cache_size}
+READ_ONLY_METHODS = {'GET', 'HEAD'}
+COPY_NULL = r'\N'
+# реплика, применившая весь полученный WAL, не отстает, даже если мастер
+# давно ничего не писал и время последней транзакции старое; на мастере
+# обе функции возвращают NULL, и отставание тоже 0
+REPLICA_LAG_SQL = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() '
+    'THEN 0 ELSE COALESCE(EXTRACT(EPOCH FROM now() - '
+    'pg_last_xact_replay_timestamp()), 0) END')
+# таблицы, строки которых распределены по шардам по магазину
+SHARDED_TABLES = {'orders', 'items', 'auth', 'orders_archive',
+                  'shop_daily_stats'}
+# идентификаторы строк, созданных в шарде N, начинаются с N * SHARD_ID_STEP,
+# поэтому они не пересекаются между шардами и переживают перенос магазина
+SHARD_ID_STEP = 100_000_000
+SHOP_SHARD_SQL = text('SELECT shard FROM shops WHERE id = :shop_id')
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=QueuePool,
+                       **POOL_OPTIONS)
+
+
+class ReplicaSet:
+    """
+    Набор реплик для чтения.
+
+    Реплика выбирается по кругу или по наименьшему числу занятых соединений,
+    реплики с отставанием больше допустимого пропускаются.
+    """
+
+    def __init__(self, urls, balance=settings.db_replica_balance,
+                 max_lag=settings.db_replica_max_lag,
+                 check_interval=settings.db_replica_check_interval):
+        """Создание движков для реплик."""
+        self.engines = [create_engine(url, poolclass=QueuePool,
+                                      **POOL_OPTIONS) for url in urls]
+        self.balance = balance
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lags = {}
+        self._counter = itertools.count()
+
+    def choose(self):
+        """Выбор реплики для запроса, None если подходящих нет."""
+        healthy = [replica for replica in self.engines
+                   if self.is_healthy(replica)]
+        if not healthy:
+            return None
+        if self.balance == 'least_connections':
+            return min(healthy, key=lambda replica: replica.pool.checkedout())
+        return healthy[next(self._counter) % len(healthy)]
+
+    def is_healthy(self, replica) -> bool:
+        """Проверка отставания реплики, результат кешируется."""
+        checked_at, lag = self._lags.get(replica, (None, None))
+        now = time.monotonic()
+        if checked_at is None or now - checked_at > self.check_interval:
+            lag = self.get_lag(replica)
+            self._lags[replica] = (now, lag)
+        return lag is not None and lag <= self.max_lag
+
+    @staticmethod
+    def get_lag(replica):
+        """Отставание реплики в секундах, None если она недоступна."""
+        try:
+            with replica.connect() as connection:
+                return float(connection.execute(REPLICA_LAG_SQL).scalar())
+        except DBAPIError:
+            return None
+
+    def stats(self) -> list:
+        """Статистика пулов и отставания реплик."""
+        return [{**get_pool_stats(replica),
+                 'lag': self._lags.get(replica, (None, None))[1]}
+                for replica in self.engines]
+
+
+replicas = ReplicaSet(settings.db_replica_urls)
+
+
+class ShardSet:
+    """
+    Базы с данными заказов, распределенными по магазинам.
+
+    Шард 0 - основная база, остальные задаются DB_SHARD_URLS. Шард магазина
+    хранится в shops.shard основной базы и кешируется на cache_ttl секунд,
+    после переноса магазина процессы переключаются в течение этого времени.
+    """
+
+    def __init__(self, urls, cache_ttl=settings.db_shard_cache_ttl):
+        """Создание движков для шардов."""
+        self.engines = [engine] + [create_engine(url, poolclass=QueuePool,
+                                                 **POOL_OPTIONS)
+                                   for url in urls]
+        self.cache_ttl = cache_ttl
+        self._shops = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        """Количество шардов вместе с основной базой."""
+        return len(self.engines)
+
+    def get(self, shop_id, shard: int = None) -> int:
+        """
+        Номер шарда магазина.
+
+        :param shard: shops.shard из уже прочитанной строки магазина, тогда
+         основная база не запрашивается, а кеш обновляется
+        """
+        if len(self) == 1 or shop_id is None:
+            return 0
+        now = time.monotonic()
+        if shard is not None:
+            self._shops[shop_id] = (now, shard)
+            return shard
+        checked_at, shard = self._shops.get(shop_id, (None, 0))
+        if checked_at is None or now - checked_at > self.cache_ttl:
+            with engine.connect() as connection:
+                shard = connection.execute(
+                    SHOP_SHARD_SQL, {'shop_id': shop_id}).scalar() or 0
+            self._shops[shop_id] = (now, shard)
+        return shard
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    def choose(self) -> int:
+        """Шард для нового магазина, по кругу."""
+        return next(self._counter) % len(self)
+
+    def candidates(self, idx: int) -> list:
+        """
+        Шарды для поиска строки по идентификатору.
+
+        Первым идет шард, в котором строка создана, остальные на случай
+        переноса магазина.
+        """
+        home = min(idx // SHARD_ID_STEP, len(self) - 1)
+        return [home, *(shard for shard in range(len(self))
+                        if shard != home)]
+
+    @staticmethod
+    def is_sharded(mapper, clause) -> bool:
+        """Относится ли запрос к таблицам из SHARDED_TABLES."""
+        if mapper is not None:
+            return inspect(mapper).local_table.name in SHARDED_TABLES
+        return clause is not None and any(
+            table.name in SHARDED_TABLES
+            for table in find_tables(clause, include_crud=True))
+
+
+shards = ShardSet(settings.db_shard_urls)
+
+
+class RoutingSession(Session):
+    """
+    Сессия с маршрутизацией чтения на реплики и шарды.
+
+    Реплика используется только в сессиях только для чтения и до первого
+    коммита, после него чтение идет в мастер, чтобы запрос видел свои записи.
+    Запросы к SHARDED_TABLES идут в шард, выбранный DataBase.use_shard,
+    остальные в основную базу.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        """Выбор движка для очередного запроса сессии."""
+        shard = self.info.get('shard')
+        if shard and shards.is_sharded(mapper, clause):
+            return shards.engines[shard]
+        if (self.info.get('read_only') and not self.info.get('sticky')
+                and not self._flushing
+                and not isinstance(clause, UpdateBase)):
+            if 'replica' not in self.info:
+                self.info['replica'] = replicas.choose()
+            if self.info['replica'] is not None:
+                return self.info['replica']
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False,
+                            autoflush=False, bind=engine)
 
 Base = declarative_base()
 
 Base.metadata.create_all(bind=engine)
 
 
-def get_db():
-    """Функция получения коннекта к БД."""
-    db = DataBase()
+def get_db(request: Request):
+    """
+    Функция получения коннекта к БД.
+
+    На каждый запрос создается своя сессия из пула соединений, после ответа
+    сессия закрывается и соединение возвращается в пул. GET запросы читают
+    из реплик, если они настроены.
+    """
+    db = DataBase(read_only=request.method in READ_ONLY_METHODS)
     try:
         yield db
     finally:
         db.close()
 
 
-class MetaSingleton(type):
-    """Метакласс для создания синглтонов."""
+def get_async_connect_args() -> dict:
+    """
+    Параметры соединения asyncpg.
 
-    _instances = {}
+    asyncpg готовит запросы на сервере и держит их в кеше соединения.
+    PgBouncer в режиме transaction отдает разные серверные соединения одному
+    клиенту, подготовленный запрос там может не найтись, поэтому кеши
+    отключаются. psycopg2 подготовленные запросы не использует.
+    """
+    if settings.db_pgbouncer:
+        return {'prepared_statement_cache_size': 0, 'statement_cache_size': 0}
+    return {'prepared_statement_cache_size':
+            settings.db_prepared_statement_cache_size}
 
-    def __call__(cls, *args, **kwargs):
-        """Функция создает только 1 экземпляр любого класса."""
-        if cls not in cls._instances:
-            cls._instances[cls] = (super(MetaSingleton, cls)
-                                   .__call__(*args, **kwargs))
-        return cls._instances[cls]
 
+@lru_cache()
+def get_async_session():
+    """
+    Фабрика асинхронных сессий.
 
-class DataBase(metaclass=MetaSingleton):
-    """Класс для работы с БД."""
+    Движок на asyncpg создается при первом обращении, поэтому драйвер нужен
+    только если приложение действительно использует AsyncDataBase.
+    """
+    async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL,
+                                       connect_args=get_async_connect_args(),
+                                       **POOL_OPTIONS)
+    return sessionmaker(async_engine, class_=AsyncSession,
+                        autoflush=False, expire_on_commit=False)
 
-    def __init__(self, session=SessionLocal):
-        """Инициализируем БД."""
+
+async def get_async_db():
+    """Функция получения асинхронного коннекта к БД."""
+    db = AsyncDataBase()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+@contextmanager
+def session_scope(session=SessionLocal):
+    """
+    Единица работы с БД вне запросов API (таски, скрипты).
+
+    Незафиксированные изменения откатываются при ошибке, сессия всегда
+    закрывается, поэтому identity map не растет между задачами.
+    """
+    db = DataBase(session)
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def get_pool_stats(bind=engine) -> dict:
+    """Статистика пула соединений."""
+    pool = bind.pool
+    return {'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'max_overflow': settings.db_max_overflow,
+            'timeout': settings.db_pool_timeout}
+
+
+def columns(model, fields) -> list:
+    """
+    Колонки таблицы модели по именам полей, например из схемы.
+
+    Используется для быстрого чтения через DataBase.select_rows и для
+    RETURNING в DataBase.update_returning.
+    """
+    return [model.__table__.c[name] for name in fields]
+
+
+class DataBase:
+    """
+    Класс для работы с БД.
+
+    Каждый экземпляр владеет своей сессией, общий между потоками только пул
+    соединений движка.
+    """
+
+    def __init__(self, session=SessionLocal, read_only=False):
+        """
+        Инициализируем БД.
+
+        :param session: фабрика сессий
+        :param read_only: чтение можно направлять в реплики
+        """
         self.db = session()
+        self.db.info['read_only'] = read_only
 
     def close(self):
-        """Закрытие коннекта к базе."""
+        """Закрытие сессии, соединение возвращается в пул."""
         self.db.close()
 
+    def rollback(self):
+        """Откат незафиксированных изменений."""
+        self.db.rollback()
+
     def delete(self, model, instance):
         """Удаление объекта из БД."""
         self.db.query(model).filter(model.id == instance.id).delete()
         self.save()
 
+    def soft_delete(self, model, instance):
+        """Мягкое удаление: строка остается, но скрывается из запросов."""
+        self.db.query(model).filter(model.id == instance.id).update(
+            {'deleted_at': func.now()}, synchronize_session=False)
+        self.save()
+
     def get_or_create(self, model, defaults=None, **kwargs):
         """
         Получить или создать экземпляр модели.
@@ -65,6 +359,11 @@ class DataBase(metaclass=MetaSingleton):
         второй элемент - bool признак создан ли экземпляр или уже был.
         """
         instance = self.get_by_id(model, **kwargs)
+        if (not instance and self.db.info.get('read_only')
+                and not self.db.info.get('sticky')):
+            # реплика могла еще не получить запись, проверяем мастер
+            self.db.info['sticky'] = True
+            instance = self.get_by_id(model, **kwargs)
         if instance:
             return instance, False
         params = {k: v for k, v in kwargs.items()
@@ -79,13 +378,31 @@ class DataBase(metaclass=MetaSingleton):
         """Получение объекта по идентификатору."""
         return self.db.query(model).filter_by(**kwargs).first()
 
+    def get_one(self, statement, **params):
+        """
+        Один объект по заранее построенному запросу, см. models.prebuilt.
+
+        :return: объект или None
+        """
+        result = self.db.execute(statement, params)
+        return result.scalars().unique().one_or_none()
+
+    def get_row(self, statement, **params):
+        """
+        Первая строка Row заранее построенного запроса Core.
+
+        :return: строка или None
+        """
+        return self.db.execute(statement, params).first()
+
     def get_all_objects(self, model):
         """Получает список всех объектов модели."""
         return self.db.query(model).all()
 
     def save(self):
-        """Сохранение изменений в БД."""
+        """Сохранение изменений в БД, дальнейшее чтение идет из мастера."""
         self.db.commit()
+        self.db.info['sticky'] = True
 
     def add(self, instance):
         """Добавление нового элемента в бд какой-либо модели."""
@@ -98,3 +415,405 @@ class DataBase(metaclass=MetaSingleton):
     def refresh(self, instance):
         """Обновление конктретного экземпляра некотроой модели из БД."""
         self.db.refresh(instance)
+
+    def select_rows(self, statement) -> list:
+        """
+        Быстрое чтение списков через Core select().
+
+        Возвращает строки Row (именованные кортежи на __slots__) без объектов
+        ORM и identity map, сортировка должна быть в самом запросе.
+        Для ответа API строка превращается в словарь через row._asdict().
+        """
+        return self.db.execute(statement).all()
+
+    def scalar(self, statement):
+        """Одно значение из запроса Core, например count."""
+        return self.db.execute(statement).scalar()
+
+    def use_shard(self, shard: int):
+        """
+        Выбор шарда для таблиц SHARDED_TABLES.
+
+        Остальные таблицы по-прежнему в основной базе. При коммите сессия
+        фиксирует транзакции баз по очереди, а не атомарно.
+        """
+        self.db.info['shard'] = shard
+
+    def use_shard_of(self, model, idx: int, also=()):
+        """
+        Выбор шарда, в котором лежит строка модели с идентификатором idx.
+
+        С одной базой ничего не делает, иначе проверяет шарды из
+        shards.candidates. Если строки нет нигде, выбирается первый из них.
+        В also модели, где строка может лежать вместо model, например архив.
+        """
+        if len(shards) == 1:
+            return
+        candidates = shards.candidates(idx)
+        for shard in candidates:
+            self.use_shard(shard)
+            for each in (model, *also):
+                if self.db.execute(select(each.id)
+                                   .where(each.id == idx)).first():
+                    return
+        self.use_shard(candidates[0])
+
+    def scatter_rows(self, statement, key=None, reverse=False) -> list:
+        """
+        Выполнение запроса Core во всех шардах и слияние результатов.
+
+        Каждый шард должен вернуть строки, отсортированные по тому же key,
+        тогда общий результат тоже отсортирован. Выбранный шард сессии
+        после запроса восстанавливается.
+        """
+        current = self.db.info.get('shard')
+        results = []
+        for shard in range(len(shards)):
+            self.use_shard(shard)
+            results.append(self.db.execute(statement).all())
+        self.use_shard(current)
+        if len(results) == 1:
+            return results[0]
+        return list(heapq.merge(*results, key=key, reverse=reverse))
+
+    def scatter_page(self, statement, key, offset: int, limit: int,
+                     reverse=False) -> list:
+        """
+        Страница строк со всех шардов.
+
+        Каждый шард отдает первые offset + limit строк, страница вырезается
+        после слияния, поэтому глубокие страницы дороже курсора.
+        """
+        if len(shards) == 1:
+            return self.select_rows(statement.offset(offset).limit(limit))
+        rows = self.scatter_rows(statement.limit(offset + limit), key=key,
+                                 reverse=reverse)
+        return rows[offset:offset + limit]
+
+    def scatter_count(self, statement) -> int:
+        """Сумма count по всем шардам."""
+        return sum(count for count, in self.scatter_rows(statement))
+
+    def bulk_insert(self, model, rows: list, conflict_columns=None) -> list:
+        """
+        Вставка пачки строк, возвращает идентификаторы новых записей.
+
+        Строки вставляются многострочным INSERT ... RETURNING, большие пачки
+        без обработки конфликтов загружаются через COPY. Все словари должны
+        иметь одинаковые ключи. Изменения не фиксируются, нужен save().
+
+        :param model: модель для вставки
+        :param rows: список словарей с данными
+        :param conflict_columns: уникальные колонки, при конфликте по ним
+         строка пропускается (ON CONFLICT DO NOTHING)
+        """
+        if not rows:
+            return []
+        # запись должна быть видна дальнейшему чтению в запросе
+        self.db.info['sticky'] = True
+        if (conflict_columns is None
+                and len(rows) >= settings.db_copy_threshold
+                and self._copy_supported(model)):
+            return self._copy_insert(model, rows)
+        ids = []
+        for start in range(0, len(rows), settings.db_bulk_chunk_size):
+            query = (insert(model)
+                     .values(rows[start:start + settings.db_bulk_chunk_size])
+                     .returning(model.id))
+            if conflict_columns is not None:
+                query = query.on_conflict_do_nothing(
+                    index_elements=conflict_columns)
+            ids.extend(self.db.execute(query).scalars().all())
+        return ids
+
+    def bulk_update(self, model, values: dict, *args) -> list:
+        """
+        Обновление всех строк по условию одним UPDATE ... RETURNING.
+
+        Условия передаются как в filter, например model.id.in_(ids).
+        Обновленные объекты в сессии помечаются устаревшими.
+        Изменения не фиксируются, нужен save().
+
+        :return: идентификаторы обновленных строк
+        """
+        self.db.info['sticky'] = True
+        query = (update(model).where(*args).values(**values)
+                 .returning(model.id)
+                 .execution_options(synchronize_session=False))
+        ids = set(self.db.execute(query).scalars().all())
+        for instance in list(self.db.identity_map.values()):
+            if isinstance(instance, model) and instance.id in ids:
+                self.db.expire(instance, list(values))
+        return list(ids)
+
+    def update_returning(self, model, values: dict, fields, *args):
+        """
+        Обновление одной строки без чтения через UPDATE ... RETURNING.
+
+        Условия передаются как в filter и проверяют владельца в том же
+        запросе, в SET попадают только переданные колонки, колонки fields
+        возвращаются из RETURNING без повторного SELECT, среди них должен
+        быть id. Без значений
+        выполняется только чтение по тем же условиям.
+        Изменения не фиксируются, нужен save().
+
+        :return: строка Row или None, если под условия ничего не попало
+        """
+        returning = columns(model, fields)
+        if not values:
+            return self.db.execute(select(*returning).where(*args)).first()
+        self.db.info['sticky'] = True
+        query = (update(model).where(*args).values(**values)
+                 .returning(*returning)
+                 .execution_options(synchronize_session=False))
+        row = self.db.execute(query).first()
+        if row is not None:
+            instance = self.db.identity_map.get(
+                self.db.identity_key(model, row.id))
+            if instance is not None:
+                self.db.expire(instance, list(values))
+        return row
+
+    def bulk_increment(self, model, rows: list, key_columns: list):
+        """
+        Прибавление к счетчикам одним INSERT ... ON CONFLICT DO UPDATE.
+
+        Строки с новым ключом вставляются, у существующих к колонкам, кроме
+        key_columns, прибавляются значения из rows, поэтому параллельные
+        изменения не теряются. Ключи в rows не должны повторяться.
+        Изменения не фиксируются, нужен save().
+
+        :param key_columns: колонки первичного ключа счетчика
+        """
+        if not rows:
+            return
+        self.db.info['sticky'] = True
+        table = model.__table__
+        query = insert(model).values(rows)
+        self.db.execute(query.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={key: table.c[key] + query.excluded[key]
+                  for key in rows[0] if key not in key_columns}))
+
+    def bulk_get_or_create(self, model, rows: list, key_columns=None) -> list:
+        """
+        Пакетный аналог get_or_create.
+
+        Существующие строки ищутся одним запросом: ключи строк передаются
+        через VALUES и соединяются с таблицей, None совпадает с NULL, как в
+        get_or_create. Найденная строка относится к входной по номеру в
+        VALUES, поэтому приведение типов в БД не мешает сопоставлению.
+        Недостающие вставляются через bulk_insert, повторяющиеся ключи один
+        раз, и тоже сопоставляются через VALUES, а не по порядку RETURNING.
+        Изменения не фиксируются.
+
+        :param key_columns: колонки для поиска, по умолчанию все ключи строк
+        :return: список кортежей (экземпляр, создан ли) в порядке rows
+        """
+        if not rows:
+            return []
+        key_columns = list(key_columns or rows[0])
+        keys = [tuple(row[column] for column in key_columns) for row in rows]
+        lookup = values(
+            sql_column('row_idx', Integer),
+            *(sql_column(name, getattr(model, name).type)
+              for name in key_columns),
+            name='lookup').data([(idx, *key) for idx, key in enumerate(keys)])
+        conditions = []
+        for position, name in enumerate(key_columns):
+            attribute = getattr(model, name)
+            value = cast(lookup.c[name], attribute.type)
+            # равенство использует индексы, IS NOT DISTINCT FROM - нет
+            if any(key[position] is None for key in keys):
+                conditions.append(attribute.is_not_distinct_from(value))
+            else:
+                conditions.append(attribute == value)
+        query = select(model, lookup.c.row_idx).join(lookup,
+                                                     and_(*conditions))
+        found = {}
+        for instance, row_idx in self.db.execute(query):
+            found.setdefault(row_idx, instance)
+        missing = {}
+        for row_idx, key in enumerate(keys):
+            if row_idx not in found:
+                missing.setdefault(key, row_idx)
+        ids = self.bulk_insert(model, [rows[row_idx]
+                                       for row_idx in missing.values()])
+        created = {}
+        if ids:
+            # порядок RETURNING не гарантирован
+            new_rows = self.db.execute(query.where(model.id.in_(ids)))
+            for instance, row_idx in new_rows:
+                created[keys[row_idx]] = instance
+        return [(found[row_idx], False) if row_idx in found
+                else (created[key], True)
+                for row_idx, key in enumerate(keys)]
+
+    @staticmethod
+    def _copy_supported(model) -> bool:
+        """
+        Подходит ли таблица для загрузки через COPY.
+
+        Идентификаторы для COPY берутся из последовательности, поэтому id
+        должен быть целым автоинкрементным ключом без других значений по
+        умолчанию, например UUID пользователей так не загрузить.
+        """
+        id_column = model.__table__.c.get('id')
+        return (id_column is not None
+                and isinstance(id_column.type, Integer)
+                and id_column.autoincrement in (True, 'auto')
+                and id_column.default is None
+                and id_column.server_default is None)
+
+    def _copy_insert(self, model, rows: list) -> list:
+        """
+        Загрузка строк через COPY.
+
+        COPY не умеет RETURNING, поэтому идентификаторы заранее берутся из
+        последовательности таблицы и передаются вместе с данными. Значения
+        колонок JSON передаются в виде JSON, как при INSERT.
+        """
+        table = model.__table__
+        columns = list(rows[0])
+        defaults = {column.name: column.default.arg
+                    for column in table.columns
+                    if column.default is not None and column.default.is_scalar
+                    and column.name not in columns and column.name != 'id'}
+        names = ['id'] + columns + list(defaults)
+        json_columns = {index for index, name in enumerate(names)
+                        if isinstance(table.c[name].type, JSON)}
+        # текстовые запросы не определяют таблицу, шард выбирается по модели
+        bind_arguments = {'mapper': inspect(model)}
+        ids = self.db.execute(
+            text('SELECT nextval(pg_get_serial_sequence(:table, :column)) '
+                 'FROM generate_series(1, :count)'),
+            {'table': table.name, 'column': 'id', 'count': len(rows)},
+            bind_arguments=bind_arguments,
+        ).scalars().all()
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for idx, row in zip(ids, rows):
+            line = [idx] + [row[column] for column in columns]
+            line += list(defaults.values())
+            writer.writerow([self._copy_value(value, index in json_columns)
+                             for index, value in enumerate(line)])
+        buffer.seek(0)
+
+        cursor = self.db.connection(
+            bind_arguments=bind_arguments).connection.cursor()
+        try:
+            cursor.copy_expert(f'COPY {table.name} ({", ".join(names)}) '
+                               f"FROM STDIN WITH (FORMAT csv, "
+                               f"NULL '{COPY_NULL}')",
+                               buffer)
+        finally:
+            cursor.close()
+        return ids
+
+    @staticmethod
+    def _copy_value(value, is_json: bool = False):
+        """Приведение значения к виду, понятному COPY."""
+        if value is None:
+            # явный маркер, чтобы COPY отличал NULL от пустой строки
+            return COPY_NULL
+        if is_json:
+            return json.dumps(value)
+        if isinstance(value, enum.Enum):
+            return value.name
+        return value
+
+
+class AsyncDataBase:
+    """
+    Асинхронный класс для работы с БД.
+
+    Повторяет интерфейс DataBase, но не блокирует поток на время запросов.
+    Объекты не истекают после коммита, чтобы чтение атрибутов не требовало
+    неявных запросов к БД.
+    """
+
+    def __init__(self, session=None):
+        """Инициализируем БД."""
+        self.db = (session or get_async_session())()
+
+    async def close(self):
+        """Закрытие сессии, соединение возвращается в пул."""
+        await self.db.close()
+
+    async def rollback(self):
+        """Откат незафиксированных изменений."""
+        await self.db.rollback()
+
+    async def delete(self, model, instance):
+        """Удаление объекта из БД."""
+        await self.db.execute(delete(model).where(model.id == instance.id))
+        await self.save()
+
+    async def soft_delete(self, model, instance):
+        """Мягкое удаление аналогично DataBase.soft_delete."""
+        await self.db.execute(
+            update(model).where(model.id == instance.id)
+            .values(deleted_at=func.now())
+            .execution_options(synchronize_session=False))
+        await self.save()
+
+    async def get_or_create(self, model, defaults=None, **kwargs):
+        """
+        Получить или создать экземпляр модели.
+
+        Возвращает кортеж аналогично DataBase.get_or_create.
+        """
+        instance = await self.get_by_id(model, **kwargs)
+        if instance:
+            return instance, False
+        params = {k: v for k, v in kwargs.items()
+                  if not isinstance(v, ClauseElement)}
+        params.update(defaults or {})
+        instance = model(**params)
+        self.add(instance)
+        await self.save()
+        return instance, True
+
+    async def get_by_id(self, model, **kwargs):
+        """Получение объекта по идентификатору."""
+        result = await self.db.execute(select(model).filter_by(**kwargs))
+        return result.scalars().first()
+
+    async def get_one(self, statement, **params):
+        """Один объект по заранее построенному запросу, как в DataBase."""
+        result = await self.db.execute(statement, params)
+        return result.scalars().unique().one_or_none()
+
+    async def get_row(self, statement, **params):
+        """Первая строка Row заранее построенного запроса, как в DataBase."""
+        result = await self.db.execute(statement, params)
+        return result.first()
+
+    async def get_all_objects(self, model):
+        """Получает список всех объектов модели."""
+        result = await self.db.execute(select(model))
+        return result.scalars().all()
+
+    async def save(self):
+        """Сохранение изменений в БД."""
+        await self.db.commit()
+
+    def add(self, instance):
+        """Добавление нового элемента в бд какой-либо модели."""
+        self.db.add(instance)
+
+    async def filter(self, model, *args, options=()):  # noqa: A003
+        """
+        Фильтр объектов модели по параметрам.
+
+        В отличие от синхронной версии запрос выполняется сразу, возвращается
+        ScalarResult с методами all, first и one_or_none.
+        """
+        query = select(model).filter(*args).options(*options)
+        # unique нужен при жадной загрузке коллекций через JOIN
+        return (await self.db.execute(query)).unique().scalars()
+
+    async def refresh(self, instance):
+        """Обновление конктретного экземпляра некотроой модели из БД."""
+        await self.db.refresh(instance)
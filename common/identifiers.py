@@ -0,0 +1,28 @@
+"""
+Генерация идентификаторов.
+
+UUID по схеме версии 7 (RFC 9562): первые 48 бит - время в миллисекундах,
+поэтому новые ключи растут и вставляются в конец индекса, а не в случайную
+страницу, как uuid4. Значение остается обычным uuid.UUID и совместимо с
+колонками UUID(as_uuid=True) и user.id.hex.
+"""
+import os
+import time
+from uuid import UUID
+
+VERSION = 7
+VARIANT = 0b10
+
+
+def uuid7() -> UUID:
+    """
+    Упорядоченный по времени UUID.
+
+    12 бит после версии заняты долей миллисекунды, оставшиеся 62 бита
+    случайные, так что ключи одного процесса растут почти строго.
+    """
+    milliseconds, nanoseconds = divmod(time.time_ns(), 1_000_000)
+    fraction = nanoseconds * 4096 // 1_000_000
+    random = int.from_bytes(os.urandom(8), 'big') & (1 << 62) - 1
+    return UUID(int=(milliseconds & (1 << 48) - 1) << 80 | VERSION << 76
+                | fraction << 64 | VARIANT << 62 | random)
@@ -0,0 +1,134 @@
+"""Постоянный сбор статистики запросов к БД."""
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from common.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# обработчики запросов выполняются в пуле потоков с копией контекста,
+# поэтому в переменной лежит изменяемый объект, а не счетчики
+current_stats: ContextVar = ContextVar('sql_stats', default=None)
+
+
+class RequestStats:
+    """Статистика запросов к БД в рамках одного запроса API."""
+
+    __slots__ = ('queries', 'db_time', 'slowest_time', 'slowest_statement',
+                 'statements')
+
+    def __init__(self):
+        """Пустая статистика."""
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement = None
+        self.statements = Counter()
+
+    def add(self, statement: str, duration: float):
+        """Учет выполненного запроса."""
+        self.queries += 1
+        self.db_time += duration
+        self.statements[statement] += 1
+        if duration > self.slowest_time:
+            self.slowest_time = duration
+            self.slowest_statement = statement
+
+    def repeated_statements(self, threshold: int) -> list:
+        """Запросы одного вида, повторенные не меньше threshold раз (N+1)."""
+        return [(statement, count)
+                for statement, count in self.statements.most_common()
+                if count >= threshold]
+
+
+class RouteStats:
+    """Накопленная статистика по одному маршруту API."""
+
+    __slots__ = ('requests', 'queries', 'db_time', 'max_queries',
+                 'slowest_time', 'slowest_statement', 'n_plus_one')
+
+    def __init__(self):
+        """Пустая статистика."""
+        self.requests = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.max_queries = 0
+        self.slowest_time = 0.0
+        self.slowest_statement = None
+        self.n_plus_one = 0
+
+    def add(self, stats: RequestStats, has_n_plus_one: bool):
+        """Добавление статистики завершенного запроса."""
+        self.requests += 1
+        self.queries += stats.queries
+        self.db_time += stats.db_time
+        self.max_queries = max(self.max_queries, stats.queries)
+        self.n_plus_one += has_n_plus_one
+        if stats.slowest_time > self.slowest_time:
+            self.slowest_time = stats.slowest_time
+            self.slowest_statement = stats.slowest_statement
+
+    def as_dict(self) -> dict:
+        """Данные для ответа API, время в миллисекундах."""
+        return {'requests': self.requests,
+                'queries': self.queries,
+                'avg_queries': self.queries / self.requests,
+                'max_queries': self.max_queries,
+                'db_time_ms': self.db_time * 1000,
+                'avg_db_time_ms': self.db_time * 1000 / self.requests,
+                'slowest_ms': self.slowest_time * 1000,
+                'slowest_statement': self.slowest_statement,
+                'n_plus_one_requests': self.n_plus_one}
+
+
+# агрегаты меняются только из middleware в потоке цикла событий
+route_stats = {}
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    """Засекаем время начала запроса."""
+    if context is not None:
+        context.sql_stats_start = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    """Учет времени запроса и логирование медленных запросов."""
+    start = getattr(context, 'sql_stats_start', None)
+    if start is None:
+        return
+    duration = time.perf_counter() - start
+    stats = current_stats.get()
+    if stats is not None:
+        stats.add(statement, duration)
+    if duration * 1000 >= settings.sql_slow_query_ms:
+        logger.warning('Slow query %.1f ms: %s', duration * 1000, statement)
+
+
+def start_request() -> RequestStats:
+    """Начало сбора статистики для запроса API."""
+    stats = RequestStats()
+    current_stats.set(stats)
+    return stats
+
+
+def finish_request(route: str, stats: RequestStats):
+    """Сохранение статистики запроса в агрегаты маршрута."""
+    repeated = stats.repeated_statements(settings.sql_n_plus_one_threshold)
+    for statement, count in repeated:
+        logger.warning('Possible N+1 in %s: %s queries of %s',
+                       route, count, statement)
+    route_stats.setdefault(route, RouteStats()).add(stats, bool(repeated))
+
+
+def get_route_stats() -> dict:
+    """Агрегированная статистика по маршрутам."""
+    return {route: stats.as_dict() for route, stats in route_stats.items()}
@@ -2,16 +2,20 @@
 from __future__ import annotations
 
 import enum
-from uuid import uuid4
 import pydantic
-from sqlalchemy import (Boolean, Column, Date, DateTime, Enum, ForeignKey,
-                        Integer, String)
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
-
-from common.database import Base, DataBase
+from sqlalchemy import (DDL, BigInteger, Boolean, Column, Date, DateTime,
+                        Enum, ForeignKey, Index, Integer, String,
+                        UniqueConstraint, bindparam, event, func, select,
+                        text, union_all)
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.orm import (Session, joinedload, relationship, selectinload,
+                            with_loader_criteria)
+from sqlalchemy.orm.attributes import set_committed_value
+
+from common.database import AsyncDataBase, Base, DataBase
 from common.exceptions import (AddressException, CardException,
                                ModelException, NotFoundException)
+from common.identifiers import uuid7
 from common.text import get_text as _
 
 
@@ -33,29 +37,111 @@ class BaseModel(Base):
                 setattr(self, key, val)
 
     @classmethod
-    def get(cls, idx):
-        """Получение объекта из бд по идентификатору."""
-        instance = DataBase().get_by_id(cls, id=idx)
+    def get(cls, idx, db: DataBase):
+        """Получение объекта из бд по идентификатору в сессии запроса."""
+        instance = db.get_by_id(cls, id=idx)
+        if not instance:
+            raise NotFoundException(_('object_not_found'))
+        return instance
+
+    @classmethod
+    async def get_async(cls, idx, db: AsyncDataBase):
+        """Асинхронное получение объекта из бд по идентификатору."""
+        instance = await db.get_by_id(cls, id=idx)
         if not instance:
             raise NotFoundException(_('object_not_found'))
         return instance
 
 
-class User(BaseModel):
+class SoftDeleteMixin:
+    """
+    Мягкое удаление для модели.
+
+    Удаленная строка остается для старых заказов, но ORM запросы ее не
+    видят, см. hide_deleted. Запросы Core фильтруют deleted_at сами.
+    """
+
+    deleted_at = Column(DateTime)
+
+
+class VersionMixin:
+    """
+    Версия строки для ETag ответов API, см. api.etags.
+
+    Новая строка получает 1, каждый UPDATE через ORM или Core прибавляет
+    единицу в том же запросе.
+    """
+
+    version = Column(Integer, nullable=False, default=1, server_default='1',
+                     onupdate=text('version + 1'))
+
+
+LIVE_ROWS = with_loader_criteria(SoftDeleteMixin,
+                                 lambda cls: cls.deleted_at.is_(None),
+                                 include_aliases=True,
+                                 propagate_to_loaders=False)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def hide_deleted(execute_state):
+    """
+    Условие deleted_at IS NULL для всех ORM запросов к SoftDeleteMixin.
+
+    Не применяется к загрузке связей, чтобы заказ видел удаленные адрес,
+    карту и магазин, и к запросам с execution_options(include_deleted=True).
+    В запросы из prebuilt условие уже добавлено.
+    """
+    options = execute_state.execution_options
+    if (execute_state.is_select and not execute_state.is_relationship_load
+            and not options.get('include_deleted')
+            and not options.get('prebuilt')):
+        execute_state.statement = execute_state.statement.options(LIVE_ROWS)
+
+
+def prebuilt(statement):
+    """
+    Запрос горячего пути, построенный один раз при импорте.
+
+    SQLAlchemy запоминает ключ кеша у объекта запроса, поэтому на каждый
+    вызов не тратится время на построение запроса и его обход, а SQL
+    берется из кеша скомпилированных запросов движка. Значения передаются
+    через bindparam. Подменять такой запрос в hide_deleted нельзя, иначе
+    ключ кеша будет считаться заново, поэтому условие добавляется здесь.
+    """
+    return statement.options(LIVE_ROWS).execution_options(prebuilt=True)
+
+
+class User(VersionMixin, BaseModel):
     """Класс Пользователя платформы."""
 
     __tablename__ = 'users'
 
     id = Column(UUID(as_uuid=True), primary_key=True,   # noqa: A003
-                unique=True, index=True, default=uuid4)
+                unique=True, index=True, default=uuid7)
     phone = Column(String, unique=True, index=True)
     name = Column(String, default='')
     lastname = Column(String, default='')
     birthday = Column(Date)
     email = Column(String, default=None)
     is_admin = Column(Boolean, default=False)
-    cards = relationship('Card', back_populates='user', lazy='dynamic')
-    addresses = relationship('Address', back_populates='user', lazy='dynamic')
+    # указатели на адрес и карту по умолчанию, меняются в одной транзакции
+    # с флагом is_default; таблицы ссылаются друг на друга, поэтому внешние
+    # ключи создаются отдельно после таблиц
+    default_address_id = Column(Integer, ForeignKey(
+        'addresses.id', use_alter=True, ondelete='SET NULL',
+        name='users_default_address_id_fkey'))
+    default_address = relationship('Address',
+                                   foreign_keys=[default_address_id],
+                                   post_update=True)
+    default_card_id = Column(Integer, ForeignKey(
+        'cards.id', use_alter=True, ondelete='SET NULL',
+        name='users_default_card_id_fkey'))
+    default_card = relationship('Card', foreign_keys=[default_card_id],
+                                post_update=True)
+    cards = relationship('Card', back_populates='user', lazy='dynamic',
+                         foreign_keys='Card.user_id')
+    addresses = relationship('Address', back_populates='user', lazy='dynamic',
+                             foreign_keys='Address.user_id')
     orders = relationship('Order', back_populates='user', lazy='dynamic')
     auths = relationship('AuthLog', back_populates='user', lazy='dynamic')
 
@@ -75,51 +161,140 @@ class User(BaseModel):
 
     def get_default_address(self):
         """Получение дефолтного адреса, ошибка в противном случае."""
-        default_address = (self.addresses
-                           .filter(Address.is_default == True)  # noqa: E712
-                           .one_or_none())
-        if default_address:
-            return default_address
+        if self.default_address_id is not None:
+            return self.default_address
         raise NotFoundException(_('default_address_not_found'))
 
     def get_default_card(self):
         """Получение дефолтноой карты, ошибка в противном случае."""
-        default_card = (self.cards
-                        .filter(Card.is_default == True)  # noqa: E712
-                        .one_or_none())
-        if default_card:
-            return default_card
+        if self.default_card_id is not None:
+            return self.default_card
+        raise NotFoundException(_('default_card_not_found'))
+
+    def set_default_address(self, address, db: DataBase):
+        """
+        Назначение адреса по умолчанию.
+
+        Флаг снимается с прежнего адреса по первичному ключу из указателя,
+        изменения не фиксируются.
+        """
+        if self.default_address_id not in (None, address.id):
+            db.bulk_update(Address, {'is_default': False},
+                           Address.id == self.default_address_id)
+        address.is_default = True
+        self.default_address = address
+
+    def set_default_card(self, card, db: DataBase):
+        """Назначение карты по умолчанию, аналогично set_default_address."""
+        if self.default_card_id not in (None, card.id):
+            db.bulk_update(Card, {'is_default': False},
+                           Card.id == self.default_card_id)
+        card.is_default = True
+        self.default_card = card
+
+    def get_order(self, order_id: int, db: DataBase, profile: str = None):
+        """
+        Метод получения заказа пользователя.
+
+        Если заказа нет в orders, он ищется в архиве.
+        :param profile: профиль загрузки связей из ORDER_LOAD_PROFILES
+        """
+        order = db.get_one(ORDER_BY_ID[profile], user_id=self.id,
+                           order_id=order_id)
+        if not order:
+            archived = db.get_one(ARCHIVED_ORDER_BY_ID, user_id=self.id,
+                                  order_id=order_id)
+            order = archived and archived.as_order(
+                db.get_one(SHOP_BY_ID, shop_id=archived.shop_id))
+        if not order:
+            raise ModelException(_('order_not_found'), 404)
+        return order
+
+    async def get_address_async(self, address_id: int, db: AsyncDataBase):
+        """Асинхронный поиск адреса среди привязанных к пользователю."""
+        address = (await db.filter(Address, Address.user_id == self.id,
+                                   Address.id == address_id)).one_or_none()
+        if not address:
+            raise AddressException(_('address_not_found'), 404)
+        return address
+
+    async def get_card_async(self, card_id: int, db: AsyncDataBase):
+        """Асинхронный поиск карты среди привязанных к пользователю."""
+        card = (await db.filter(Card, Card.user_id == self.id,
+                                Card.id == card_id)).one_or_none()
+        if not card:
+            raise CardException(_('card_not_found'), 404)
+        return card
+
+    async def get_default_address_async(self, db: AsyncDataBase):
+        """Асинхронное получение дефолтного адреса."""
+        if self.default_address_id is not None:
+            return await db.get_one(ADDRESS_BY_ID,
+                                    address_id=self.default_address_id)
+        raise NotFoundException(_('default_address_not_found'))
+
+    async def get_default_card_async(self, db: AsyncDataBase):
+        """Асинхронное получение дефолтной карты."""
+        if self.default_card_id is not None:
+            return await db.get_one(CARD_BY_ID,
+                                    card_id=self.default_card_id)
         raise NotFoundException(_('default_card_not_found'))
 
-    def get_order(self, order_id: int):
-        """Метод получения заказа пользователя."""
-        order = self.orders.filter(Order.id == order_id).one_or_none()
+    async def get_order_async(self, order_id: int, db: AsyncDataBase):
+        """
+        Асинхронное получение заказа пользователя.
+
+        Ленивая загрузка связей в async сессии невозможна, поэтому магазин и
+        товары заказа загружаются сразу. Архив проверяется как в get_order.
+        """
+        order = await db.get_one(ORDER_BY_ID['detail'], user_id=self.id,
+                                 order_id=order_id)
+        if not order:
+            archived = await db.get_one(ARCHIVED_ORDER_BY_ID,
+                                        user_id=self.id, order_id=order_id)
+            order = archived and archived.as_order(
+                await db.get_one(SHOP_BY_ID, shop_id=archived.shop_id))
         if not order:
             raise ModelException(_('order_not_found'), 404)
         return order
 
 
-class Card(BaseModel):
+class Card(SoftDeleteMixin, VersionMixin, BaseModel):
     """Класс Карты пользователя."""
 
     __tablename__ = 'cards'
+    __table_args__ = (
+        # индексы только по живым строкам, удаленные их не раздувают
+        Index('ix_cards_user_id_live', 'user_id',
+              postgresql_where=text('deleted_at IS NULL')),
+        Index('ix_cards_user_id_default', 'user_id',
+              postgresql_where=text('is_default AND deleted_at IS NULL')),
+    )
 
     id = Column(Integer, primary_key=True, index=True)  # noqa: A003
     number = Column(String)
-    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), index=True)
-    user = relationship('User', back_populates='cards')
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'))
+    user = relationship('User', back_populates='cards', foreign_keys=[user_id])
     is_default = Column(Boolean)
     orders = relationship('Order', back_populates='card')
 
 
-class Address(BaseModel):
+class Address(SoftDeleteMixin, VersionMixin, BaseModel):
     """Класс Адреса доставки пользователя."""
 
     __tablename__ = 'addresses'
+    __table_args__ = (
+        # индексы только по живым строкам, удаленные их не раздувают
+        Index('ix_addresses_user_id_live', 'user_id',
+              postgresql_where=text('deleted_at IS NULL')),
+        Index('ix_addresses_user_id_default', 'user_id',
+              postgresql_where=text('is_default AND deleted_at IS NULL')),
+    )
 
     id = Column(Integer, primary_key=True, index=True)  # noqa: A003
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'))
-    user = relationship('User', back_populates='addresses')
+    user = relationship('User', back_populates='addresses',
+                        foreign_keys=[user_id])
     city = Column(String)
     address = Column(String)
     floor = Column(String)
@@ -129,10 +304,16 @@ class Address(BaseModel):
     orders = relationship('Order', back_populates='address')
 
 
-class Shop(BaseModel):
+class Shop(SoftDeleteMixin, VersionMixin, BaseModel):
     """Класс информации о Магазине."""
 
     __tablename__ = 'shops'
+    __table_args__ = (
+        # список магазинов: активные первыми, только живые строки
+        Index('ix_shops_is_active_id_live',
+              text('is_active DESC NULLS LAST'), 'id',
+              postgresql_where=text('deleted_at IS NULL')),
+    )
 
     id = Column(Integer, primary_key=True, index=True)  # noqa: A003
     name = Column(String)
@@ -141,6 +322,8 @@ class Shop(BaseModel):
     api_key = Column(String)
     user_id = Column(UUID(as_uuid=True))
     is_active = Column(Boolean, default=True)
+    # шард с заказами магазина, см. common.database.ShardSet
+    shard = Column(Integer, nullable=False, default=0, server_default='0')
     orders = relationship('Order', back_populates='shop')
     items = relationship('Item', back_populates='shop')
     auths = relationship('AuthLog', back_populates='shop')
@@ -156,10 +339,19 @@ class OrderStatuses(enum.Enum):
     CANCELED = 'Отменен'
 
 
-class Order(BaseModel):
+class Order(VersionMixin, BaseModel):
     """Класс с информацией о Заказе пользователя."""
 
     __tablename__ = 'orders'
+    __table_args__ = (
+        # список заказов пользователя с фильтром и сортировкой по дате
+        Index('ix_orders_user_id_date', 'user_id', 'date', 'id'),
+        # выборки по диапазону дат по всей таблице
+        Index('ix_orders_date_brin', 'date', postgresql_using='brin'),
+        # номера выдает common.numbering, ограничение страхует от дублей
+        UniqueConstraint('shop_id', 'number',
+                         name='orders_shop_id_number_key'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)  # noqa: A003
     number = Column(Integer, index=True)
@@ -199,8 +391,93 @@ class Item(BaseModel):
     shop_id = Column(Integer, ForeignKey('shops.id'))
     shop = relationship('Shop', back_populates='items')
 
-    order_id = Column(Integer, ForeignKey('orders.id'))
+    order_id = Column(Integer, ForeignKey('orders.id'), index=True)
     order = relationship('Order', back_populates='items')
+    # копия даты заказа, по ней товары секционируются вместе с заказами
+    order_date = Column(DateTime)
+
+
+class ArchivedOrder(BaseModel):
+    """
+    Заказ в архиве, см. common.archive.
+
+    Колонки повторяют Order без внешних ключей, товары заказа хранятся
+    одним значением jsonb в формате строк таблицы items.
+    """
+
+    __tablename__ = 'orders_archive'
+    __table_args__ = (
+        Index('ix_orders_archive_user_id_date', 'user_id', 'date', 'id'),
+        Index('ix_orders_archive_date_brin', 'date', postgresql_using='brin'),
+    )
+
+    id = Column(Integer, primary_key=True,  # noqa: A003
+                autoincrement=False)
+    number = Column(Integer)
+    status = Column(Enum(OrderStatuses, name='statuses'))
+    total_price = Column(Integer)
+    order_sum = Column(Integer)
+    delivery_price = Column(Integer)
+    discount = Column(Integer)
+    date = Column(DateTime)
+    user_id = Column(UUID(as_uuid=True))
+    shop_id = Column(Integer)
+    card_id = Column(Integer)
+    address_id = Column(Integer)
+    version = Column(Integer, nullable=False, server_default='1')
+    items = Column(JSONB, nullable=False, server_default=text("'[]'"))
+    archived_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    def as_order(self, shop) -> Order:
+        """
+        Заказ из архива в виде Order для ответа API.
+
+        Объект не попадает в сессию, магазин и товары устанавливаются без
+        событий связей, поэтому каскад не вставит заказ обратно в orders.
+        """
+        order = Order(**{column.key: getattr(self, column.key)
+                         for column in Order.__table__.columns})
+        set_committed_value(order, 'shop', shop)
+        set_committed_value(order, 'items', [
+            Item(**{key: value for key, value in item.items()
+                    if key in Item.__table__.c})
+            for item in self.items])
+        return order
+
+
+# товары сжимаются в TOAST уже со 128 байт строки, а не с 2 КБ
+event.listen(ArchivedOrder.__table__, 'after_create',
+             DDL('ALTER TABLE %(table)s SET (toast_tuple_target = 128)'))
+
+
+class ShopDailyStats(BaseModel):
+    """
+    Итоги заказов магазина за день в одном статусе, см. common.rollups.
+
+    Строки меняются вместе со статусом заказа, по дате заказа.
+    """
+
+    __tablename__ = 'shop_daily_stats'
+
+    shop_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    status = Column(Enum(OrderStatuses, name='statuses'), primary_key=True)
+    orders_count = Column(Integer, nullable=False, server_default='0')
+    total_price = Column(BigInteger, nullable=False, server_default='0')
+    order_sum = Column(BigInteger, nullable=False, server_default='0')
+    delivery_price = Column(BigInteger, nullable=False, server_default='0')
+    discount = Column(BigInteger, nullable=False, server_default='0')
+
+
+# профили загрузки связей заказа для сериализации в schemas.Order,
+# без них каждый заказ догружает магазин и товары отдельными запросами;
+# магазины в основной базе, а заказы могут быть в шарде, поэтому магазин
+# всегда загружается отдельным запросом
+# список заказов читается без ORM, см. api.handlers.order.order_rows
+ORDER_LOAD_PROFILES = {
+    # один заказ: товары в том же запросе
+    'detail': (selectinload(Order.shop), joinedload(Order.items)),
+}
 
 
 class AuthLog(BaseModel):
@@ -221,14 +498,56 @@ class ActiveTokens(BaseModel):
     """Класс для хранения активных сессий."""
 
     __tablename__ = 'active_tokens'
+    __table_args__ = (
+        Index('ix_active_tokens_user_id_refresh_expired', 'user_id',
+              'refresh_expired_date'),
+        # очистка истекших сессий, см. common.retention
+        Index('ix_active_tokens_refresh_expired_date',
+              'refresh_expired_date'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)  # noqa: A003
     access_id = Column(String)
     access_expired_date = Column(Integer)
-    refresh_id = Column(String)
+    refresh_id = Column(String, index=True)
     refresh_expired_date = Column(Integer)
     user_agent = Column(String)
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'))
     region = Column(String)
     agent = Column(String)
     platform = Column(String)
+
+
+# запросы горячих путей: пользователь из токена, заказ, адрес и карта по
+# умолчанию, сессия при ее прекращении
+USER_BY_ID = prebuilt(select(User).where(User.id == bindparam('user_id')))
+ORDER_BY_ID = {
+    profile: prebuilt(select(Order)
+                      .where(Order.user_id == bindparam('user_id'),
+                             Order.id == bindparam('order_id'))
+                      .options(*options))
+    for profile, options in {None: (), **ORDER_LOAD_PROFILES}.items()}
+ARCHIVED_ORDER_BY_ID = prebuilt(
+    select(ArchivedOrder)
+    .where(ArchivedOrder.user_id == bindparam('user_id'),
+           ArchivedOrder.id == bindparam('order_id')))
+# магазин архивного заказа, как и при загрузке связей, может быть удален
+SHOP_BY_ID = (select(Shop).where(Shop.id == bindparam('shop_id'))
+              .execution_options(include_deleted=True))
+ADDRESS_BY_ID = prebuilt(select(Address)
+                         .where(Address.id == bindparam('address_id')))
+CARD_BY_ID = prebuilt(select(Card).where(Card.id == bindparam('card_id')))
+# версия заказа и его магазин для ETag, заказ может быть в архиве; мягкого
+# удаления у заказов нет, поэтому запрос не дополняется в hide_deleted
+ORDER_VERSION = union_all(*(
+    select(model.version, model.shop_id)
+    .where(model.user_id == bindparam('user_id'),
+           model.id == bindparam('order_id'))
+    for model in (Order, ArchivedOrder))).execution_options(prebuilt=True)
+# версия магазина, встроенного в заказ; удаленный магазин заказ тоже видит
+SHOP_VERSION = select(Shop.version).where(
+    Shop.id == bindparam('shop_id')).execution_options(prebuilt=True)
+SESSION_BY_REFRESH_ID = prebuilt(
+    select(ActiveTokens)
+    .where(ActiveTokens.refresh_id == bindparam('refresh_id'),
+           ActiveTokens.user_id == bindparam('user_id')))
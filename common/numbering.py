@@ -0,0 +1,70 @@
+"""
+Выдача номеров заказов магазина.
+
+У каждого магазина своя последовательность в Postgres с шагом в размер
+блока: одно обращение к последовательности резервирует за процессом блок
+номеров, которые дальше выдаются из памяти без запросов к БД. Несколько
+процессов получают разные блоки, уникальность номера в магазине
+дополнительно проверяет ограничение orders_shop_id_number_key.
+
+Неиспользованные номера блока теряются при перезапуске процесса, поэтому
+номера растут, но не обязательно подряд.
+"""
+import threading
+
+from sqlalchemy.exc import IntegrityError
+
+from common.database import engine
+from common.settings import settings
+
+
+def sequence_name(shop_id: int) -> str:
+    """Имя последовательности номеров заказов магазина."""
+    return f'order_numbers_{int(shop_id)}'
+
+
+class OrderNumberAllocator:
+    """Кэш зарезервированных блоков номеров по магазинам."""
+
+    def __init__(self, bind=engine,
+                 block_size: int = settings.order_number_block_size):
+        """Пустой кэш, блоки резервируются при первом заказе магазина."""
+        self.bind = bind
+        self.block_size = block_size
+        self.blocks = {}  # магазин: (следующий номер, конец блока)
+        self.lock = threading.Lock()
+
+    def allocate(self, shop_id: int) -> int:
+        """Следующий номер заказа магазина."""
+        with self.lock:
+            number, end = self.blocks.get(shop_id, (0, 0))
+            if number >= end:
+                number, end = self.reserve(shop_id)
+            self.blocks[shop_id] = (number + 1, end)
+            return number
+
+    def reserve(self, shop_id: int) -> tuple:
+        """
+        Резервирование блока номеров одним обращением к БД.
+
+        Последовательность создается при первом заказе магазина, размер
+        блока берется из нее, а не из настроек, чтобы процессы с разными
+        настройками не получили пересекающиеся блоки.
+        """
+        name = sequence_name(shop_id)
+        statement = (
+            f'CREATE SEQUENCE IF NOT EXISTS {name} '
+            f'INCREMENT BY {self.block_size}; '
+            f"SELECT nextval('{name}'), increment_by FROM pg_sequences "
+            f"WHERE sequencename = '{name}'")
+        try:
+            with self.bind.begin() as connection:
+                start, size = connection.exec_driver_sql(statement).one()
+        except IntegrityError:
+            # последовательность одновременно создал другой процесс
+            with self.bind.begin() as connection:
+                start, size = connection.exec_driver_sql(statement).one()
+        return start, start + size
+
+
+order_numbers = OrderNumberAllocator()
@@ -0,0 +1,174 @@
+"""
+Секционирование заказов и товаров по месяцам.
+
+Миграции создают обычные таблицы, секционирование включается отдельно
+командой python -m common.partitioning на схеме последней ревизии во всех
+шардах. python -m common.partitioning plain возвращает обычные таблицы,
+например перед откатом миграций. Таблица orders секционируется по дате заказа,
+items по дате заказа, скопированной в order_date, поэтому товары заказа
+лежат в секции того же месяца. Строки без даты попадают в секцию DEFAULT.
+
+Первичный ключ секционированной таблицы обязан включать ключ секционирования,
+а дата может быть пустой, поэтому вместо PRIMARY KEY используется
+UNIQUE (id, дата), на него же ссылается внешний ключ товаров. По той же
+причине в секционированной таблице нет ограничения уникальности номера
+заказа в магазине, уникальность обеспечивают последовательности
+common.numbering.
+"""
+import argparse
+from datetime import date, datetime
+
+from sqlalchemy import text
+from sqlalchemy.schema import (AddConstraint, CreateIndex,
+                               ForeignKeyConstraint, UniqueConstraint)
+
+from common.settings import settings
+
+# таблица: колонка секционирования
+PARTITIONED_TABLES = {'orders': 'date', 'items': 'order_date'}
+
+
+def add_months(day: date, months: int) -> date:
+    """Первое число месяца через months месяцев от day."""
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    """Имя секции таблицы за месяц."""
+    return f'{table}_{month:%Y_%m}'
+
+
+def is_partitioned(connection, table: str = 'orders') -> bool:
+    """Проверка что таблица уже секционирована."""
+    return connection.execute(
+        text("SELECT relkind = 'p' FROM pg_class WHERE relname = :table"),
+        {'table': table}).scalar() or False
+
+
+def create_partition(connection, table: str, month: date):
+    """Создание секции таблицы за месяц, если ее еще нет."""
+    connection.execute(text(
+        f'CREATE TABLE IF NOT EXISTS {partition_name(table, month)} '
+        f'PARTITION OF {table} FOR VALUES '
+        f"FROM ('{month}') TO ('{add_months(month, 1)}')"))
+
+
+def ensure_partitions(connection, since: date = None,
+                      months_ahead: int = settings.db_partitions_ahead):
+    """
+    Создание секций с месяца since до months_ahead месяцев вперед.
+
+    Запускается периодической задачей, чтобы новые заказы никогда не
+    попадали в секцию DEFAULT.
+    """
+    current = add_months(since or datetime.now().date(), 0)
+    last = add_months(datetime.now().date(), months_ahead)
+    while current <= last:
+        for table in PARTITIONED_TABLES:
+            create_partition(connection, table, current)
+        current = add_months(current, 1)
+
+
+def model_ddl(partitioned: bool) -> list:
+    """
+    Индексы и ограничения orders и items по текущему описанию моделей.
+
+    Ссылка товаров на заказ зависит от схемы и создается отдельно,
+    ограничения уникальности без ключа секционирования создаются только в
+    обычных таблицах.
+    """
+    from common.models import Item, Order
+
+    statements = []
+    for model in (Order, Item):
+        statements.extend(CreateIndex(index)
+                          for index in model.__table__.indexes)
+        statements.extend(
+            AddConstraint(constraint)
+            for constraint in model.__table__.constraints
+            if isinstance(constraint, ForeignKeyConstraint)
+            and constraint.referred_table.name != 'orders'
+            or isinstance(constraint, UniqueConstraint) and not partitioned)
+    return statements
+
+
+def convert_to_partitioned(connection):
+    """
+    Перенос orders и items в секционированные таблицы.
+
+    Выполняется в одной транзакции: старые таблицы переименовываются,
+    данные копируются в новые, после чего заново создаются внешние ключи
+    и индексы.
+    """
+    since = connection.execute(text('SELECT min(date) FROM orders')).scalar()
+    for table, column in PARTITIONED_TABLES.items():
+        _rename_legacy(connection, table)
+        connection.execute(text(
+            f'CREATE TABLE {table} (LIKE {table}_legacy INCLUDING DEFAULTS, '
+            f'CONSTRAINT {table}_id_{column}_key UNIQUE (id, {column})) '
+            f'PARTITION BY RANGE ({column})'))
+        connection.execute(text(f'CREATE TABLE {table}_default '
+                                f'PARTITION OF {table} DEFAULT'))
+    ensure_partitions(connection, since=since.date() if since else None)
+    _copy_from_legacy(connection, model_ddl(True))
+    connection.execute(text(
+        'ALTER TABLE items ADD CONSTRAINT items_order_id_order_date_fkey '
+        'FOREIGN KEY (order_id, order_date) '
+        'REFERENCES orders (id, date)'))
+
+
+def convert_to_plain(connection):
+    """Обратный перенос в обычные таблицы с первичным ключом по id."""
+    for table in PARTITIONED_TABLES:
+        _rename_legacy(connection, table)
+        connection.execute(text(
+            f'CREATE TABLE {table} (LIKE {table}_legacy INCLUDING DEFAULTS, '
+            f'PRIMARY KEY (id))'))
+    _copy_from_legacy(connection, model_ddl(False))
+    connection.execute(text(
+        'ALTER TABLE items ADD CONSTRAINT items_order_id_fkey '
+        'FOREIGN KEY (order_id) REFERENCES orders (id)'))
+
+
+def _rename_legacy(connection, table: str):
+    """Переименование текущей таблицы перед копированием данных."""
+    connection.execute(text(f'ALTER TABLE {table} RENAME TO {table}_legacy'))
+
+
+def _copy_from_legacy(connection, ddl: list):
+    """
+    Копирование данных из старых таблиц и их удаление.
+
+    Индексы и ограничения ddl создаются после загрузки данных, это быстрее
+    и освобождает имена индексов старых таблиц.
+    """
+    for table in PARTITIONED_TABLES:
+        connection.execute(text(
+            f'INSERT INTO {table} SELECT * FROM {table}_legacy'))
+        connection.execute(text(
+            f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id"))
+    for table in reversed(list(PARTITIONED_TABLES)):
+        connection.execute(text(f'DROP TABLE {table}_legacy'))
+    for statement in ddl:
+        connection.execute(statement)
+
+
+if __name__ == '__main__':
+    from common.database import shards
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('command', nargs='?', default='partition',
+                        choices=('partition', 'plain'))
+    args = parser.parse_args()
+    for shard, bind in enumerate(shards.engines):
+        with bind.begin() as conn:
+            if args.command == 'plain':
+                if is_partitioned(conn):
+                    convert_to_plain(conn)
+            else:
+                if not is_partitioned(conn):
+                    convert_to_partitioned(conn)
+                ensure_partitions(conn)
+        print(f'shard {shard}: {args.command}')
@@ -0,0 +1,92 @@
+"""
+Очистка истекших сессий.
+
+Строка active_tokens создается при входе и обновляется на месте при
+обновлении токенов, после истечения refresh токена она больше не нужна.
+Периодическая задача удаляет такие строки пачками, каждая пачка в своей
+транзакции, поэтому блокировки держатся недолго, а автовакуум успевает
+за удалением. Итоги запусков хранятся в Redis для мониторинга:
+
+    python -m common.retention
+"""
+from datetime import datetime
+
+import redis
+from sqlalchemy import text
+
+from common.database import engine
+from common.settings import settings
+
+PURGE_SQL = text("""
+    DELETE FROM active_tokens WHERE id IN (
+        SELECT id FROM active_tokens WHERE refresh_expired_date < :now
+        LIMIT :batch_size FOR UPDATE SKIP LOCKED)
+""")
+TABLE_SIZE_SQL = text("""
+    SELECT pg_total_relation_size(oid), reltuples::bigint
+    FROM pg_class WHERE relname = 'active_tokens'
+""")
+STATS_KEY = 'retention-active-tokens'
+
+
+def purge_expired_sessions(
+        bind=engine, now: int = None,
+        batch_size: int = settings.session_purge_batch_size) -> int:
+    """
+    Удаление сессий с истекшим refresh токеном.
+
+    :param now: момент времени в секундах, по умолчанию текущий
+    :return: количество удаленных строк
+    """
+    now = now or int(datetime.now().timestamp())
+    total = 0
+    while True:
+        with bind.begin() as connection:
+            purged = connection.execute(
+                PURGE_SQL, {'now': now, 'batch_size': batch_size}).rowcount
+        total += purged
+        if purged < batch_size:
+            return total
+
+
+def get_table_size(bind=engine) -> dict:
+    """Размер таблицы с индексами и оценка количества строк."""
+    with bind.connect() as connection:
+        size, rows = connection.execute(TABLE_SIZE_SQL).one()
+    return {'table_bytes': size, 'rows_estimate': max(rows, 0)}
+
+
+def get_redis() -> redis.Redis:
+    """Подключение к Redis для статистики очистки."""
+    return redis.Redis(host=settings.redis_host, port=settings.redis_port,
+                       db=settings.redis_db, decode_responses=True)
+
+
+def save_stats(purged: int, size: dict):
+    """Сохранение итогов запуска очистки."""
+    pipe = get_redis().pipeline()
+    pipe.hincrby(STATS_KEY, 'purged_total', purged)
+    pipe.hset(STATS_KEY, mapping={'last_purged': purged,
+                                  'last_run': datetime.now().isoformat(),
+                                  **size})
+    pipe.execute()
+
+
+def get_stats() -> dict:
+    """Итоги последнего запуска очистки и текущий размер таблицы."""
+    stats = get_redis().hgetall(STATS_KEY)
+    for key in ('purged_total', 'last_purged'):
+        stats[key] = int(stats.get(key, 0))
+    stats.update(get_table_size())
+    return stats
+
+
+def run() -> int:
+    """Очистка с сохранением статистики, для периодической задачи."""
+    purged = purge_expired_sessions()
+    save_stats(purged, get_table_size())
+    return purged
+
+
+if __name__ == '__main__':
+    print(f'{run()} sessions purged')
@@ -0,0 +1,102 @@
+"""
+Дневные итоги заказов магазинов.
+
+В shop_daily_stats для магазина, дня заказа и статуса хранится количество
+заказов и суммы их цен. Задачи worker.tasks меняют итоги в той же
+транзакции, что и заказ: при создании заказа прибавляется строка его
+статуса, при смене статуса заказ переносится из строки старого статуса в
+строку нового. Статистика магазина читается за O(дней), без чтения orders.
+Архив итоги не меняет. Пересчет итогов по orders и orders_archive во всех
+шардах, например после переноса магазина или ручной правки заказов:
+
+    python -m common.rollups rebuild [--shop SHOP_ID]
+"""
+import argparse
+from datetime import date
+
+from sqlalchemy import select, text
+
+from common.database import DataBase, shards
+from common.models import Order, OrderStatuses, ShopDailyStats
+
+KEY_COLUMNS = ['shop_id', 'day', 'status']
+SUMMED = ('total_price', 'order_sum', 'delivery_price', 'discount')
+STATS_COLUMNS = ', '.join(KEY_COLUMNS + ['orders_count', *SUMMED])
+ORDER_COLUMNS = ', '.join(['shop_id', 'date', 'status', *SUMMED])
+
+CLEAR_SQL = text("""
+    DELETE FROM shop_daily_stats
+    WHERE CAST(:shop_id AS integer) IS NULL OR shop_id = :shop_id
+""")
+# заказ попадает в итоги, когда задача создания проставила ему дату
+REBUILD_SQL = text(f"""
+    INSERT INTO shop_daily_stats ({STATS_COLUMNS})
+    SELECT shop_id, date::date, status, count(*),
+        {', '.join(f'COALESCE(sum({key}), 0)' for key in SUMMED)}
+    FROM (SELECT {ORDER_COLUMNS} FROM orders
+          UNION ALL SELECT {ORDER_COLUMNS} FROM orders_archive) AS orders
+    WHERE date IS NOT NULL AND status IS NOT NULL AND shop_id IS NOT NULL
+        AND (CAST(:shop_id AS integer) IS NULL OR shop_id = :shop_id)
+    GROUP BY shop_id, date::date, status
+""")
+
+
+def order_totals(order: Order, sign: int = 1,
+                 status: OrderStatuses = None) -> dict:
+    """Вклад заказа в строку итогов, sign -1 для вычитания."""
+    return {'shop_id': order.shop_id, 'day': order.date.date(),
+            'status': status or order.status, 'orders_count': sign,
+            **{key: sign * (getattr(order, key) or 0) for key in SUMMED}}
+
+
+def add_order(db: DataBase, order: Order):
+    """
+    Учет созданного заказа в итогах его магазина.
+
+    Выполняется в шарде заказа, изменения фиксирует save() вместе с заказом.
+    """
+    if order.date is not None:
+        db.bulk_increment(ShopDailyStats, [order_totals(order)], KEY_COLUMNS)
+
+
+def move_order(db: DataBase, order: Order, old_status: OrderStatuses):
+    """Перенос заказа в итогах из строки old_status в строку его статуса."""
+    if order.date is None or old_status == order.status:
+        return
+    db.bulk_increment(ShopDailyStats, [order_totals(order, -1, old_status),
+                                       order_totals(order)], KEY_COLUMNS)
+
+
+def shop_stats(shop_id: int, date_from: date = None, date_to: date = None):
+    """Запрос итогов магазина по дням и статусам за период."""
+    conditions = [ShopDailyStats.shop_id == shop_id]
+    if date_from:
+        conditions.append(ShopDailyStats.day >= date_from)
+    if date_to:
+        conditions.append(ShopDailyStats.day <= date_to)
+    return (select(ShopDailyStats.__table__).where(*conditions)
+            .order_by(ShopDailyStats.day, ShopDailyStats.status))
+
+
+def rebuild(bind, shop_id: int = None):
+    """
+    Пересчет итогов базы bind, всех магазинов или одного.
+
+    Удаленные строки блокируются до конца транзакции, поэтому задачи,
+    меняющие те же итоги, ждут окончания пересчета.
+    """
+    with bind.begin() as connection:
+        connection.execute(CLEAR_SQL, {'shop_id': shop_id})
+        connection.execute(REBUILD_SQL, {'shop_id': shop_id})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    rebuild_parser = commands.add_parser('rebuild')
+    rebuild_parser.add_argument('--shop', type=int)
+    args = parser.parse_args()
+    for shard, bind in enumerate(shards.engines):
+        rebuild(bind, args.shop)
+        print(f'shard {shard}: rebuilt')
@@ -1,8 +1,9 @@
 """Схемы вылидации моделей проекта."""
 import re
 from typing import List, Optional
+from uuid import UUID
 
-from pydantic import BaseModel, EmailStr, Field, validator, UUID4
+from pydantic import BaseModel, EmailStr, Field, validator
 from pydantic.schema import date
 
 from common.models import OrderStatuses
@@ -18,7 +19,7 @@ class UserCreate(BaseModel):
 class User(UserCreate):
     """Класс работы с моделью Пользователя из БД."""
 
-    id: Optional[UUID4] = None  # noqa: A003
+    id: Optional[UUID] = None  # noqa: A003
     name: Optional[str]
     lastname: Optional[str]
     birthday: Optional[date]
@@ -116,6 +117,18 @@ class ShopUpdate(BaseModel):
         assert v is not None, _('none_field_error')  # noqa: S101
 
 
+class ShopDailyStats(BaseModel):
+    """Итоги заказов магазина за день в одном статусе."""
+
+    day: date
+    status: str
+    orders_count: int
+    total_price: int
+    order_sum: int
+    delivery_price: int
+    discount: int
+
+
 class CardCreate(BaseModel):
     """Валидация создания Карты."""
 
@@ -180,9 +193,8 @@ class Item(ItemCreate):
 
 
 class OrderCreate(BaseModel):
-    """Валидация для создания заказа."""
+    """Валидация для создания заказа, номер выдается сервисом."""
 
-    number: int
     order_sum: int
     total_price: int
     delivery_price: int
@@ -195,6 +207,7 @@ class Order(OrderCreate):
     """Модель для работы с заказом из БД."""
 
     id: int  # noqa: A003
+    number: int
     shop: Shop
     items: Optional[List[Item]]
     date: date
@@ -225,12 +238,12 @@ class OrderOut(BaseModel):
     """Поля для ответа на запрос создания заказа."""
 
     order_id: int
+    number: int
 
 
 class ErrorResponse(BaseModel):
     """Поля для ответа на запрос создания заказа 400 ошибкой."""
 
-    order_id: int
     error: str
 
 
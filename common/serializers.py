@@ -0,0 +1,80 @@
+"""
+Сериализация объектов ORM по схемам ответов без валидации.
+
+from_orm заново проверяет данные, которые пришли из нашей же БД. Здесь
+по полям схемы один раз при импорте генерируется функция, которая читает
+атрибуты объекта и сразу собирает словарь с полями схемы. Вложенные схемы
+сериализуются своими функциями, даты приводятся к типу поля и кодируются
+json_encoders верхней схемы, как в BaseModel.json(), поэтому
+FastJSONResponse из словаря дает тот же JSON, что и Schema.from_orm(obj).
+Типы остальных значений не проверяются, они должны совпадать с колонками.
+"""
+from datetime import date, datetime
+from typing import Callable
+
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON
+
+from common import schemas
+
+
+def to_date(value):
+    """Дата из даты со временем, как при проверке поля типа date."""
+    return value.date() if isinstance(value, datetime) else value
+
+
+def find_encoder(encoders: dict, type_):
+    """Кодировщик json_encoders для типа поля, с учетом базовых классов."""
+    for base in getattr(type_, '__mro__', ()):
+        if base in encoders:
+            return encoders[base]
+    return None
+
+
+def compile_serializer(schema, encoders: dict = None) -> Callable:
+    """
+    Функция сериализации объекта ORM или строки Row по схеме.
+
+    :param encoders: json_encoders, по умолчанию из настроек схемы
+    """
+    if encoders is None:
+        encoders = schema.__config__.json_encoders
+    namespace = {'to_date': to_date}
+    reads, items = [], []
+    for name, field in schema.__fields__.items():
+        type_ = field.type_
+        if isinstance(type_, type) and issubclass(type_, BaseModel):
+            namespace[f'serialize_{name}'] = compile_serializer(type_,
+                                                                encoders)
+            if field.shape == SHAPE_LIST:
+                value = f'[serialize_{name}(each) for each in _{name}]'
+            elif field.shape == SHAPE_SINGLETON:
+                value = f'serialize_{name}(_{name})'
+            else:
+                raise TypeError(f'{schema.__name__}.{name}: {field.shape}')
+        else:
+            encoder = find_encoder(encoders, type_)
+            if type_ is not date and encoder is None:
+                items.append(f'{name!r}: obj.{field.alias}')
+                continue
+            value = f'to_date(_{name})' if type_ is date else f'_{name}'
+            if encoder is not None:
+                namespace[f'encode_{name}'] = encoder
+                value = f'encode_{name}({value})'
+        reads.append(f'    _{name} = obj.{field.alias}')
+        items.append(f'{name!r}: None if _{name} is None else {value}')
+    source = '\n'.join([
+        'def serialize(obj):', *reads,
+        '    return {' + ', '.join(items) + '}'])
+    exec(source, namespace)  # noqa: S102
+    serialize = namespace['serialize']
+    serialize.__doc__ = f'Сериализация по схеме {schema.__name__}.'
+    serialize.__source__ = source
+    return serialize
+
+
+serialize_address = compile_serializer(schemas.Address)
+serialize_card = compile_serializer(schemas.Card)
+serialize_shop = compile_serializer(schemas.Shop)
+serialize_order = compile_serializer(schemas.Order)
+serialize_user = compile_serializer(schemas.User)
@@ -1,5 +1,6 @@
 """Настройки для проекта."""
 from datetime import timedelta
+from typing import List
 
 from pydantic import BaseSettings
 from fastapi_jwt_auth import AuthJWT
@@ -18,6 +19,54 @@ class Settings(BaseSettings):
     redis_port: int = 6379
     redis_db: int = 0
 
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: int = 30
+    db_pool_recycle: int = 30 * 60
+    db_pool_pre_ping: bool = True
+
+    db_replica_urls: List[str] = []
+    db_replica_balance: str = 'round_robin'  # или least_connections
+    db_replica_max_lag: float = 5
+    db_replica_check_interval: int = 5
+
+    # кеш скомпилированных запросов SQLAlchemy на каждый движок
+    db_statement_cache_size: int = 500
+    # подготовленные на сервере запросы asyncpg, на каждое соединение
+    db_prepared_statement_cache_size: int = 100
+    # PgBouncer в режиме transaction: подготовленные запросы отключаются
+    db_pgbouncer: bool = False
+
+    db_bulk_chunk_size: int = 1000
+    db_copy_threshold: int = 1000
+
+    # шарды для заказов, товаров и авторизаций, основная база - шард 0
+    db_shard_urls: List[str] = []
+    db_shard_cache_ttl: int = 60
+
+    db_partitions_ahead: int = 3
+
+    # завершенные и отмененные заказы старше срока переносятся в архив
+    order_archive_after_days: int = 180
+    order_archive_batch_size: int = 1000
+    # выгрузка заказов читается серверным курсором пачками такого размера
+    order_export_chunk_size: int = 500
+
+    # размер блока номеров заказов, резервируемого процессом за один запрос
+    order_number_block_size: int = 100
+
+    # ответы меньше порога в байтах не сжимаются
+    compression_minimum_size: int = 1024
+    compression_gzip_level: int = 6
+    compression_zstd_level: int = 3
+
+    sql_stats_enabled: bool = True
+    sql_slow_query_ms: int = 200
+    sql_n_plus_one_threshold: int = 10
+
+    # сессии с истекшим refresh токеном удаляются пачками
+    session_purge_batch_size: int = 1000
+
     sms_counts: int = 3
     time_limit: int = 5
 
@@ -0,0 +1,219 @@
+"""
+Шарды с заказами магазинов.
+
+Таблицы SHARDED_TABLES в шардах создаются без внешних ключей на таблицы
+основной базы, идентификаторы шарда N начинаются с N * SHARD_ID_STEP.
+
+Схемы шардов из DB_SHARD_URLS мигрируются вместе с основной базой:
+
+    alembic upgrade head
+
+У каждого шарда своя таблица alembic_version, история шарда начинается с
+SHARDS_REVISION. Ревизии видят, где они выполняются, через migrating_shard,
+и в шарде меняют только таблицы SHARDED_TABLES. Шард без alembic_version
+перед миграцией создается из текущих моделей, или, если таблицы уже есть,
+отмечается ревизией SHARDS_REVISION. SQL в режиме --sql строится только для
+основной базы. Создание новых шардов без миграции основной базы:
+
+    python -m common.sharding init
+
+Перенос магазина в другой шард:
+
+    python -m common.sharding move SHOP_ID SHARD
+"""
+import argparse
+import time
+
+from alembic import op
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import delete, inspect, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from common.database import SHARD_ID_STEP, SHARDED_TABLES, engine, shards
+from common.models import (ArchivedOrder, AuthLog, Item, Order, Shop,
+                           ShopDailyStats)
+from common.partitioning import PARTITIONED_TABLES, is_partitioned
+from common.rollups import rebuild
+from common.settings import settings
+
+# в порядке создания: товары ссылаются на заказы
+SHARDED_MODELS = (Order, Item, AuthLog, ArchivedOrder, ShopDailyStats)
+# ревизия, в которой появились шарды, более ранние в шардах не выполняются
+SHARDS_REVISION = 'f2c5a8d3b6e4'
+
+
+def create_shard_tables(connection, shard: int):
+    """Создание таблиц шарда, существующие таблицы пропускаются."""
+    Order.__table__.c.status.type.create(connection, checkfirst=True)
+    for model in SHARDED_MODELS:
+        table = model.__table__
+        if inspect(connection).has_table(table.name):
+            continue
+        connection.execute(CreateTable(
+            table, include_foreign_key_constraints=[
+                constraint for constraint in table.foreign_key_constraints
+                if constraint.referred_table.name in SHARDED_TABLES]))
+        for index in table.indexes:
+            connection.execute(CreateIndex(index))
+        # параметры хранения таблицы, см. ArchivedOrder
+        table.dispatch.after_create(table, connection)
+        if 'id' not in table.c:
+            continue
+        connection.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f'{shard * SHARD_ID_STEP})'))
+
+
+def prepare_shard(connection, shard: int, script: ScriptDirectory):
+    """
+    Подготовка шарда без alembic_version к миграции.
+
+    Пустой шард создается из текущих моделей и отмечается последней
+    ревизией. Шард, созданный командой init до миграций шардов, отмечается
+    SHARDS_REVISION: его таблицы не старше нее, а ревизии после нее не
+    создают в шарде то, что уже есть.
+    """
+    context = MigrationContext.configure(connection)
+    if context.get_current_heads():
+        return
+    if inspect(connection).has_table('orders'):
+        context.stamp(script, SHARDS_REVISION)
+    else:
+        create_shard_tables(connection, shard)
+        context.stamp(script, 'heads')
+
+
+def migrating_shard() -> bool:
+    """Выполняется ли ревизия Alembic в шарде, см. migrations/env.py."""
+    return op.get_context().opts.get('shard', 0) != 0
+
+
+def created_in_shard(table: str) -> bool:
+    """Таблица уже создана в шарде командой init по моделям."""
+    return migrating_shard() and inspect(op.get_bind()).has_table(table)
+
+
+def get_shop_rows(model, shop_id: int):
+    """Условие выборки строк модели, принадлежащих магазину."""
+    orders = Order.__table__
+    if model is Item:
+        return Item.__table__.c.order_id.in_(
+            select(orders.c.id).where(orders.c.shop_id == shop_id))
+    return model.__table__.c.shop_id == shop_id
+
+
+def conflict_target(connection, table) -> list:
+    """
+    Колонки, по которым повторно скопированная строка заменяет старую.
+
+    В секционированных orders и items нет первичного ключа, только
+    UNIQUE (id, дата), см. common.partitioning.
+    """
+    column = PARTITIONED_TABLES.get(table.name)
+    if column is not None and is_partitioned(connection, table.name):
+        return [table.c.id, table.c[column]]
+    return list(table.primary_key.columns)
+
+
+def copy_rows(reader, shop_id: int, target: int):
+    """
+    Копирование строк магазина из соединения reader в шард target.
+
+    Уже скопированные строки обновляются, поэтому копирование можно
+    повторять для записей, сделанных во время переноса.
+    """
+    with shards.engines[target].begin() as writer:
+        for model in SHARDED_MODELS:
+            table = model.__table__
+            target_columns = conflict_target(writer, table)
+            partition = target_columns[1:]
+            result = reader.execution_options(stream_results=True).execute(
+                select(table).where(get_shop_rows(model, shop_id)))
+            for rows in result.mappings().partitions(
+                    settings.db_bulk_chunk_size):
+                if partition:
+                    # NULL в UNIQUE не совпадает ни с чем, поэтому копия
+                    # строки, скопированной до заполнения даты, удаляется
+                    writer.execute(delete(table).where(
+                        table.c.id.in_([row['id'] for row in rows]),
+                        partition[0].is_(None)))
+                query = insert(table).values([dict(row) for row in rows])
+                writer.execute(query.on_conflict_do_update(
+                    index_elements=target_columns,
+                    set_={column.name: query.excluded[column.name]
+                          for column in table.columns
+                          if column not in target_columns}))
+
+
+def copy_shop(shop_id: int, source: int, target: int):
+    """Копирование строк магазина из шарда source в target."""
+    with shards.engines[source].connect() as reader:
+        copy_rows(reader, shop_id, target)
+
+
+def lock_shop(connection, shop_id: int):
+    """Блокировка строк магазина в шарде до конца транзакции."""
+    for model in SHARDED_MODELS:
+        table = model.__table__
+        connection.execute(select(*table.primary_key.columns)
+                           .where(get_shop_rows(model, shop_id))
+                           .with_for_update())
+
+
+def delete_shop(connection, shop_id: int):
+    """Удаление строк магазина из шарда."""
+    for model in reversed(SHARDED_MODELS):
+        connection.execute(delete(model.__table__)
+                           .where(get_shop_rows(model, shop_id)))
+
+
+def move_shop(shop_id: int, target: int):
+    """
+    Перенос строк магазина из таблиц SHARDED_MODELS в шард target.
+
+    Строки копируются, магазин переключается на новый шард, затем после
+    shards.cache_ttl, когда все процессы увидели переключение, записи,
+    сделанные за это время в старый шард, докопируются и он очищается.
+    Последнее копирование и удаление идут в одной транзакции старого шарда
+    под блокировкой строк магазина, поэтому изменения существующих заказов
+    не теряются между ними: запись, ждавшая блокировку, уже не найдет строку
+    в старом шарде.
+    """
+    shops = Shop.__table__
+    with engine.connect() as connection:
+        source = connection.execute(
+            select(shops.c.shard).where(shops.c.id == shop_id)).scalar()
+    if source is None or source == target:
+        return
+    copy_shop(shop_id, source, target)
+    with engine.begin() as connection:
+        connection.execute(update(shops).where(shops.c.id == shop_id)
+                           .values(shard=target))
+    time.sleep(shards.cache_ttl)
+    with shards.engines[source].begin() as connection:
+        lock_shop(connection, shop_id)
+        copy_rows(connection, shop_id, target)
+        delete_shop(connection, shop_id)
+    # повторное копирование затирает итоги, измененные в новом шарде
+    rebuild(shards.engines[target], shop_id)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('init')
+    move = commands.add_parser('move')
+    move.add_argument('shop_id', type=int)
+    move.add_argument('shard', type=int)
+    args = parser.parse_args()
+    if args.command == 'init':
+        script = ScriptDirectory.from_config(Config('alembic.ini'))
+        for number in range(1, len(shards)):
+            with shards.engines[number].begin() as connection:
+                prepare_shard(connection, number, script)
+    else:
+        move_shop(args.shop_id, args.shard)
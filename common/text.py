@@ -16,8 +16,10 @@ MESSAGES = {
     'timeout_error': 'Повторная отправка смс будет доступна через минуту',
     'auth_required': 'Требуется авторизация',
     'order_not_found': 'Заказ не найден',
+    'shop_not_found': 'Магазин не найден',
     'session_not_found': 'Сессия не найдена',
     'not_found_error': 'Раздел не найден',
+    'invalid_cursor': 'Некорректный курсор',
 }
 
 
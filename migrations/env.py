@@ -11,13 +11,16 @@ from alembic import context
 # access to the values within the .ini file in use.
 sys.path = ['', '..'] + sys.path[1:]
 from common.database import Base, SQLALCHEMY_DATABASE_URL
+from common.settings import settings
+from common.sharding import prepare_shard
 
 config = context.config
 
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-fileConfig(config.config_file_name)
+if config.attributes.get('configure_logger', True):
+    fileConfig(config.config_file_name)
 
 # add your model's MetaData object here
 # for 'autogenerate' support
@@ -31,6 +34,11 @@ from common import models  # нужно для подгрузки моделей
 # my_important_option = config.get_main_option("my_important_option")
 # ... etc.
 
+# основная база - шард 0, за ней шарды, у каждого своя alembic_version,
+# см. common.sharding
+URLS = [SQLALCHEMY_DATABASE_URL, *settings.db_shard_urls]
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -43,6 +51,8 @@ def run_migrations_offline():
     script output.
 
     """
+    # история шарда зависит от его alembic_version, поэтому SQL строится
+    # только для основной базы
     context.configure(
         url=SQLALCHEMY_DATABASE_URL,
         target_metadata=target_metadata,
@@ -54,6 +64,18 @@ def run_migrations_offline():
         context.run_migrations()
 
 
+def run_migrations(connection, shard):
+    """Миграция основной базы или шарда через соединение."""
+    context.configure(
+        connection=connection, target_metadata=target_metadata, shard=shard
+    )
+
+    with context.begin_transaction():
+        if shard:
+            prepare_shard(connection, shard, context.script)
+        context.run_migrations()
+
+
 def run_migrations_online():
     """Run migrations in 'online' mode.
 
@@ -61,22 +83,24 @@ def run_migrations_online():
     and associate a connection with the context.
 
     """
-    configuration = config.get_section(config.config_ini_section)
-    configuration['sqlalchemy.url'] = SQLALCHEMY_DATABASE_URL
+    # соединение можно передать в Config.attributes, например из тестов
+    connection = config.attributes.get('connection')
+    if connection is not None:
+        run_migrations(connection, config.attributes.get('shard', 0))
+        return
 
-    connectable = engine_from_config(
-        configuration,
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
+    configuration = config.get_section(config.config_ini_section)
+    for shard, url in enumerate(URLS):
+        configuration['sqlalchemy.url'] = url
 
-    with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata
+        connectable = engine_from_config(
+            configuration,
+            prefix="sqlalchemy.",
+            poolclass=pool.NullPool,
         )
 
-        with context.begin_transaction():
-            context.run_migrations()
+        with connectable.connect() as connection:
+            run_migrations(connection, shard)
 
 
 if context.is_offline_mode():
@@ -0,0 +1,51 @@
+"""hot query indexes
+
+Revision ID: 3f1c2b7d9e10
+Revises: a9356467c409
+Create Date: 2026-10-18 10:00:00.000000
+
+Индексы создаются через CREATE INDEX CONCURRENTLY, чтобы миграцию можно
+было накатить без блокировки записи в таблицы. CONCURRENTLY не работает
+внутри транзакции, поэтому используется autocommit_block.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2b7d9e10'
+down_revision = 'a9356467c409'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    # (имя, таблица, колонки, дополнительные параметры)
+    ('ix_orders_user_id_date', 'orders', ['user_id', 'date', 'id'], {}),
+    ('ix_orders_date_brin', 'orders', ['date'],
+     {'postgresql_using': 'brin'}),
+    ('ix_items_order_id', 'items', ['order_id'], {}),
+    ('ix_addresses_user_id', 'addresses', ['user_id'], {}),
+    ('ix_addresses_user_id_default', 'addresses', ['user_id'],
+     {'postgresql_where': sa.text('is_default')}),
+    ('ix_cards_user_id_default', 'cards', ['user_id'],
+     {'postgresql_where': sa.text('is_default')}),
+    ('ix_active_tokens_refresh_id', 'active_tokens', ['refresh_id'], {}),
+    ('ix_active_tokens_user_id_refresh_expired', 'active_tokens',
+     ['user_id', 'refresh_expired_date'], {}),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in INDEXES:
+            # прерванный CONCURRENTLY оставляет невалидный индекс
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+            op.create_index(name, table, columns, unique=False,
+                            postgresql_concurrently=True, **kwargs)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in reversed(INDEXES):
+            op.drop_index(name, table_name=table,
+                          postgresql_concurrently=True)
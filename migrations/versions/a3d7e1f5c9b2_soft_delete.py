@@ -0,0 +1,77 @@
+"""soft delete
+
+Revision ID: a3d7e1f5c9b2
+Revises: f2c5a8d3b6e4
+Create Date: 2026-10-18 20:00:00.000000
+
+Колонка deleted_at без значения по умолчанию добавляется без перезаписи
+таблиц. Индексы пересоздаются по живым строкам через CREATE INDEX
+CONCURRENTLY, как в 3f1c2b7d9e10.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from common.sharding import migrating_shard
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3d7e1f5c9b2'
+down_revision = 'f2c5a8d3b6e4'
+branch_labels = None
+depends_on = None
+
+TABLES = ['addresses', 'cards', 'shops']
+LIVE = sa.text('deleted_at IS NULL')
+DEFAULT_LIVE = sa.text('is_default AND deleted_at IS NULL')
+
+INDEXES = [
+    # (имя, таблица, колонки, дополнительные параметры)
+    ('ix_addresses_user_id_live', 'addresses', ['user_id'],
+     {'postgresql_where': LIVE}),
+    ('ix_addresses_user_id_default', 'addresses', ['user_id'],
+     {'postgresql_where': DEFAULT_LIVE}),
+    ('ix_cards_user_id_live', 'cards', ['user_id'],
+     {'postgresql_where': LIVE}),
+    ('ix_cards_user_id_default', 'cards', ['user_id'],
+     {'postgresql_where': DEFAULT_LIVE}),
+    ('ix_shops_is_active_id_live', 'shops',
+     [sa.text('is_active DESC NULLS LAST'), 'id'],
+     {'postgresql_where': LIVE}),
+]
+# индексы по всем строкам, которые заменяются индексами по живым
+OLD_INDEXES = [
+    ('ix_addresses_user_id', 'addresses', ['user_id'], {}),
+    ('ix_addresses_user_id_default', 'addresses', ['user_id'],
+     {'postgresql_where': sa.text('is_default')}),
+    ('ix_cards_user_id', 'cards', ['user_id'], {}),
+    ('ix_cards_user_id_default', 'cards', ['user_id'],
+     {'postgresql_where': sa.text('is_default')}),
+]
+
+
+def replace_indexes(drop, create):
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in drop:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+        for name, table, columns, kwargs in create:
+            # прерванный CONCURRENTLY оставляет невалидный индекс
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+            op.create_index(name, table, columns, unique=False,
+                            postgresql_concurrently=True, **kwargs)
+
+
+def upgrade():
+    if migrating_shard():
+        return
+    for table in TABLES:
+        op.add_column(table, sa.Column('deleted_at', sa.DateTime(),
+                                       nullable=True))
+    replace_indexes(OLD_INDEXES, INDEXES)
+
+
+def downgrade():
+    if migrating_shard():
+        return
+    replace_indexes(INDEXES, OLD_INDEXES)
+    for table in TABLES:
+        op.drop_column(table, 'deleted_at')
@@ -0,0 +1,32 @@
+"""shop versions
+
+Revision ID: a3d8f6c1e4b7
+Revises: e9c4b1d7a2f6
+Create Date: 2026-10-19 10:00:00.000000
+
+Версия магазина для ETag заказа, в который магазин встроен.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from common.sharding import migrating_shard
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3d8f6c1e4b7'
+down_revision = 'e9c4b1d7a2f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if migrating_shard():
+        return
+    op.add_column('shops', sa.Column('version', sa.Integer(),
+                                     nullable=False, server_default='1'))
+
+
+def downgrade():
+    if migrating_shard():
+        return
+    op.drop_column('shops', 'version')
@@ -0,0 +1,30 @@
+"""orders partitioning
+
+Revision ID: b7e4d2a1c3f5
+Revises: 3f1c2b7d9e10
+Create Date: 2026-10-18 12:00:00.000000
+
+Колонка items.order_date добавляется и заполняется датой заказа. Перенос
+orders и items в секционированные по месяцам таблицы в миграцию не входит
+и выполняется командой python -m common.partitioning.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4d2a1c3f5'
+down_revision = '3f1c2b7d9e10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('items', sa.Column('order_date', sa.DateTime(),
+                                     nullable=True))
+    op.execute('UPDATE items SET order_date = orders.date FROM orders '
+               'WHERE items.order_id = orders.id')
+
+
+def downgrade():
+    op.drop_column('items', 'order_date')
@@ -0,0 +1,59 @@
+"""orders archive
+
+Revision ID: b8e2d4f6a1c3
+Revises: a3d7e1f5c9b2
+Create Date: 2026-10-18 21:00:00.000000
+
+Таблица архива заказов, см. common.archive. Тип statuses уже существует.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from common.sharding import created_in_shard
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e2d4f6a1c3'
+down_revision = 'a3d7e1f5c9b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if created_in_shard('orders_archive'):
+        return
+    op.create_table(
+        'orders_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('number', sa.Integer(), nullable=True),
+        sa.Column('status', postgresql.ENUM(
+            'NEW', 'CREATED', 'HANDLING', 'COMPLETED', 'CANCELED',
+            name='statuses', create_type=False), nullable=True),
+        sa.Column('total_price', sa.Integer(), nullable=True),
+        sa.Column('order_sum', sa.Integer(), nullable=True),
+        sa.Column('delivery_price', sa.Integer(), nullable=True),
+        sa.Column('discount', sa.Integer(), nullable=True),
+        sa.Column('date', sa.DateTime(), nullable=True),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('shop_id', sa.Integer(), nullable=True),
+        sa.Column('card_id', sa.Integer(), nullable=True),
+        sa.Column('address_id', sa.Integer(), nullable=True),
+        sa.Column('items', postgresql.JSONB(), nullable=False,
+                  server_default=sa.text("'[]'")),
+        sa.Column('archived_at', sa.DateTime(), nullable=False,
+                  server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.execute('ALTER TABLE orders_archive SET (toast_tuple_target = 128)')
+    op.create_index('ix_orders_archive_user_id_date', 'orders_archive',
+                    ['user_id', 'date', 'id'], unique=False)
+    op.create_index('ix_orders_archive_date_brin', 'orders_archive',
+                    ['date'], unique=False, postgresql_using='brin')
+
+
+def downgrade():
+    op.drop_index('ix_orders_archive_date_brin', table_name='orders_archive')
+    op.drop_index('ix_orders_archive_user_id_date',
+                  table_name='orders_archive')
+    op.drop_table('orders_archive')
@@ -0,0 +1,39 @@
+"""active tokens retention
+
+Revision ID: c4f1a7e9d2b5
+Revises: b8e2d4f6a1c3
+Create Date: 2026-10-18 22:00:00.000000
+
+Индекс для очистки истекших сессий, см. common.retention. Создается
+через CREATE INDEX CONCURRENTLY, как в 3f1c2b7d9e10.
+"""
+from alembic import op
+
+from common.sharding import migrating_shard
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f1a7e9d2b5'
+down_revision = 'b8e2d4f6a1c3'
+branch_labels = None
+depends_on = None
+
+INDEX = 'ix_active_tokens_refresh_expired_date'
+
+
+def upgrade():
+    if migrating_shard():
+        return
+    with op.get_context().autocommit_block():
+        # прерванный CONCURRENTLY оставляет невалидный индекс
+        op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {INDEX}')
+        op.create_index(INDEX, 'active_tokens', ['refresh_expired_date'],
+                        unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    if migrating_shard():
+        return
+    with op.get_context().autocommit_block():
+        op.drop_index(INDEX, table_name='active_tokens',
+                      postgresql_concurrently=True)
@@ -0,0 +1,46 @@
+"""user default pointers
+
+Revision ID: d4a8c6e2f1b9
+Revises: b7e4d2a1c3f5
+Create Date: 2026-10-18 14:00:00.000000
+
+Указатели users.default_address_id и users.default_card_id заполняются по
+флагу is_default. Если у пользователя несколько отмеченных строк, по
+умолчанию остается последняя, с остальных флаг снимается.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a8c6e2f1b9'
+down_revision = 'b7e4d2a1c3f5'
+branch_labels = None
+depends_on = None
+
+# (колонка указателя, таблица)
+POINTERS = [('default_address_id', 'addresses'),
+            ('default_card_id', 'cards')]
+
+
+def upgrade():
+    for column, table in POINTERS:
+        op.add_column('users', sa.Column(column, sa.Integer(), nullable=True))
+        op.create_foreign_key(f'users_{column}_fkey', 'users', table,
+                              [column], ['id'], ondelete='SET NULL')
+        op.execute(
+            f'UPDATE users SET {column} = defaults.id '
+            f'FROM (SELECT DISTINCT ON (user_id) id, user_id FROM {table} '
+            f'      WHERE is_default ORDER BY user_id, id DESC) AS defaults '
+            f'WHERE users.id = defaults.user_id')
+        op.execute(
+            f'UPDATE {table} SET is_default = false WHERE is_default '
+            f'AND id NOT IN (SELECT {column} FROM users '
+            f'               WHERE {column} IS NOT NULL)')
+
+
+def downgrade():
+    for column, table in reversed(POINTERS):
+        op.drop_constraint(f'users_{column}_fkey', 'users',
+                           type_='foreignkey')
+        op.drop_column('users', column)
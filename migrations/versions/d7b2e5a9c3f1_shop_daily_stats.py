@@ -0,0 +1,58 @@
+"""shop daily stats
+
+Revision ID: d7b2e5a9c3f1
+Revises: c4f1a7e9d2b5
+Create Date: 2026-10-18 23:00:00.000000
+
+Дневные итоги заказов магазинов, см. common.rollups. Итоги заполняются
+по существующим заказам и архиву, в шардах после создания таблиц нужен
+python -m common.rollups rebuild.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from common.sharding import created_in_shard
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7b2e5a9c3f1'
+down_revision = 'c4f1a7e9d2b5'
+branch_labels = None
+depends_on = None
+
+SUMMED = ('total_price', 'order_sum', 'delivery_price', 'discount')
+ORDER_COLUMNS = ', '.join(['shop_id', 'date', 'status', *SUMMED])
+
+
+def upgrade():
+    if created_in_shard('shop_daily_stats'):
+        return
+    op.create_table(
+        'shop_daily_stats',
+        sa.Column('shop_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('status', postgresql.ENUM(
+            'NEW', 'CREATED', 'HANDLING', 'COMPLETED', 'CANCELED',
+            name='statuses', create_type=False), nullable=False),
+        sa.Column('orders_count', sa.Integer(), nullable=False,
+                  server_default='0'),
+        *(sa.Column(key, sa.BigInteger(), nullable=False, server_default='0')
+          for key in SUMMED),
+        sa.PrimaryKeyConstraint('shop_id', 'day', 'status'),
+    )
+    op.execute(f"""
+        INSERT INTO shop_daily_stats
+            (shop_id, day, status, orders_count, {', '.join(SUMMED)})
+        SELECT shop_id, date::date, status, count(*),
+            {', '.join(f'COALESCE(sum({key}), 0)' for key in SUMMED)}
+        FROM (SELECT {ORDER_COLUMNS} FROM orders
+              UNION ALL SELECT {ORDER_COLUMNS} FROM orders_archive) AS orders
+        WHERE date IS NOT NULL AND status IS NOT NULL
+            AND shop_id IS NOT NULL
+        GROUP BY shop_id, date::date, status
+    """)
+
+
+def downgrade():
+    op.drop_table('shop_daily_stats')
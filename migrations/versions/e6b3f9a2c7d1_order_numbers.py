@@ -0,0 +1,56 @@
+"""order numbers
+
+Revision ID: e6b3f9a2c7d1
+Revises: d4a8c6e2f1b9
+Create Date: 2026-10-18 16:00:00.000000
+
+Номера заказов раньше присылал клиент, поэтому в магазине могли быть
+повторы: они перенумеровываются после максимального номера магазина.
+Для магазинов с заказами создаются последовательности, которые продолжают
+нумерацию, остальные создаются при первом заказе.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from common.numbering import sequence_name
+from common.settings import settings
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b3f9a2c7d1'
+down_revision = 'd4a8c6e2f1b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        'UPDATE orders SET number = duplicates.number '
+        'FROM (SELECT id, shop_max + row_number() '
+        '      OVER (PARTITION BY shop_id ORDER BY id) AS number '
+        '      FROM (SELECT id, shop_id, row_number() '
+        '            OVER (PARTITION BY shop_id, number ORDER BY id) '
+        '            AS position, '
+        '            max(number) OVER (PARTITION BY shop_id) AS shop_max '
+        '            FROM orders '
+        '            WHERE shop_id IS NOT NULL AND number IS NOT NULL) '
+        '      AS numbered WHERE position > 1) AS duplicates '
+        'WHERE orders.id = duplicates.id')
+    op.create_unique_constraint('orders_shop_id_number_key', 'orders',
+                                ['shop_id', 'number'])
+    shops = op.get_bind().execute(sa.text(
+        'SELECT shop_id, max(number) FROM orders '
+        'WHERE shop_id IS NOT NULL GROUP BY shop_id'))
+    for shop_id, number in shops.all():
+        op.execute(f'CREATE SEQUENCE IF NOT EXISTS {sequence_name(shop_id)} '
+                   f'INCREMENT BY {settings.order_number_block_size} '
+                   f'START WITH {(number or 0) + 1}')
+
+
+def downgrade():
+    sequences = op.get_bind().execute(sa.text(
+        "SELECT sequencename FROM pg_sequences "
+        "WHERE sequencename LIKE 'order\\_numbers\\_%'"))
+    for name in sequences.scalars().all():
+        op.execute(f'DROP SEQUENCE {name}')
+    op.drop_constraint('orders_shop_id_number_key', 'orders', type_='unique')
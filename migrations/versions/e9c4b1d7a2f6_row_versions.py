@@ -0,0 +1,40 @@
+"""row versions
+
+Revision ID: e9c4b1d7a2f6
+Revises: d7b2e5a9c3f1
+Create Date: 2026-10-18 23:30:00.000000
+
+Версии строк для ETag, см. models.VersionMixin. В шардах колонка
+добавляется только заказам, шард, созданный init после этой ревизии, уже
+с ней.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from common.sharding import migrating_shard
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9c4b1d7a2f6'
+down_revision = 'd7b2e5a9c3f1'
+branch_labels = None
+depends_on = None
+
+TABLES = ('users', 'addresses', 'cards', 'orders', 'orders_archive')
+SHARD_TABLES = ('orders', 'orders_archive')
+
+
+def upgrade():
+    if migrating_shard():
+        for table in SHARD_TABLES:
+            op.execute(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS '
+                       f'version INTEGER DEFAULT 1 NOT NULL')
+        return
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(),
+                                       nullable=False, server_default='1'))
+
+
+def downgrade():
+    for table in SHARD_TABLES if migrating_shard() else TABLES:
+        op.drop_column(table, 'version')
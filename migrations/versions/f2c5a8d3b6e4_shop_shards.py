@@ -0,0 +1,26 @@
+"""shop shards
+
+Revision ID: f2c5a8d3b6e4
+Revises: e6b3f9a2c7d1
+Create Date: 2026-10-18 18:00:00.000000
+
+Все существующие магазины остаются в основной базе (шард 0).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c5a8d3b6e4'
+down_revision = 'e6b3f9a2c7d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('shops', sa.Column('shard', sa.Integer(), nullable=False,
+                                     server_default='0'))
+
+
+def downgrade():
+    op.drop_column('shops', 'shard')
@@ -112,6 +112,25 @@ def test_get_addresses(user_token):
     assert len(addresses.json()) > 0
 
 
+def test_addresses_etag(user_token):
+    """Тест условного получения адресов по ETag."""
+    headers = {'Authorization': f'Bearer {user_token}'}
+    addresses = client.get('/api/v1/addresses', headers=headers)
+    etag = addresses.headers['ETag']
+    cached = client.get('/api/v1/addresses',
+                        headers={**headers, 'If-None-Match': f'W/{etag}'})
+    assert cached.status_code == status.HTTP_304_NOT_MODIFIED
+    assert cached.content == b''
+    # изменение адреса меняет ETag списка
+    address = addresses.json()[0]
+    client.put('/internal/v1/addresses/' + str(address['id']),
+               data=json.dumps({'floor': '7'}), headers=headers)
+    updated = client.get('/api/v1/addresses',
+                         headers={**headers, 'If-None-Match': etag})
+    assert updated.status_code == status.HTTP_200_OK
+    assert updated.headers['ETag'] != etag
+
+
 def test_delete_address(user_token):
     """Тест удаления адреса."""
     # проверяем что есть адреса для удаления
@@ -109,9 +109,12 @@ def test_refresh_token():
     old_access_token = client.cookies.get('access_token_cookie')
     old_refresh_token = client.cookies.get('refresh_token_cookie')
     headers = {'Authorization': f'Bearer {old_refresh_token}'}
+    sessions_count = len(DataBase().get_all_objects(ActiveTokens))
     refresh = client.post('/api/v1/auth/refresh', headers=headers,
                           cookies=client.cookies)
     assert refresh.status_code == status.HTTP_200_OK, refresh.json()
+    # сессия обновляется на месте, новая строка не добавляется
+    assert len(DataBase().get_all_objects(ActiveTokens)) == sessions_count
 
     assert refresh.cookies.get('access_token_cookie') != old_access_token
     assert refresh.cookies.get('refresh_token_cookie') != old_refresh_token
@@ -148,12 +151,14 @@ def test_deactivate_session():
     client.post('/api/v1/auth/sms-send',
                 data=json.dumps({'phone': '+71234567891'}))
     data = {'phone': '+71234567891', 'code': 111111}
-    client.post('/api/v1/auth/login', data=json.dumps(data))
+    login = client.post('/api/v1/auth/login', data=json.dumps(data))
 
     headers = {'Authorization':
                    f"Bearer {client.cookies.get('access_token_cookie')}"}
-    active_session_list = DataBase().get_all_objects(ActiveTokens)
-    body_request = {"refresh_id": active_session_list[3].refresh_id}
+    # при обновлении токенов строки не добавляются, ищем сессию по владельцу
+    active_session = DataBase().filter(
+        ActiveTokens, ActiveTokens.user_id == login.json()['user_id']).first()
+    body_request = {"refresh_id": active_session.refresh_id}
     deactivate_session = client.post('/internal/v1/sessions/deactivate',
                                      headers=headers, cookies=client.cookies,
                                      data=json.dumps(body_request))
@@ -0,0 +1,95 @@
+"""Тесты сжатия ответов."""
+import gzip
+
+import zstandard
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.responses import PlainTextResponse, StreamingResponse
+
+from api.compression import (CompressionMiddleware, choose_encoding,
+                             no_compression)
+
+BODY = 'заказ ' * 1000
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+
+@app.get('/large')
+def get_large():
+    """Большой ответ с ETag."""
+    return PlainTextResponse(BODY, headers={'ETag': '"1"'})
+
+
+@app.get('/small')
+def get_small():
+    """Ответ меньше порога."""
+    return PlainTextResponse('ok')
+
+
+@app.get('/stream')
+def get_stream():
+    """Потоковый ответ."""
+    return StreamingResponse(iter([BODY.encode()] * 3))
+
+
+@app.get('/plain')
+@no_compression
+def get_plain():
+    """Большой ответ маршрута без сжатия."""
+    return PlainTextResponse(BODY)
+
+
+client = TestClient(app)
+
+
+def get(path: str, encoding: str = 'gzip'):
+    """Запрос без распаковки ответа клиентом."""
+    response = client.get(path, headers={'Accept-Encoding': encoding},
+                          stream=True)
+    return response, response.raw.read(decode_content=False)
+
+
+def test_choose_encoding():
+    """Тест выбора сжатия по Accept-Encoding."""
+    assert choose_encoding('gzip, deflate') == 'gzip'
+    assert choose_encoding('gzip, zstd') == 'zstd'
+    assert choose_encoding('gzip;q=0, deflate') is None
+    assert choose_encoding('*') is not None
+    assert choose_encoding('') is None
+
+
+def test_large_response():
+    """Тест сжатия большого ответа."""
+    response, body = get('/large')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.headers['ETag'] == 'W/"1"'
+    assert int(response.headers['Content-Length']) == len(body)
+    assert gzip.decompress(body).decode() == BODY
+
+
+def test_not_compressed():
+    """Тест ответов без сжатия."""
+    for path, encoding in (('/small', 'gzip'), ('/plain', 'gzip'),
+                           ('/large', 'identity')):
+        response, _ = get(path, encoding)
+        assert 'Content-Encoding' not in response.headers
+    assert get('/plain')[1].decode() == BODY
+
+
+def test_stream():
+    """Тест сжатия потокового ответа."""
+    response, body = get('/stream')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(body).decode() == BODY * 3
+
+
+def test_zstd():
+    """Тест сжатия zstd обычного и потокового ответа."""
+    for path, expected in (('/large', BODY), ('/stream', BODY * 3)):
+        response, body = get(path, 'zstd, gzip')
+        assert response.headers['Content-Encoding'] == 'zstd'
+        reader = zstandard.ZstdDecompressor().stream_reader(body)
+        assert reader.read().decode() == expected
@@ -0,0 +1,78 @@
+"""Тесты запросов мониторинга."""
+from functools import lru_cache
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.app import app, status
+from common.database import DataBase, session_scope
+from common.models import ActiveTokens, User
+from common.retention import run as purge_expired_sessions
+from common.settings import settings
+
+client = TestClient(app)
+
+
+@pytest.fixture
+@lru_cache
+def user_token(phone='+79999999966'):
+    """Получение токена для авторизации."""
+    client.post('/api/v1/auth/sms-send', data='{"phone":"' + phone + '"}')
+    auth = client.post('/api/v1/auth/login',
+                       data='{"phone":"' + phone + '","code":111111}')
+    db = DataBase()
+    user, _ = db.get_or_create(User, phone=phone)
+    user.is_admin = True
+    db.save()
+    db.close()
+    return auth.json()['access_token']
+
+
+def test_db_pool_stats(user_token):
+    """Тест получения статистики пула соединений."""
+    stats = client.get('/internal/v1/monitoring/db/pool',
+                       headers={'Authorization': f'Bearer {user_token}'})
+    assert stats.status_code == status.HTTP_200_OK
+    stats = stats.json()
+    assert stats['size'] == settings.db_pool_size
+    assert stats['max_overflow'] == settings.db_max_overflow
+
+
+def test_sessions_are_not_shared():
+    """Тест что каждая единица работы получает свою сессию."""
+    with session_scope() as first, session_scope() as second:
+        assert first is not second
+        assert first.db is not second.db
+
+
+def test_sql_stats(user_token):
+    """Тест сбора статистики запросов к БД по маршрутам."""
+    headers = {'Authorization': f'Bearer {user_token}'}
+    profile = client.get('/internal/v1/profile/', headers=headers)
+    assert profile.headers['Server-Timing'].startswith('db;dur=')
+
+    stats = client.get('/internal/v1/monitoring/sql', headers=headers)
+    assert stats.status_code == status.HTTP_200_OK
+    route = stats.json()['GET /internal/v1/profile/']
+    assert route['requests'] >= 1
+    assert route['queries'] >= 1
+
+
+def test_sessions_retention(user_token):
+    """Тест очистки истекших сессий и ее статистики."""
+    with session_scope() as db:
+        user, _ = db.get_or_create(User, phone='+79999999966')
+        db.add(ActiveTokens(user_id=user.id, refresh_id='expired',
+                            refresh_expired_date=1))
+        db.save()
+    assert purge_expired_sessions() >= 1
+    with session_scope() as db:
+        assert db.filter(ActiveTokens,
+                         ActiveTokens.refresh_id == 'expired').first() is None
+
+    stats = client.get('/internal/v1/monitoring/retention/sessions',
+                       headers={'Authorization': f'Bearer {user_token}'})
+    assert stats.status_code == status.HTTP_200_OK
+    stats = stats.json()
+    assert stats['last_purged'] >= 1
+    assert stats['table_bytes'] > 0
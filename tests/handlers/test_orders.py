@@ -1,15 +1,19 @@
 import json
+import re
 from datetime import datetime
 from functools import lru_cache
 from unittest.mock import patch
 
+import msgpack
 import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
+from sqlalchemy import text
 
 from api.app import app
 from common.database import DataBase
 from common.models import User, Order, OrderStatuses
+from common.numbering import sequence_name
 from worker.tasks import create_order
 from common.text import get_text as _
 
@@ -19,7 +23,7 @@ client = TestClient(app)
 ITEM_DATA = {"article": "string", "name": "string",
              "price": 0, "shop_id": 1, "quantity": 0,
              "total_price": 0, "discount": 0}
-ORDER_DATA = {'number': 1, 'order_sum': 1,
+ORDER_DATA = {'order_sum': 1,
               'total_price': 1, 'delivery_price': 1,
               'discount': 1, 'items': [ITEM_DATA], 'shop_id': 1}
 ADDRESS_DATA = {'city': 'Волгоград', 'address': 'Невская 12', 'floor': 1,
@@ -67,12 +71,17 @@ def create_multiple_orders(address: int, shop: int, card: int,
     'shop_id': shop, 'user_id': user.id, 'order_sum': 11, 'total_price': 11,
     'delivery_price': 11, 'discount': 11}
     order_2 = {'date': datetime.strptime('15.01.2021', '%d.%m.%Y'),
-               'number': 11, 'address_id': address, 'card_id': card,
+               'number': 12, 'address_id': address, 'card_id': card,
                'shop_id': shop, 'user_id': user.id, 'status':
                    OrderStatuses.CANCELED,
                'order_sum': 22, 'total_price': 22, 'delivery_price': 22,
                'discount': 22}
-    dataset = [order_1, order_2]
+    # время дня в ответах отбрасывается, как в schemas.Order
+    order_3 = {'date': datetime(2021, 1, 15, 14, 23, 11), 'number': 13,
+               'address_id': address, 'card_id': card, 'shop_id': shop,
+               'user_id': user.id, 'order_sum': 33, 'total_price': 33,
+               'delivery_price': 33, 'discount': 33}
+    dataset = [order_1, order_2, order_3]
     for data in dataset:
         db.add(Order(**data))
     db.save()
@@ -110,6 +119,22 @@ def test_create_order(delay_mock,user_token):
                                 data=json.dumps(ORDER_DATA))
     assert correct_order.status_code == status.HTTP_201_CREATED
     assert correct_order.json()['order_id'] == 1
+    assert correct_order.json()['number'] > 0
+
+
+def test_create_order_unknown_shop(user_token):
+    """Тест создания заказа в несуществующем магазине."""
+    order = client.post('/api/v1/orders/create',
+                        headers={'Authorization': f'Bearer {user_token}'},
+                        data=json.dumps(dict(ORDER_DATA, shop_id=999999)))
+    assert order.status_code == status.HTTP_400_BAD_REQUEST
+    assert order.json()['error'] == _('shop_not_found')
+    # последовательность номеров для такого магазина не создается
+    db = DataBase()
+    regclass = db.db.execute(text('SELECT to_regclass(:name)'),
+                             {'name': sequence_name(999999)}).scalar()
+    db.close()
+    assert regclass is None
 
 
 def test_detail_order_data(user_token):
@@ -124,7 +149,7 @@ def test_detail_order_data(user_token):
                                    headers={'Authorization': f'Bearer {user_token}'})
     # проверяем ответ сервера
     assert detail_order_data.status_code == status.HTTP_200_OK
-    assert detail_order_data.json()['number'] == ORDER_DATA['number']
+    assert detail_order_data.json()['number'] == order['number']
     assert detail_order_data.json()['order_sum'] == ORDER_DATA['order_sum']
     assert detail_order_data.json()['shop_id'] == ORDER_DATA['shop_id']
 
@@ -162,6 +187,129 @@ def test_get_orders_with_filters(user_token):
     assert len(orders.json()['orders']) == 0
 
 
+def test_get_orders_by_cursor(user_token):
+    """Тест получения списка заказов по курсору."""
+    headers = {'Authorization': f'Bearer {user_token}'}
+    orders = client.get('/internal/v1/orders/?page=1&per_page=100',
+                        headers=headers).json()
+    # проходим все страницы по одному заказу
+    cursor, ids = '', []
+    while cursor is not None:
+        page = client.get(f'/internal/v1/orders/?per_page=1&cursor={cursor}',
+                          headers=headers)
+        assert page.status_code == status.HTTP_200_OK
+        page = page.json()
+        assert len(page['orders']) <= 1
+        ids.extend(order['id'] for order in page['orders'])
+        cursor = page['next_cursor']
+    assert sorted(ids) == sorted(order['id'] for order in orders['orders'])
+    # первая страница с количеством заказов
+    first = client.get('/internal/v1/orders/?cursor=&with_count=true',
+                       headers=headers).json()
+    assert first['count'] == orders['count']
+    assert first['has_orders'] is True
+    # некорректный курсор
+    wrong = client.get('/internal/v1/orders/?cursor=wrong', headers=headers)
+    assert wrong.status_code == status.HTTP_400_BAD_REQUEST
+    assert wrong.json()['error'] == _('invalid_cursor')
+
+
+def test_export_orders(user_token):
+    """Тест потоковой выгрузки заказов в NDJSON и CSV."""
+    headers = {'Authorization': f'Bearer {user_token}'}
+    orders = client.get('/internal/v1/orders/?cursor=&per_page=100',
+                        headers=headers).json()['orders']
+    export = client.get('/internal/v1/orders/export', headers=headers)
+    assert export.status_code == status.HTTP_200_OK
+    assert export.headers['content-type'] == 'application/x-ndjson'
+    exported = [json.loads(line) for line in export.text.splitlines()]
+    # от старых к новым, с теми же полями и товарами, что и в списке
+    assert [order['id'] for order in exported] == \
+        [order['id'] for order in reversed(orders)]
+    for order in orders:
+        order.pop('shop')
+    assert sorted(exported, key=lambda order: order['id']) == \
+        sorted(orders, key=lambda order: order['id'])
+    # фильтр по датам и CSV: строка на товар, заказ без товаров одной строкой
+    export = client.get('/internal/v1/orders/export?format=csv'
+                        '&date_from=01.01.2021&date_to=16.01.2021',
+                        headers=headers)
+    assert export.headers['content-type'].startswith('text/csv')
+    header, *rows = export.text.splitlines()
+    assert header.startswith('order_sum,') and 'item_id' in header
+    assert len(rows) >= 2
+    # дата без времени дня, как в списке и в детальном заказе
+    date_index = header.split(',').index('date')
+    assert all(row.split(',')[date_index].endswith('00:00:00')
+               for row in rows)
+    wrong = client.get('/internal/v1/orders/export?format=xml',
+                       headers=headers)
+    assert wrong.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def get_queries_count(response) -> int:
+    """Количество запросов к БД из заголовка Server-Timing."""
+    timing = response.headers['Server-Timing']
+    return int(re.search(r'desc="(\d+) queries"', timing).group(1))
+
+
+def test_orders_queries_count(user_token):
+    """Тест что количество запросов к БД не зависит от размера страницы."""
+    headers = {'Authorization': f'Bearer {user_token}'}
+    for mode in ('page=1', 'cursor='):
+        small = client.get(f'/internal/v1/orders/?{mode}&per_page=1',
+                           headers=headers)
+        large = client.get(f'/internal/v1/orders/?{mode}&per_page=10',
+                           headers=headers)
+        assert len(large.json()['orders']) > len(small.json()['orders'])
+        assert get_queries_count(small) == get_queries_count(large)
+    order = large.json()['orders'][0]
+    detail = client.get(f'/api/v1/orders/{order["id"]}', headers=headers)
+    # пользователь, версии заказа и магазина, заказ с товарами и магазин
+    assert get_queries_count(detail) == 5
+    # по актуальному ETag заказ не загружается
+    cached = client.get(f'/api/v1/orders/{order["id"]}',
+                        headers={**headers,
+                                 'If-None-Match': detail.headers['ETag']})
+    assert cached.status_code == status.HTTP_304_NOT_MODIFIED
+    assert cached.content == b''
+    assert get_queries_count(cached) == 3
+    # правка магазина меняет ETag заказа
+    client.put(f'/internal/v1/shops/{order["shop_id"]}', headers=headers,
+               data=json.dumps(dict(SHOP_DATA, name='магазин после правки')))
+    updated = client.get(f'/api/v1/orders/{order["id"]}',
+                         headers={**headers,
+                                  'If-None-Match': detail.headers['ETag']})
+    assert updated.status_code == status.HTTP_200_OK
+    assert updated.json()['shop']['name'] == 'магазин после правки'
+
+
+def test_orders_msgpack(user_token):
+    """Тест страницы заказов в MessagePack для внутренних клиентов."""
+    headers = {'Authorization': f'Bearer {user_token}'}
+    url = '/internal/v1/orders/?page=1&per_page=10'
+    packed = client.get(url, headers={**headers,
+                                      'Accept': 'application/msgpack'})
+    assert packed.headers['Content-Type'] == 'application/msgpack'
+    assert 'Accept' in packed.headers['Vary']
+    # клиенты без MessagePack по-прежнему получают JSON
+    plain = client.get(url, headers=headers)
+    assert plain.headers['Content-Type'] == 'application/json'
+    assert msgpack.unpackb(packed.content) == plain.json()
+
+
+def test_orders_list_matches_detail(user_token):
+    """Тест что быстрое чтение списка совпадает со схемой заказа."""
+    headers = {'Authorization': f'Bearer {user_token}'}
+    orders = client.get('/internal/v1/orders/?page=1&per_page=10',
+                        headers=headers).json()['orders']
+    for order in orders:
+        detail = client.get(f'/api/v1/orders/{order["id"]}',
+                            headers=headers).json()
+        detail['items'].sort(key=lambda item: item['id'])
+        assert order == detail
+
+
 def test_update_order(user_token):
     """Тест обновления заказа."""
     data = {"status": "string", "address_id": 1,
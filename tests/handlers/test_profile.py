@@ -55,6 +55,44 @@ def test_update_profile(user_token):
     assert updated_profile['email'] == new_data['email']
 
 
+def test_profile_etag(user_token):
+    """Тест условного получения профиля по ETag."""
+    headers = {'Authorization': f'Bearer {user_token}'}
+    profile = client.get('/internal/v1/profile', headers=headers)
+    etag = profile.headers['ETag']
+    # профиль не менялся
+    cached = client.get('/internal/v1/profile',
+                        headers={**headers, 'If-None-Match': etag})
+    assert cached.status_code == status.HTTP_304_NOT_MODIFIED
+    assert cached.content == b''
+    assert cached.headers['ETag'] == etag
+    # после обновления ETag меняется
+    client.put('/internal/v1/profile/', data=json.dumps({'name': 'etag'}),
+               headers=headers)
+    updated = client.get('/internal/v1/profile',
+                         headers={**headers, 'If-None-Match': etag})
+    assert updated.status_code == status.HTTP_200_OK
+    assert updated.headers['ETag'] != etag
+    assert updated.json()['name'] == 'etag'
+
+
+def test_profile_etag_format(user_token):
+    """Тест что у JSON и MessagePack профиля разные ETag."""
+    headers = {'Authorization': f'Bearer {user_token}'}
+    plain = client.get('/internal/v1/profile', headers=headers)
+    packed = client.get('/internal/v1/profile',
+                        headers={**headers, 'Accept': 'application/msgpack'})
+    assert packed.headers['Content-Type'] == 'application/msgpack'
+    assert packed.headers['ETag'] != plain.headers['ETag']
+    # ETag JSON не подходит для MessagePack
+    revalidated = client.get('/internal/v1/profile',
+                             headers={**headers,
+                                      'Accept': 'application/msgpack',
+                                      'If-None-Match': plain.headers['ETag']})
+    assert revalidated.status_code == status.HTTP_200_OK
+    assert revalidated.headers['ETag'] == packed.headers['ETag']
+
+
 def test_update_with_error(user_token):
     """Тест ошибки при обновлении полей профиля."""
     new_data = {'birthday': '00.123.12412'}
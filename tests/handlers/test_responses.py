@@ -0,0 +1,61 @@
+"""Тесты классов ответов API."""
+import json
+from datetime import date, datetime
+from uuid import uuid4
+
+import msgpack
+
+from api.responses import (MSGPACK, FastJSONResponse, parse_accept,
+                           response_format)
+from common import schemas
+from common.models import OrderStatuses
+
+SHOP = {'id': 1, 'name': 'Магазин', 'site_url': 'https://cool.site.com/',
+        'api_endpoint': '/api', 'is_active': True}
+ITEM = {'id': 1, 'article': 'A-1', 'name': 'Товар', 'price': 100,
+        'shop_id': 1, 'quantity': 2, 'total_price': 200, 'discount': 0}
+
+
+def test_same_as_pydantic_json():
+    """Тест что ответ совпадает с BaseModel.json(), включая json_encoders."""
+    order = schemas.Order(id=1, number=1, order_sum=200, total_price=250,
+                          delivery_price=50, discount=0, shop_id=1,
+                          shop=SHOP, items=[ITEM, ITEM],
+                          date=datetime(2021, 1, 2, 3, 4, 5))
+    user = schemas.User(id=uuid4(), phone='+79999999999', name='Имя',
+                        birthday=date(1990, 1, 2))
+    for model in (order, user):
+        body = FastJSONResponse(model).body
+        assert json.loads(body) == json.loads(model.json())
+
+
+def test_plain_content():
+    """Тест словарей с датами, Enum и UUID без схемы."""
+    user_id = uuid4()
+    body = FastJSONResponse({'day': date(2021, 1, 2), 'user_id': user_id,
+                             'status': OrderStatuses.NEW}).body
+    assert json.loads(body) == {'day': '2021-01-02', 'user_id': str(user_id),
+                                'status': OrderStatuses.NEW.value}
+
+
+def test_parse_accept():
+    """Тест разбора весов заголовка Accept."""
+    assert parse_accept('application/msgpack, application/json;q=0.5') == {
+        'application/msgpack': 1.0, 'application/json': 0.5}
+    assert parse_accept('') == {}
+
+
+def test_msgpack_content():
+    """Тест что MessagePack содержит те же данные, что и JSON."""
+    order = schemas.Order(id=1, number=1, order_sum=200, total_price=250,
+                          delivery_price=50, discount=0, shop_id=1,
+                          shop=SHOP, items=[ITEM],
+                          date=datetime(2021, 1, 2, 3, 4, 5))
+    token = response_format.set(MSGPACK)
+    try:
+        response = FastJSONResponse(order)
+    finally:
+        response_format.reset(token)
+    assert response.media_type == MSGPACK
+    assert response.headers['Vary'] == 'Accept'
+    assert msgpack.unpackb(response.body) == json.loads(order.json())
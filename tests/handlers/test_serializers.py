@@ -0,0 +1,49 @@
+"""Тесты сериализации объектов ORM без валидации."""
+import json
+from datetime import date, datetime
+
+from api.responses import FastJSONResponse
+from common import schemas, serializers
+from common.identifiers import uuid7
+from common.models import Address, Card, Item, Order, Shop, User
+
+
+def make_shop() -> Shop:
+    """Магазин вне сессии."""
+    return Shop(id=1, name='Магазин', site_url='https://cool.site.com/',
+                api_endpoint='/api', is_active=True)
+
+
+def make_order(items: int) -> Order:
+    """Заказ вне сессии с магазином и товарами."""
+    return Order(id=1, number=7, order_sum=200, total_price=250,
+                 delivery_price=50, discount=0, shop_id=1, shop=make_shop(),
+                 date=datetime(2021, 1, 2, 3, 4, 5),
+                 items=[Item(id=idx, article=f'A-{idx}', name='Товар',
+                             price=100, shop_id=1, quantity=2,
+                             total_price=200, discount=0)
+                        for idx in range(items)])
+
+
+CASES = [
+    (serializers.serialize_order, schemas.Order, make_order(3)),
+    (serializers.serialize_order, schemas.Order, make_order(0)),
+    (serializers.serialize_shop, schemas.Shop, make_shop()),
+    (serializers.serialize_address, schemas.Address,
+     Address(id=1, city='Москва', address='Тверская, 1', floor='2',
+             apartment='3', is_default=True, comment=None)),
+    (serializers.serialize_card, schemas.Card,
+     Card(id=1, number='4111111111111111', is_default=False)),
+    (serializers.serialize_user, schemas.User,
+     User(id=uuid7(), phone='+79999999999', name='Имя', lastname='',
+          birthday=date(1990, 1, 2), email=None)),
+    (serializers.serialize_user, schemas.User,
+     User(id=uuid7(), phone='+79999999998', birthday=None)),
+]
+
+
+def test_same_as_from_orm():
+    """Тест что ответ совпадает с from_orm для всех схем чтения."""
+    for serialize, schema, instance in CASES:
+        body = FastJSONResponse(serialize(instance)).body
+        assert json.loads(body) == json.loads(schema.from_orm(instance).json())
@@ -1,4 +1,5 @@
 import json
+from datetime import date
 from functools import lru_cache
 
 import pytest
@@ -6,7 +7,8 @@ from fastapi.testclient import TestClient
 
 from api.app import app, status
 from common.database import DataBase
-from common.models import User
+from common.models import OrderStatuses, ShopDailyStats, User
+from common.rollups import KEY_COLUMNS
 
 client = TestClient(app)
 user_without_access = '+79999999977'
@@ -96,6 +98,30 @@ def test_get_shops(user_token):
     assert len(shops.json()) > 0
 
 
+def test_shop_stats(user_token):
+    """Тест итогов заказов магазина по дням."""
+    shops = client.get('/internal/v1/shops/',
+                       headers={'Authorization': f'Bearer {user_token}'})
+    shop = shops.json()[0]
+    db = DataBase()
+    db.bulk_increment(ShopDailyStats, [
+        {'shop_id': shop['id'], 'day': day, 'status': OrderStatuses.COMPLETED,
+         'orders_count': 2, 'total_price': 300}
+        for day in (date(2021, 1, 1), date(2021, 1, 2))], KEY_COLUMNS)
+    db.save()
+    db.close()
+
+    stats = client.get(f'/internal/v1/shops/{shop["id"]}/stats'
+                       '?date_from=02.01.2021&date_to=02.01.2021',
+                       headers={'Authorization': f'Bearer {user_token}'})
+    assert stats.status_code == status.HTTP_200_OK
+    day = stats.json()[0]
+    assert len(stats.json()) == 1
+    assert day['day'] == '2021-01-02'
+    assert day['status'] == OrderStatuses.COMPLETED.value
+    assert day['orders_count'] >= 2 and day['total_price'] >= 300
+
+
 def test_delete_shop(user_token):
     """Тест удаления магазина."""
     # проверяем что есть магазин для удаления
@@ -0,0 +1,45 @@
+"""Тесты архива заказов."""
+from datetime import datetime, timedelta
+
+from common.archive import archive_orders, restore_orders
+from common.database import DataBase, engine
+from common.models import Item, Order, OrderStatuses, Shop, User
+
+
+def test_archive_and_restore():
+    """Тест переноса заказа в архив, чтения из архива и возврата."""
+    db = DataBase()
+    user, _ = db.get_or_create(User, phone='+79999999904')
+    shop = Shop(name='archive')
+    db.add(shop)
+    db.save()
+    old = datetime.now() - timedelta(days=400)
+    order = Order(number=1, user_id=user.id, shop_id=shop.id, date=old,
+                  status=OrderStatuses.COMPLETED)
+    active = Order(number=2, user_id=user.id, shop_id=shop.id, date=old,
+                   status=OrderStatuses.CREATED)
+    db.add(order)
+    db.add(active)
+    db.save()
+    db.add(Item(order_id=order.id, order_date=old, name='archived', price=10))
+    db.save()
+    order_id, active_id = order.id, active.id
+    db.close()
+
+    assert archive_orders(engine, datetime.now() - timedelta(days=1)) >= 1
+    db = DataBase()
+    user = db.get_by_id(User, phone='+79999999904')
+    assert db.get_by_id(Order, id=order_id) is None
+    # заказ в работе остается на месте
+    assert db.get_by_id(Order, id=active_id) is not None
+    archived = user.get_order(order_id, db, profile='detail')
+    assert archived.shop.name == 'archive'
+    assert [item.name for item in archived.items] == ['archived']
+    db.close()
+
+    assert restore_orders([order_id]) == 1
+    db = DataBase()
+    restored = db.get_by_id(Order, id=order_id)
+    assert restored.status == OrderStatuses.COMPLETED
+    assert [item.name for item in restored.items] == ['archived']
+    db.close()
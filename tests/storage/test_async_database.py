@@ -0,0 +1,66 @@
+"""Тесты асинхронной работы с БД."""
+import asyncio
+
+import pytest
+
+from common.database import AsyncDataBase, get_async_session
+from common.exceptions import NotFoundException
+from common.models import Shop, User
+
+pytest.importorskip('asyncpg')
+
+
+def run(coro):
+    """
+    Запуск корутины в новом цикле событий.
+
+    Соединения asyncpg привязаны к циклу, поэтому пул закрывается до выхода.
+    """
+    async def wrapper():
+        try:
+            await coro
+        finally:
+            await get_async_session().kw['bind'].dispose()
+    asyncio.run(wrapper())
+
+
+async def _create_and_fetch_shop():
+    """Создание, получение и удаление магазина через AsyncDataBase."""
+    db = AsyncDataBase()
+    try:
+        shop, created = await db.get_or_create(Shop, name='async-магазин',
+                                               site_url='https://async.ru/')
+        assert created
+        same, created = await db.get_or_create(Shop, name='async-магазин',
+                                               site_url='https://async.ru/')
+        assert not created
+        assert same.id == shop.id
+        assert (await Shop.get_async(shop.id, db)).name == 'async-магазин'
+        await db.delete(Shop, shop)
+        with pytest.raises(NotFoundException):
+            await Shop.get_async(shop.id, db)
+    finally:
+        await db.close()
+
+
+async def _user_defaults():
+    """Получение дефолтных адреса и карты нового пользователя."""
+    db = AsyncDataBase()
+    try:
+        user, _ = await db.get_or_create(User, phone='+79999999911')
+        with pytest.raises(NotFoundException):
+            await user.get_default_address_async(db)
+        with pytest.raises(NotFoundException):
+            await user.get_default_card_async(db)
+    finally:
+        await db.close()
+
+
+def test_async_get_or_create():
+    """Тест основных операций асинхронного API."""
+    run(_create_and_fetch_shop())
+
+
+def test_async_user_defaults():
+    """Тест асинхронных помощников модели пользователя."""
+    run(_user_defaults())
@@ -0,0 +1,128 @@
+"""Тесты пакетных операций с БД."""
+from unittest.mock import patch
+
+from common.database import DataBase
+from common.models import ArchivedOrder, Item, Shop, User
+from common.settings import settings
+
+SHOPS = [{'name': f'bulk-{idx}', 'site_url': '', 'api_endpoint': None}
+         for idx in range(5)]
+
+
+def test_bulk_insert_and_copy():
+    """Тест вставки через INSERT и через COPY дают одинаковый результат."""
+    db = DataBase()
+    ids = db.bulk_insert(Shop, SHOPS)
+    with patch.object(settings, 'db_copy_threshold', 1):
+        copy_ids = db.bulk_insert(Shop, SHOPS)
+    db.save()
+    assert len(ids) == len(copy_ids) == len(SHOPS)
+    for idx, copy_idx in zip(ids, copy_ids):
+        shop, copied = Shop.get(idx, db), Shop.get(copy_idx, db)
+        assert (shop.name, shop.site_url, shop.api_endpoint, shop.is_active) \
+            == (copied.name, copied.site_url, copied.api_endpoint,
+                copied.is_active)
+        # пустая строка и NULL различаются
+        assert copied.site_url == '' and copied.api_endpoint is None
+    db.close()
+
+
+def test_bulk_update():
+    """Тест обновления пачки строк одним запросом."""
+    db = DataBase()
+    ids = db.bulk_insert(Shop, SHOPS)
+    shop = Shop.get(ids[0], db)
+    updated = db.bulk_update(Shop, {'is_active': False}, Shop.id.in_(ids))
+    db.save()
+    assert sorted(updated) == sorted(ids)
+    # объект в сессии не остался с устаревшим значением
+    assert shop.is_active is False
+    db.close()
+
+
+def test_update_returning():
+    """Тест обновления строки с ответом из RETURNING."""
+    db = DataBase()
+    ids = db.bulk_insert(Shop, SHOPS[:1])
+    shop = Shop.get(ids[0], db)
+    row = db.update_returning(Shop, {'name': 'returning'}, ['id', 'name'],
+                              Shop.id == ids[0])
+    db.save()
+    assert row._asdict() == {'id': ids[0], 'name': 'returning'}
+    assert shop.name == 'returning'
+    # строка не подходит под условия - ничего не обновляется
+    assert db.update_returning(Shop, {'name': 'other'}, ['id'],
+                               Shop.id == ids[0], Shop.is_active.is_(False)
+                               ) is None
+    db.close()
+
+
+def test_bulk_get_or_create():
+    """Тест пакетного get_or_create."""
+    db = DataBase()
+    rows = [{'name': 'bulk-goc-1', 'site_url': 'a'},
+            {'name': 'bulk-goc-2', 'site_url': 'b'}]
+    first = db.bulk_get_or_create(Shop, rows)
+    db.save()
+    assert [created for _, created in first] == [True, True]
+    rows.append({'name': 'bulk-goc-3', 'site_url': 'c'})
+    second = db.bulk_get_or_create(Shop, rows)
+    db.save()
+    assert [created for _, created in second] == [False, False, True]
+    assert [shop.id for shop, _ in second[:2]] == \
+        [shop.id for shop, _ in first]
+    db.close()
+
+
+def test_bulk_get_or_create_nulls():
+    """Тест что NULL в ключе совпадает, а типы приводит БД."""
+    db = DataBase()
+    # цена строкой, в БД она станет числом; скидки нет
+    rows = [{'name': 'bulk-null', 'price': '10', 'discount': None},
+            {'name': 'bulk-null', 'price': 20, 'discount': None}]
+    first = db.bulk_get_or_create(Item, rows)
+    db.save()
+    assert [created for _, created in first] == [True, True]
+    assert first[0][0].price == 10
+    # повтор задачи не создает товары заново
+    second = db.bulk_get_or_create(Item, rows + rows[:1])
+    db.save()
+    assert [created for _, created in second] == [False, False, False]
+    assert [item.id for item, _ in second] == \
+        [item.id for item, _ in first] + [first[0][0].id]
+    db.close()
+
+
+def test_bulk_get_or_create_returning_order():
+    """Тест что новые строки сопоставляются не по порядку RETURNING."""
+    db = DataBase()
+    rows = [{'name': f'bulk-order-{idx}', 'site_url': str(idx)}
+            for idx in range(3)]
+    bulk_insert = db.bulk_insert
+    with patch.object(db, 'bulk_insert',
+                      lambda *args: bulk_insert(*args)[::-1]):
+        result = db.bulk_get_or_create(Shop, rows)
+    db.save()
+    assert [shop.name for shop, _ in result] == [row['name'] for row in rows]
+    db.close()
+
+
+def test_copy_fallback():
+    """Тест что таблицы без последовательности id вставляются через INSERT."""
+    db = DataBase()
+    with patch.object(settings, 'db_copy_threshold', 1):
+        user_ids = db.bulk_insert(User, [{'phone': '+79999999906'}])
+        archived_ids = db.bulk_insert(ArchivedOrder, [
+            {'id': 10 ** 9, 'items': [{'name': 'товар', 'price': 1}]}])
+    db.save()
+    assert User.get(user_ids[0], db).phone == '+79999999906'
+    assert ArchivedOrder.get(archived_ids[0], db).items == [
+        {'name': 'товар', 'price': 1}]
+    db.close()
+
+
+def test_copy_json_value():
+    """Тест что JSON через COPY записывается как JSON, а не repr."""
+    assert DataBase._copy_value({'a': [1, None]}, is_json=True) == \
+        '{"a": [1, null]}'
+    assert DataBase._copy_value(None, is_json=True) == r'\N'
@@ -0,0 +1,32 @@
+"""Тесты указателей на адрес и карту по умолчанию."""
+from common.database import DataBase
+from common.models import Address, Card, User
+
+
+def test_default_pointers():
+    """Тест смены адреса и карты по умолчанию и удаления адреса."""
+    db = DataBase()
+    user, _ = db.get_or_create(User, phone='+79999999901')
+    first = Address(city='Москва', user=user)
+    user.set_default_address(first, db)
+    card = Card(number='1111', user=user)
+    user.set_default_card(card, db)
+    db.add(first)
+    db.add(card)
+    db.save()
+    assert user.default_address_id == first.id
+    assert user.get_default_card().id == card.id
+
+    second = Address(city='Казань', user=user)
+    user.set_default_address(second, db)
+    db.add(second)
+    db.save()
+    db.refresh(first)
+    assert user.get_default_address().id == second.id
+    assert first.is_default is False and second.is_default is True
+
+    # удаление адреса по умолчанию сбрасывает указатель
+    db.delete(Address, second)
+    db.refresh(user)
+    assert user.default_address_id is None
+    db.close()
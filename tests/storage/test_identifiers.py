@@ -0,0 +1,20 @@
+"""Тесты генерации идентификаторов."""
+from common.database import DataBase
+from common.identifiers import uuid7
+from common.models import User
+
+
+def test_uuid7_ordered():
+    """Тест что ключи упорядочены по времени и имеют версию 7."""
+    ids = [uuid7() for _ in range(1000)]
+    assert len(set(ids)) == len(ids)
+    assert all(idx.version == 7 for idx in ids)
+    assert ids[0].bytes < ids[-1].bytes
+
+
+def test_user_id_uuid7():
+    """Тест что новый пользователь получает упорядоченный ключ."""
+    db = DataBase()
+    user, _ = db.get_or_create(User, phone='+79999999902')
+    assert user.id.version == 7
+    db.close()
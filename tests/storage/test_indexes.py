@@ -0,0 +1,112 @@
+"""Тесты использования индексов горячими запросами."""
+from datetime import datetime, timedelta
+from functools import partial
+
+import pytest
+from sqlalchemy import text
+
+from common.database import DataBase, SessionLocal, engine
+from common.models import ActiveTokens, Address, Card, Item, Order, User
+
+# запросы в том виде, в котором их строят обработчики и модели
+HOT_QUERIES = {
+    'ix_orders_user_id_date':
+        'SELECT * FROM orders WHERE user_id = :user_id '
+        'AND date >= :date_from AND date <= :date_to '
+        'ORDER BY date DESC, id DESC LIMIT 10',
+    'ix_items_order_id':
+        'SELECT * FROM items WHERE order_id = :order_id',
+    'ix_addresses_user_id_live':
+        'SELECT * FROM addresses WHERE user_id = :user_id '
+        'AND deleted_at IS NULL',
+    'ix_addresses_user_id_default':
+        'SELECT * FROM addresses WHERE user_id = :user_id '
+        'AND is_default = true AND deleted_at IS NULL',
+    'ix_cards_user_id_default':
+        'SELECT * FROM cards WHERE user_id = :user_id AND is_default = true '
+        'AND deleted_at IS NULL',
+    'ix_active_tokens_refresh_id':
+        'SELECT * FROM active_tokens WHERE refresh_id = :refresh_id '
+        'AND user_id = :user_id',
+    'ix_active_tokens_user_id_refresh_expired':
+        'SELECT * FROM active_tokens WHERE user_id = :user_id '
+        'AND refresh_expired_date > :timestamp',
+    'ix_active_tokens_refresh_expired_date':
+        'SELECT id FROM active_tokens WHERE refresh_expired_date < :timestamp '
+        'LIMIT 1000',
+    'ix_orders_date_brin':
+        'SELECT count(*) FROM orders WHERE date >= :date_from '
+        'AND date <= :date_to',
+}
+# на запрос по диапазону дат подходит и BRIN, и ix_orders_user_id_date,
+# какой из них выберет планировщик, зависит от статистики
+ANY_INDEX = {'ix_orders_date_brin'}
+
+
+@pytest.fixture(scope='module')
+def seeded_db():
+    """
+    Пользователь с историей заказов, адресами, картами и сессиями.
+
+    Данные создаются в транзакции, которая откатывается после тестов модуля.
+    """
+    connection = engine.connect()
+    transaction = connection.begin()
+    db = DataBase(partial(SessionLocal, bind=connection))
+    user, _ = db.get_or_create(User, phone='+79999999900')
+    now = datetime.now()
+    order_ids = db.bulk_insert(Order, [
+        {'user_id': user.id, 'number': idx, 'date': now - timedelta(days=idx)}
+        for idx in range(500)])
+    db.bulk_insert(Item, [{'order_id': idx, 'name': 'item'}
+                          for idx in order_ids])
+    db.bulk_insert(Address, [{'user_id': user.id, 'is_default': idx == 0}
+                             for idx in range(50)])
+    db.bulk_insert(Card, [{'user_id': user.id, 'is_default': idx == 0}
+                          for idx in range(50)])
+    db.bulk_insert(ActiveTokens, [
+        {'user_id': user.id, 'refresh_id': f'refresh-{idx}',
+         'refresh_expired_date': int(now.timestamp()) + idx}
+        for idx in range(500)])
+    db.db.execute(text('ANALYZE orders, items, addresses, cards, '
+                       'active_tokens'))
+    # без подходящего индекса планировщику останется только seq scan
+    db.db.execute(text('SET LOCAL enable_seqscan = off'))
+    params = {'user_id': str(user.id), 'order_id': order_ids[0],
+              'refresh_id': 'refresh-1',
+              'timestamp': int(now.timestamp()),
+              'date_from': now - timedelta(days=30), 'date_to': now}
+    yield db, params
+    db.close()
+    transaction.rollback()
+    connection.close()
+
+
+def get_used_indexes(plan: dict) -> set:
+    """Все индексы из плана запроса."""
+    indexes = {plan['Index Name']} if 'Index Name' in plan else set()
+    for child in plan.get('Plans', []):
+        indexes |= get_used_indexes(child)
+    return indexes
+
+
+def get_node_types(plan: dict) -> set:
+    """Все типы узлов плана запроса."""
+    types = {plan['Node Type']}
+    for child in plan.get('Plans', []):
+        types |= get_node_types(child)
+    return types
+
+
+@pytest.mark.parametrize('index_name', HOT_QUERIES)
+def test_hot_query_uses_index(seeded_db, index_name):
+    """Тест что запрос может быть выполнен по своему индексу."""
+    db, params = seeded_db
+    plan = db.db.execute(
+        text(f'EXPLAIN (FORMAT JSON) {HOT_QUERIES[index_name]}'),
+        params).scalar()[0]['Plan']
+    if index_name in ANY_INDEX:
+        assert get_used_indexes(plan)
+        assert 'Seq Scan' not in get_node_types(plan)
+    else:
+        assert index_name in get_used_indexes(plan)
@@ -0,0 +1,19 @@
+"""Тесты выдачи номеров заказов."""
+from common.database import DataBase
+from common.models import Shop
+from common.numbering import OrderNumberAllocator
+
+
+def test_order_numbers_blocks():
+    """Тест что процессы получают разные блоки номеров магазина."""
+    db = DataBase()
+    shop_id, = db.bulk_insert(Shop, [{'name': 'numbering'}])
+    db.save()
+    db.close()
+    first, second = OrderNumberAllocator(block_size=3), \
+        OrderNumberAllocator(block_size=3)
+    numbers = [first.allocate(shop_id) for _ in range(4)]
+    numbers += [second.allocate(shop_id) for _ in range(4)]
+    assert len(set(numbers)) == len(numbers)
+    # внутри блока номера идут подряд
+    assert numbers[1] == numbers[0] + 1 and numbers[2] == numbers[0] + 2
@@ -0,0 +1,87 @@
+"""Тесты секционирования заказов."""
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from common.database import engine
+from common.partitioning import (add_months, convert_to_partitioned,
+                                 convert_to_plain, ensure_partitions,
+                                 is_partitioned, partition_name)
+
+COUNT_SQL = text('SELECT (SELECT count(*) FROM orders), '
+                 '(SELECT count(*) FROM items)')
+FOREIGN_KEYS_SQL = text(
+    "SELECT conname FROM pg_constraint WHERE contype = 'f' "
+    "AND conrelid = 'items'::regclass AND confrelid = 'orders'::regclass")
+
+
+def test_add_months():
+    """Тест перехода границ месяцев и годов."""
+    assert add_months(date(2021, 1, 15), 0) == date(2021, 1, 1)
+    assert add_months(date(2021, 11, 30), 1) == date(2021, 12, 1)
+    assert add_months(date(2021, 12, 31), 1) == date(2022, 1, 1)
+    assert add_months(date(2021, 3, 1), 25) == date(2023, 4, 1)
+
+
+def test_partition_name():
+    """Тест имени месячной секции."""
+    assert partition_name('orders', date(2021, 2, 1)) == 'orders_2021_02'
+
+
+def add_order(connection, day) -> int:
+    """Заказ с одним товаром в том же месяце."""
+    order_id = connection.execute(text(
+        'INSERT INTO orders (number, date) VALUES (1, :day) RETURNING id'),
+        {'day': day}).scalar()
+    connection.execute(text(
+        "INSERT INTO items (name, order_id, order_date) "
+        "VALUES ('товар', :order_id, :day)"),
+        {'order_id': order_id, 'day': day})
+    return order_id
+
+
+def test_convert_round_trip():
+    """Тест переноса в секции и обратно с сохранением строк и ссылок."""
+    today = datetime.now()
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            # чужие сессии не должны подвесить тест на ALTER TABLE
+            connection.execute(text("SET LOCAL lock_timeout = '5s'"))
+            add_order(connection, today)
+            add_order(connection, None)
+            counts = connection.execute(COUNT_SQL).one()
+
+            convert_to_partitioned(connection)
+            assert is_partitioned(connection)
+            assert connection.execute(COUNT_SQL).one() == counts
+            assert connection.execute(FOREIGN_KEYS_SQL).scalars().all() == [
+                'items_order_id_order_date_fkey']
+            # заказ без даты лежит в секции DEFAULT, остальные по месяцам
+            assert connection.execute(text(
+                'SELECT count(*) FROM orders_default')).scalar() >= 1
+            assert connection.execute(text(
+                f'SELECT count(*) FROM {partition_name("orders", today)}'
+            )).scalar() >= 1
+            # повторный запуск не падает на существующих секциях
+            ensure_partitions(connection)
+            with pytest.raises(IntegrityError):
+                with connection.begin_nested():
+                    connection.execute(text(
+                        "INSERT INTO items (name, order_id, order_date) "
+                        "VALUES ('товар', -1, now())"))
+
+            convert_to_plain(connection)
+            assert not is_partitioned(connection)
+            assert connection.execute(COUNT_SQL).one() == counts
+            assert connection.execute(FOREIGN_KEYS_SQL).scalars().all() == [
+                'items_order_id_fkey']
+            with pytest.raises(IntegrityError):
+                with connection.begin_nested():
+                    connection.execute(text(
+                        "INSERT INTO items (name, order_id) "
+                        "VALUES ('товар', -1)"))
+        finally:
+            transaction.rollback()
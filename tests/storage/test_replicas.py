@@ -0,0 +1,77 @@
+"""Тесты маршрутизации чтения на реплики."""
+from unittest.mock import patch
+
+from sqlalchemy import text
+
+from common import database
+from common.database import (DataBase, REPLICA_LAG_SQL, ReplicaSet,
+                             SQLALCHEMY_DATABASE_URL, engine)
+from common.models import Shop
+
+# мастер тоже отвечает на запрос отставания, поэтому подходит как реплика
+REPLICA_URLS = [SQLALCHEMY_DATABASE_URL, SQLALCHEMY_DATABASE_URL]
+
+
+def test_round_robin_balance():
+    """Тест выбора реплик по кругу."""
+    replicas = ReplicaSet(REPLICA_URLS)
+    first, second = replicas.choose(), replicas.choose()
+    assert first is not second
+    assert replicas.choose() is first
+
+
+def test_lagging_replicas_fallback():
+    """Тест отказа от реплик с большим отставанием."""
+    replicas = ReplicaSet(REPLICA_URLS, max_lag=-1)
+    assert replicas.choose() is None
+
+
+def stub_replica(connection, replay_lsn: str):
+    """
+    Функции реплики, получившей WAL до 0/100 и применившей его до replay_lsn.
+
+    Последняя примененная транзакция была час назад.
+    """
+    connection.execute(text('CREATE SCHEMA replica_stub'))
+    functions = (
+        ('pg_last_wal_receive_lsn', 'pg_lsn', "'0/100'"),
+        ('pg_last_wal_replay_lsn', 'pg_lsn', f"'{replay_lsn}'"),
+        ('pg_last_xact_replay_timestamp', 'timestamptz',
+         "now() - interval '1 hour'"))
+    for name, result_type, result in functions:
+        connection.execute(text(
+            f'CREATE FUNCTION replica_stub.{name}() RETURNS {result_type} '
+            f'AS $$ SELECT ({result})::{result_type} $$ LANGUAGE sql'))
+    # функции схемы из search_path перекрывают pg_catalog, указанный после
+    connection.execute(text(
+        'SET LOCAL search_path = replica_stub, pg_catalog, public'))
+
+
+def test_idle_primary_lag():
+    """Тест что реплика без новых записей на мастере не считается отстающей."""
+    for replay_lsn, expected in (('0/100', 0), ('0/50', 3600)):
+        with engine.connect() as connection:
+            transaction = connection.begin()
+            try:
+                stub_replica(connection, replay_lsn)
+                lag = float(connection.execute(REPLICA_LAG_SQL).scalar())
+            finally:
+                transaction.rollback()
+        assert abs(lag - expected) < 60
+
+
+def test_read_only_session_routing():
+    """Тест чтения из реплики до коммита и из мастера после."""
+    replicas = ReplicaSet(REPLICA_URLS[:1])
+    with patch.object(database, 'replicas', replicas):
+        db = DataBase(read_only=True)
+        db.get_all_objects(Shop)
+        assert db.db.info['replica'] is replicas.engines[0]
+        db.save()
+        assert db.db.get_bind(clause=None) is engine
+        db.close()
+
+        db = DataBase()
+        db.get_all_objects(Shop)
+        assert 'replica' not in db.db.info
+        db.close()
@@ -0,0 +1,45 @@
+"""Тесты дневных итогов заказов магазинов."""
+from datetime import datetime
+
+from common import rollups
+from common.database import DataBase, engine
+from common.models import Order, OrderStatuses, Shop, User
+
+
+def get_stats(db: DataBase, shop_id: int) -> dict:
+    """Итоги магазина по статусам."""
+    return {row.status: row
+            for row in db.select_rows(rollups.shop_stats(shop_id))}
+
+
+def test_incremental_and_rebuild():
+    """Тест что итоги меняются вместе со статусом и совпадают с пересчетом."""
+    db = DataBase()
+    user, _ = db.get_or_create(User, phone='+79999999905')
+    shop = Shop(name='rollups')
+    db.add(shop)
+    db.save()
+    orders = [Order(number=idx, user_id=user.id, shop_id=shop.id,
+                    date=datetime.now(), status=OrderStatuses.NEW,
+                    total_price=100, order_sum=90, delivery_price=15,
+                    discount=5) for idx in range(3)]
+    for order in orders:
+        db.add(order)
+        rollups.add_order(db, order)
+    db.save()
+    orders[0].status = OrderStatuses.CREATED
+    rollups.move_order(db, orders[0], OrderStatuses.NEW)
+    orders[1].status = OrderStatuses.CANCELED
+    rollups.move_order(db, orders[1], OrderStatuses.NEW)
+    db.save()
+
+    stats = get_stats(db, shop.id)
+    assert {status: row.orders_count for status, row in stats.items()} == {
+        OrderStatuses.NEW: 1, OrderStatuses.CREATED: 1,
+        OrderStatuses.CANCELED: 1}
+    assert stats[OrderStatuses.CANCELED].total_price == 100
+    assert stats[OrderStatuses.CANCELED].order_sum == 90
+
+    rollups.rebuild(engine, shop.id)
+    assert get_stats(db, shop.id) == stats
+    db.close()
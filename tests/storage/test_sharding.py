@@ -0,0 +1,109 @@
+"""Тесты маршрутизации по шардам."""
+from contextlib import contextmanager
+from operator import attrgetter
+from unittest.mock import patch
+
+from alembic import command
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import func, inspect, select, text
+
+from common.database import SHARD_ID_STEP, DataBase, ShardSet, engine, shards
+from common.models import ORDER_VERSION, Item, Order, Shop, ShopDailyStats
+from common.sharding import conflict_target, create_shard_tables
+
+
+def test_shard_candidates():
+    """Тест что строка ищется сначала в шарде, где она создана."""
+    shard_set = ShardSet([])
+    shard_set.engines = [engine, engine, engine]
+    assert shard_set.candidates(5) == [0, 1, 2]
+    assert shard_set.candidates(2 * SHARD_ID_STEP + 1) == [2, 0, 1]
+    assert shard_set.candidates(10 * SHARD_ID_STEP) == [2, 0, 1]
+    assert shard_set.is_sharded(Order.__mapper__, None)
+    assert not shard_set.is_sharded(None, select(Shop.__table__.c.id))
+
+
+def test_scatter_rows():
+    """Тест слияния упорядоченных результатов шардов."""
+    db = DataBase()
+    ids = db.bulk_insert(Shop, [{'name': f'shard-{idx}'} for idx in range(3)])
+    db.save()
+    # оба шарда указывают на одну базу, каждая строка приходит дважды
+    with patch.object(shards, 'engines', [engine, engine]):
+        rows = db.scatter_rows(
+            select(Shop.__table__.c.id).where(Shop.id.in_(ids))
+            .order_by(Shop.id.desc()), key=attrgetter('id'), reverse=True)
+        count = db.scatter_count(
+            select(func.count()).select_from(Shop.__table__)
+            .where(Shop.id.in_(ids)))
+    assert [row.id for row in rows] == sorted(ids * 2, reverse=True)
+    assert count == 2 * len(ids)
+    db.close()
+
+
+def test_conflict_target():
+    """Тест ключа повторного копирования для обычных и секционированных."""
+    orders, items = Order.__table__, Item.__table__
+    with engine.connect() as connection:
+        with patch('common.sharding.is_partitioned', return_value=False):
+            assert conflict_target(connection, orders) == [orders.c.id]
+        with patch('common.sharding.is_partitioned', return_value=True):
+            assert conflict_target(connection, orders) == [orders.c.id,
+                                                           orders.c.date]
+            assert conflict_target(connection, items) == [
+                items.c.id, items.c.order_date]
+            # таблицы вне секционирования копируются по первичному ключу
+            stats = ShopDailyStats.__table__
+            assert conflict_target(connection, stats) == list(
+                stats.primary_key.columns)
+
+
+@contextmanager
+def shard_schema():
+    """Соединение с пустой схемой шарда в транзакции, которая откатывается."""
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            connection.execute(text('CREATE SCHEMA test_shard'))
+            connection.execute(text('SET LOCAL search_path = test_shard'))
+            yield connection
+        finally:
+            transaction.rollback()
+
+
+def migrate_shard(connection) -> bool:
+    """Миграция схемы как шарда 1, True если шард на последней ревизии."""
+    config = Config('alembic.ini')
+    config.attributes.update(connection=connection, shard=1,
+                             configure_logger=False)
+    command.upgrade(config, 'heads')
+    heads = MigrationContext.configure(connection).get_current_heads()
+    return set(heads) == set(ScriptDirectory.from_config(config).get_heads())
+
+
+def test_migrate_new_shard():
+    """Тест что пустой шард создается из моделей при миграции."""
+    with shard_schema() as connection:
+        assert migrate_shard(connection)
+        assert inspect(connection).has_table('shop_daily_stats')
+        assert connection.execute(text(
+            "SELECT nextval(pg_get_serial_sequence('orders', 'id'))"
+        )).scalar() == SHARD_ID_STEP + 1
+        # повторная миграция ничего не меняет
+        assert migrate_shard(connection)
+
+
+def test_migrate_shard_before_row_versions():
+    """Тест миграции шарда, созданного init до версий строк."""
+    with shard_schema() as connection:
+        # такой шард: таблицы без version и без alembic_version
+        create_shard_tables(connection, 1)
+        for table in ('orders', 'orders_archive'):
+            connection.execute(text(
+                f'ALTER TABLE {table} DROP COLUMN version'))
+        assert migrate_shard(connection)
+        assert connection.execute(
+            ORDER_VERSION, {'user_id': None, 'order_id': 0}).all() == []
+        assert connection.execute(select(Order)).all() == []
@@ -0,0 +1,37 @@
+"""Тесты мягкого удаления адресов, карт и магазинов."""
+from common.database import DataBase
+from common.models import ADDRESS_BY_ID, Address, Order, Shop, User
+
+
+def test_soft_delete_hides_rows():
+    """Тест что удаленные строки скрыты из запросов, но не из заказов."""
+    db = DataBase()
+    user, _ = db.get_or_create(User, phone='+79999999903')
+    address = Address(city='Москва', user=user)
+    shop = Shop(name='soft delete')
+    db.add(address)
+    db.add(shop)
+    db.save()
+    order = Order(number=1, user_id=user.id, shop_id=shop.id,
+                  address_id=address.id)
+    db.add(order)
+    db.save()
+    address_id, shop_id, order_id = address.id, shop.id, order.id
+    db.soft_delete(Address, address)
+    db.soft_delete(Shop, shop)
+    db.close()
+
+    db = DataBase()
+    user = db.get_by_id(User, phone='+79999999903')
+    assert user.addresses.filter(Address.id == address_id).first() is None
+    assert db.get_by_id(Shop, id=shop_id) is None
+    # в заранее построенных запросах условие добавлено при построении
+    assert db.get_one(ADDRESS_BY_ID, address_id=address_id) is None
+    # старые заказы по-прежнему видят удаленный адрес и магазин
+    order = db.get_by_id(Order, id=order_id)
+    assert order.address.id == address_id
+    assert order.shop.deleted_at is not None
+    deleted = db.db.query(Shop).filter(Shop.id == shop_id).execution_options(
+        include_deleted=True).one()
+    assert deleted.deleted_at is not None
+    db.close()
@@ -2,15 +2,27 @@
 from datetime import datetime
 
 from celery import Celery
+from celery.schedules import crontab
+from celery.signals import worker_process_init
 
-from common.database import DataBase
+from common import retention, rollups
+from common.archive import archive_orders as archive_shard_orders
+from common.database import session_scope, shards
 from common.models import Order, OrderStatuses, Item, User
+from common.partitioning import ensure_partitions, is_partitioned
 from common.settings import settings
 
 REDIS_URL = f'redis://{settings.redis_host}:{settings.redis_port}/0'
 app = Celery('tasks', broker=REDIS_URL, backend=REDIS_URL)
 
 
+@worker_process_init.connect
+def reset_db_pool(**kwargs):
+    """Соединения родительского процесса не переиспользуются после fork."""
+    for bind in shards.engines:
+        bind.dispose()
+
+
 @app.task
 def create_order(data):
     """
@@ -20,43 +32,51 @@ def create_order(data):
 
     Создается заказ и отложенная задача на обработку заказа, для оплаты и т.д.
     """
-    db = DataBase()
-    item_data = data['items']  # список из словарей с товарами
-    del data['items']
-    user = User.get(data['user_id'])
-    data['address_id'] = user.get_default_address().id
-    data['card_id'] = user.get_default_card().id
-    data['date'] = datetime.now()
-    order = Order.get(data['id'])
-    del data['id']
-    for key, val in data.items():
-        setattr(order, key, val)
-
-    for item in item_data:
-        item.update(order_id=order.id,
-                    shop_id=order.shop_id)
-        db.get_or_create(Item, **item)
-    process_order.apply_async((order.id,), countdown=settings.process_timeout)
+    with session_scope() as db:
+        item_data = data['items']  # список из словарей с товарами
+        del data['items']
+        user = User.get(data['user_id'], db)
+        db.use_shard(shards.get(data['shop_id']))
+        data['address_id'] = user.get_default_address().id
+        data['card_id'] = user.get_default_card().id
+        data['date'] = datetime.now()
+        order = Order.get(data.pop('id'), db)
+        order_id = order.id
+        for key, val in data.items():
+            setattr(order, key, val)
+        rollups.add_order(db, order)
+
+        for item in item_data:
+            item.update(order_id=order_id,
+                        order_date=order.date,
+                        shop_id=order.shop_id)
+        db.bulk_get_or_create(Item, item_data)
+        db.save()
+    process_order.apply_async((order_id,), countdown=settings.process_timeout)
 
 
 @app.task
 def update_order(order_id, data):
     """Задача обновление заказа."""
-    db = DataBase()
-    order = Order.get(order_id)
-    order.address_id = data['address_id']
-    order.card_id = data['card_id']
-    db.save()
+    with session_scope() as db:
+        db.use_shard_of(Order, order_id)
+        order = Order.get(order_id, db)
+        order.address_id = data['address_id']
+        order.card_id = data['card_id']
+        db.save()
 
 
 @app.task
 def process_order(order_id):
     """Задача оплаты заказа и передачи в магазин информации."""
-    order = Order.get(order_id)
-    if order.status == OrderStatuses.NEW.value:
-        # todo тут процесс оплаты с ожиданием
-        order.status = OrderStatuses.CREATED.value
-        DataBase().save()
+    with session_scope() as db:
+        db.use_shard_of(Order, order_id)
+        order = Order.get(order_id, db)
+        if order.status == OrderStatuses.NEW:
+            # todo тут процесс оплаты с ожиданием
+            order.status = OrderStatuses.CREATED
+            rollups.move_order(db, order, OrderStatuses.NEW)
+            db.save()
 
 
 @app.task
@@ -72,7 +92,42 @@ def cancel_order(order_id):
 
     Переводит статус заказа в шлюзе и в магазине, снимает холд с карты.
     """
-    order = Order.get(order_id)
-    if order.status == OrderStatuses.NEW.value:
-        order.status = OrderStatuses.CANCELED.value
-        DataBase().save()
+    with session_scope() as db:
+        db.use_shard_of(Order, order_id)
+        order = Order.get(order_id, db)
+        if order.status == OrderStatuses.NEW:
+            order.status = OrderStatuses.CANCELED
+            rollups.move_order(db, order, OrderStatuses.NEW)
+            db.save()
+
+
+@app.task
+def create_order_partitions():
+    """Создание секций заказов на ближайшие месяцы во всех шардах."""
+    for bind in shards.engines:
+        with bind.begin() as connection:
+            if is_partitioned(connection):
+                ensure_partitions(connection)
+
+
+@app.task
+def archive_orders():
+    """Перенос старых завершенных и отмененных заказов в архив."""
+    for bind in shards.engines:
+        archive_shard_orders(bind)
+
+
+@app.task
+def purge_expired_sessions():
+    """Удаление сессий с истекшим refresh токеном."""
+    return retention.run()
+
+
+app.conf.beat_schedule = {
+    'create-order-partitions': {'task': create_order_partitions.name,
+                                'schedule': crontab(hour=3, minute=0)},
+    'archive-orders': {'task': archive_orders.name,
+                       'schedule': crontab(hour=4, minute=0)},
+    'purge-expired-sessions': {'task': purge_expired_sessions.name,
+                               'schedule': crontab(minute=30)},
+}